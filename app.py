@@ -5,17 +5,386 @@ Main application file for the Defect Analysis Streamlit Dashboard.
 This script acts as the main entry point and orchestrates the UI and logic.
 """
 
+import datetime
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
 import streamlit as st
 import plotly.graph_objects as go
 import pandas as pd
 
 # Import our modularized functions
-from src.data_handler import load_data
+from src.data_handler import (
+    parse_data, get_projected_frame, get_memory_report, get_defect_cube, get_cache_stats, get_live_feed, load_live,
+    get_history_store, get_defect_clusters, get_unit_counts, get_cell_index
+)
 from src.plotting import (
     create_grid_shapes, create_defect_traces,
-    create_pareto_trace, create_grouped_pareto_trace
+    create_pareto_trace, create_grouped_pareto_trace, create_trend_traces, create_unit_heatmap, create_cluster_overlay,
+    figure_payload_bytes, figure_data_bytes
+)
+from src.reporting import generate_excel_report, write_report_file, prune_report_files
+from src.static_maps import render_map_images
+from src.config import (
+    RENDER_POINT_THRESHOLD, IMAGE_DIR, PERF_LOG_PATH, LIVE_SOURCE, LIVE_POLL_SECONDS, TREND_DEFAULT_DAYS,
+    CLUSTER_MIN_DEFECTS, CLUSTER_CELL_SIZE, CLUSTER_OVERLAY_MAX, FIGURE_CACHE_ENTRIES, FIGURE_CACHE_MAX_BYTES,
+    WARMUP_WORKERS, WARMUP_POLL_SECONDS, REPORT_SPILL_ROWS, REPORT_DIR, REPORT_FILES_KEPT
 )
-from src.reporting import generate_excel_report
+from src.cache import LRUCache
+from src.image_store import DefectImageIndex, load_thumbnail
+from src.pipeline import plot_to_unit
+from src.instrumentation import start_run, end_run, span, count, record, is_recording, export_jsonl
+from src.warmup import WarmupJob
+
+# --- THEME COLORS: Centralized for a perfect match with the Colab version ---
+APP_BACKGROUND_COLOR = '#F4A460'      # Sandy brown (for page background)
+PANEL_FILL_COLOR = '#8B4B4513'          # Saddle brown (for panels)
+GAP_COLOR = '#F4A460'                 # Sandy brown (for gaps and the outer visual boundary)
+GRID_LINE_COLOR = 'black'
+TEXT_COLOR = 'black'
+# Part of every figure memo key, so a theme change never serves figures in the old colours.
+THEME = (APP_BACKGROUND_COLOR, PANEL_FILL_COLOR, GAP_COLOR, GRID_LINE_COLOR, TEXT_COLOR)
+
+VIEWS = ["Defect View", "Pareto View", "Summary View", "Trend View"]
+QUADRANTS = ["All", "Q1", "Q2", "Q3", "Q4"]
+
+# One image index per folder for the whole server process; refresh() is a single stat
+# call unless files were added or removed.
+@st.cache_resource
+def _image_index(image_dir):
+    return DefectImageIndex(image_dir)
+
+def get_image_index(image_dir):
+    index = _image_index(image_dir)
+    index.refresh()
+    return index
+
+# --- Figure Memo ---
+# Built figures are shared by all sessions and keyed by (data hash, view, quadrant,
+# geometry, theme, view options), so going back to a quadrant or view already shown
+# re-sends its figure without rebuilding any traces, shapes or tick arrays.
+@st.cache_resource
+def get_figure_cache():
+    return LRUCache(max_entries=FIGURE_CACHE_ENTRIES, max_bytes=FIGURE_CACHE_MAX_BYTES,
+                    sizeof=lambda entry: entry['data_bytes'])
+
+def memo_figure(key, build):
+    """
+    Returns the memoized figure entry for ``key``, calling ``build()`` only on a miss.
+
+    Args:
+        key (tuple): (data hash, view, quadrant, geometry, theme, ...view options).
+        build (callable): Returns a dict with the figure under 'fig' plus anything the
+            view shows alongside it; it must not call Streamlit.
+
+    Returns:
+        dict: The built entry, with the figure's approximate size added as 'data_bytes'
+        and the size of the JSON sent to the browser as 'payload_bytes'.
+    """
+    cache = get_figure_cache()
+    entry = cache.get(key)
+    if entry is None:
+        entry = await_warmup(key)
+    if entry is not None:
+        count('figure_cache.hit')
+        return entry
+    count('figure_cache.miss')
+    with span('app.build_figure'):
+        return _build_figure(cache, key, build)
+
+def _build_figure(cache, key, build):
+    entry = build()
+    entry['data_bytes'] = figure_data_bytes(entry['fig'])
+    # Measured once per built figure (often on a warm-up thread); every later rerun reuses it.
+    entry['payload_bytes'] = figure_payload_bytes(entry['fig'])
+    cache.put(key, entry)
+    return entry
+
+def build_unit_heatmap_figure(unit_counts, quadrant, gap_size, defect_type):
+    """The defects-per-unit heatmap over the panel grid, for all defect types (None) or one."""
+    panel_rows, panel_cols = unit_counts.by_type.shape[2:]
+    fig = go.Figure(create_unit_heatmap(unit_counts, gap_size, quadrant, defect_type))
+    if quadrant == "All":
+        x_range = [-gap_size, 2 * panel_cols + 2 * gap_size]
+        y_range = [-gap_size, 2 * panel_rows + 2 * gap_size]
+    else:
+        x_range, y_range = [0, panel_cols], [0, panel_rows]
+    fig.update_layout(
+        xaxis=dict(range=x_range, showticklabels=False, showgrid=False, zeroline=False),
+        yaxis=dict(range=y_range, showticklabels=False, showgrid=False, zeroline=False, scaleanchor="x", scaleratio=1),
+        shapes=create_grid_shapes(panel_rows, panel_cols, gap_size, quadrant=quadrant, panel_fill_color=PANEL_FILL_COLOR, grid_line_color=GRID_LINE_COLOR),
+        plot_bgcolor=APP_BACKGROUND_COLOR,
+        paper_bgcolor=APP_BACKGROUND_COLOR,
+        font=dict(color=TEXT_COLOR),
+        height=600
+    )
+    return {'fig': fig}
+
+def show_unit_heatmap(data_hash, unit_counts, quadrant, gap_size):
+    """Renders the defects-per-unit heatmap, with a selector for all or one defect type."""
+    panel_rows, panel_cols = unit_counts.by_type.shape[2:]
+    present = [t for t, n in zip(unit_counts.defect_types, unit_counts.by_type.sum(axis=(1, 2, 3))) if n > 0]
+    defect_type = st.selectbox("Defect type", ["All Types"] + present, key="heatmap_type")
+    defect_type = None if defect_type == "All Types" else defect_type
+    entry = memo_figure((data_hash, 'heatmap', quadrant, (panel_rows, panel_cols, gap_size), THEME, defect_type),
+                        lambda: build_unit_heatmap_figure(unit_counts, quadrant, gap_size, defect_type))
+    plotly_chart(entry['fig'], payload_bytes=entry['payload_bytes'], use_container_width=True)
+    if unit_counts.out_of_range:
+        st.caption(f"{unit_counts.out_of_range:,} defects lie outside the configured panel size or quadrants and are not shown.")
+
+def show_selection(selected_df, panel_rows, panel_cols, gap_size, panel_fill_color, background_color, text_color):
+    """Renders the drill-down for a map selection: a mini-Pareto, the rows and, for one unit cell, its images."""
+    st.subheader(f"Selection: {len(selected_df):,} Defects")
+    if selected_df.empty:
+        return
+    col1, col2 = st.columns([1, 2])
+    counts = selected_df['DEFECT_TYPE'].value_counts()
+    counts = counts[counts > 0]
+    mini_pareto = go.Figure(go.Bar(x=counts.index, y=counts.values))
+    mini_pareto.update_layout(
+        height=300, margin=dict(l=10, r=10, t=10, b=10),
+        xaxis=dict(tickfont=dict(color=text_color)), yaxis=dict(tickfont=dict(color=text_color)),
+        plot_bgcolor=panel_fill_color, paper_bgcolor=background_color
+    )
+    col1.plotly_chart(mini_pareto, use_container_width=True)
+    col2.dataframe(selected_df[['UNIT_INDEX_X', 'UNIT_INDEX_Y', 'DEFECT_TYPE', 'QUADRANT']], use_container_width=True, height=300)
+
+    # --- Defect Image Review ---
+    # Images are shown when the selection is a single unit cell, e.g. a click on a point.
+    first = selected_df.iloc[0]
+    unit = plot_to_unit(first['PLOT_X'], first['PLOT_Y'], panel_rows, panel_cols, gap_size)
+    single_cell = (selected_df['PLOT_X'] == first['PLOT_X']).all() and (selected_df['PLOT_Y'] == first['PLOT_Y']).all()
+    if unit is not None and single_cell:
+        quadrant, unit_x, unit_y = unit
+        st.subheader(f"Defect Images - {quadrant}, Unit ({unit_x}, {unit_y})")
+        image_paths = get_image_index(IMAGE_DIR).lookup(quadrant, unit_x, unit_y)
+        for column, label, path in zip(st.columns(2), ["M1", "M2"], image_paths):
+            if path:
+                column.image(load_thumbnail(path), caption=f"{label}: {os.path.basename(path)}")
+            else:
+                column.info(f"No {label} image for this defect.")
+
+# Reports are only built on request and memoized per (lot, panel geometry, cluster
+# settings, map option); the frame, cube and clusters are excluded from hashing because
+# data_hash and cluster_params already identify them.
+@st.cache_data(max_entries=4, show_spinner="Building report...")
+def build_report(data_hash, panel_rows, panel_cols, cluster_params, include_maps, _full_df, _cube, _clusters):
+    map_images = render_map_images(_full_df, panel_rows, panel_cols) if include_maps else None
+    return generate_excel_report(_full_df, panel_rows, panel_cols, cube=_cube, clusters=_clusters, map_images=map_images)
+
+# The background warm-up writes every report to a file in REPORT_DIR, one per report key,
+# and so do lots above REPORT_SPILL_ROWS defects when the report is requested; such files
+# are only read when the download button is clicked, so no session holds a large workbook
+# in memory between reruns.
+def report_path(data_hash, panel_rows, panel_cols, cluster_params, include_maps):
+    name = hashlib.sha1(repr((data_hash, panel_rows, panel_cols, cluster_params, include_maps)).encode()).hexdigest()[:16]
+    return os.path.join(REPORT_DIR, f"report_{name}.xlsx")
+
+def write_cached_report(data_hash, panel_rows, panel_cols, cluster_params, include_maps, full_df, cube, clusters):
+    """Returns the path of the report file for these settings, writing it if needed. Streamlit-free."""
+    path = report_path(data_hash, panel_rows, panel_cols, cluster_params, include_maps)
+    if os.path.exists(path):
+        os.utime(path)   # keeps a report in use out of the pruning
+        return path
+    os.makedirs(REPORT_DIR, exist_ok=True)
+    map_images = render_map_images(full_df, panel_rows, panel_cols) if include_maps else None
+    write_report_file(path, full_df, panel_rows, panel_cols, cube=cube, clusters=clusters, map_images=map_images)
+    prune_report_files(REPORT_DIR, REPORT_FILES_KEPT)
+    return path
+
+def build_report_file(data_hash, panel_rows, panel_cols, cluster_params, include_maps, full_df, cube, clusters):
+    """write_cached_report with a spinner, for reports requested before the warm-up wrote them."""
+    with st.spinner("Building report..."):
+        return write_cached_report(data_hash, panel_rows, panel_cols, cluster_params, include_maps, full_df, cube, clusters)
+
+# --- Background Precompute ---
+# One pool for the whole server process, so the number of warm-up threads stays bounded
+# however many sessions are open.
+@st.cache_resource
+def get_warmup_pool():
+    return ThreadPoolExecutor(max_workers=WARMUP_WORKERS, thread_name_prefix='aoi-warmup')
+
+def await_warmup(name):
+    """
+    Returns the result of the session's warm-up task ``name``, waiting only if a worker
+    is already building it. A task still queued in the shared pool is taken over (None
+    is returned and the caller builds the artifact itself), so a rerun never stalls
+    behind other sessions' warm-ups.
+    """
+    job = st.session_state.get('warmup')
+    if job is None or name not in job:
+        return None
+    with span('app.await_warmup'):
+        return job.wait(name)
+
+def lot_clusters(lot, panel_rows, panel_cols, cluster_params):
+    """The lot's clusters for the sidebar settings, waiting for the warm-up if it is finding them."""
+    await_warmup(('clusters', lot['data_hash'], panel_rows, panel_cols, cluster_params))
+    return get_defect_clusters(lot['data_hash'], lot['parsed_df'], panel_rows, panel_cols, *cluster_params)
+
+def stop_warmup():
+    """Cancels the session's warm-up job, e.g. when its lot is no longer shown."""
+    job = st.session_state.pop('warmup', None)
+    if job is not None:
+        job.cancel()
+
+def start_warmup(lot, panel_rows, panel_cols, gap_size, cluster_params, show_clusters, include_maps):
+    """
+    Queues the background precompute of a lot: clusters, unit counts and the selection
+    index, the defect map, Pareto and heatmap figures for All and Q1-Q4, and last the
+    Excel report (written to REPORT_DIR, see write_cached_report). Results go into the
+    same caches the views read (see await_warmup). A new lot or new settings cancel the
+    session's previous job.
+
+    Returns:
+        WarmupJob: The session's job for this lot and these settings.
+    """
+    key = (lot['data_hash'], panel_rows, panel_cols, gap_size, cluster_params, show_clusters, include_maps)
+    job = st.session_state.get('warmup')
+    if job is not None and job.key == key:
+        return job
+    stop_warmup()
+    job = st.session_state['warmup'] = WarmupJob(key, get_warmup_pool())
+    data_hash, parsed_df, full_df, cube = lot['data_hash'], lot['parsed_df'], lot['full_df'], lot['cube']
+    # Streamlit's own caches are not touched from the workers, as they need a script context.
+    figures = get_figure_cache()
+    geometry = (panel_rows, panel_cols, gap_size)
+    clusters_name = ('clusters', data_hash, panel_rows, panel_cols, cluster_params)
+    counts_name = ('unit_counts', data_hash, panel_rows, panel_cols)
+
+    def clusters():
+        job.wait(clusters_name)
+        return get_defect_clusters(data_hash, parsed_df, panel_rows, panel_cols, *cluster_params)
+
+    def unit_counts():
+        job.wait(counts_name)
+        return get_unit_counts(data_hash, parsed_df, panel_rows, panel_cols)
+
+    def warm_figure(key, build):
+        entry = figures.peek(key)
+        return entry if entry is not None else _build_figure(figures, key, build)
+
+    job.submit(clusters_name, "Aggregates", get_defect_clusters, data_hash, parsed_df, panel_rows, panel_cols, *cluster_params)
+    job.submit(counts_name, "Aggregates", get_unit_counts, data_hash, parsed_df, panel_rows, panel_cols)
+    for quadrant in QUADRANTS:
+        key = (data_hash, 'defect', quadrant, geometry, THEME, cluster_params if show_clusters else None)
+        job.submit(key, "Defect maps", warm_figure, key, lambda q=quadrant: build_defect_map_figure(
+            full_df, q, panel_rows, panel_cols, gap_size, clusters() if show_clusters else None))
+    for quadrant in QUADRANTS:
+        key = (data_hash, 'pareto', quadrant, None, THEME)
+        job.submit(key, "Pareto charts", warm_figure, key, lambda q=quadrant: build_pareto_figure(cube, q))
+    key = (data_hash, 'grouped_pareto', 'All', None, THEME)
+    job.submit(key, "Pareto charts", warm_figure, key, lambda: build_grouped_pareto_figure(cube))
+    for quadrant in QUADRANTS:
+        key = (data_hash, 'heatmap', quadrant, geometry, THEME, None)
+        job.submit(key, "Heatmaps", warm_figure, key, lambda q=quadrant: build_unit_heatmap_figure(unit_counts(), q, gap_size, None))
+    index_name = ('cell_index', data_hash, panel_rows, panel_cols, gap_size)
+    job.submit(index_name, "Aggregates", get_cell_index, data_hash, full_df, panel_rows, panel_cols, gap_size)
+    # The slowest artifact, and the one needed last, so it is queued behind the views'.
+    report_key = (data_hash, panel_rows, panel_cols, cluster_params, include_maps)
+    job.submit(('report',) + report_key, "Report", lambda: write_cached_report(*report_key, full_df, cube, clusters()))
+    return job
+
+def show_warmup_status(job, pending):
+    """Sidebar readiness of the session's precompute; reruns the page once it has finished."""
+    if pending and job.done():
+        st.rerun()
+    parts = []
+    for group, counts in job.status().items():
+        failed = f" ({counts['failed']} failed)" if counts['failed'] else ""
+        parts.append(f"{group} {counts['ready']}/{counts['total']}{failed}")
+    st.caption(("Ready: " if job.done() else "Precomputing: ") + " · ".join(parts))
+
+def show_trend_view(quadrant, panel_fill_color, background_color, text_color):
+    """Renders the cross-lot Trend View from the per-lot aggregates in the history store."""
+    st.header(f"Defect Trend - Quadrant: {quadrant}")
+    today = datetime.date.today()
+    col1, col2, col3 = st.columns([2, 4, 1])
+    date_range = col1.date_input("Lot dates", value=(today - datetime.timedelta(days=TREND_DEFAULT_DAYS), today))
+    if len(date_range) != 2:
+        st.info("Select the last day of the period.")
+        return
+    start = datetime.datetime.combine(date_range[0], datetime.time.min).timestamp()
+    end = datetime.datetime.combine(date_range[1], datetime.time.max).timestamp()
+
+    with span('app.trend_query'):
+        trend = get_history_store().trend(start, end, quadrant)
+    if trend.empty:
+        st.info("No lots in the history for this period. Add uploaded lots from the sidebar, "
+                "or record whole folders with `python batch_report.py ... --history aoi_history.sqlite`.")
+        return
+
+    ranked = trend.groupby('defect_type')['count'].sum().sort_values(ascending=False, kind='stable')
+    defect_types = col2.multiselect("Defect types", list(ranked.index), default=list(ranked.index[:5]))
+    share = col3.toggle("Share (%)", help="Plot each type as a percentage of the lot's defects.")
+
+    fig = go.Figure(create_trend_traces(trend[trend['defect_type'].isin(defect_types)], share=share))
+    fig.update_layout(
+        xaxis=dict(title="Lot Time", title_font=dict(color=text_color), tickfont=dict(color=text_color)),
+        yaxis=dict(title="Share of Lot Defects (%)" if share else "Count", title_font=dict(color=text_color), tickfont=dict(color=text_color)),
+        plot_bgcolor=panel_fill_color,
+        paper_bgcolor=background_color,
+        legend=dict(font=dict(color=text_color)),
+        hovermode='closest'
+    )
+    plotly_chart(fig, use_container_width=True)
+    st.caption(f"{trend['lot_id'].nunique():,} lots between {date_range[0]} and {date_range[1]}")
+
+# Polls the watched source on a timer without rerunning the page; the page is rerun
+# only when the feed has moved past the contents this run rendered.
+@st.fragment(run_every=LIVE_POLL_SECONDS)
+def watch_live_feed(path, rendered_key):
+    feed = get_live_feed(path)
+    feed.poll()
+    if feed.key != rendered_key:
+        st.rerun()
+    status = f"Watching {path}: {feed.lot.rows:,} defects"
+    if feed.last_update:
+        status += f", last update {time.strftime('%H:%M:%S', time.localtime(feed.last_update))}"
+    st.caption(status)
+    midpoint = feed.lot.quadrant_midpoint
+    if feed.lot.diagnostics['quadrants_derived'] and midpoint is not None:
+        st.caption(f"Quadrant centre frozen at ({midpoint[0]:,.1f}, {midpoint[1]:,.1f})")
+        st.button("Re-centre Quadrants", on_click=feed.recentre,
+                  help="Re-derives every quadrant around the centre of all defects received so far.")
+
+def show_performance_panel(recorder):
+    """Renders the sidebar "Performance" panel for the rerun captured by ``recorder`` (None when off)."""
+    with st.expander("Performance"):
+        st.checkbox("Record stage timings", key='perf_enabled',
+                    help="Times every stage of the following reruns. Costs nothing while off.")
+        if recorder is None:
+            return
+        run = recorder.to_dict()
+        st.caption(f"Last rerun: {run['total_ms']:,.0f} ms")
+        if run['spans']:
+            spans = pd.DataFrame(run['spans'])
+            spans['Stage'] = ['· ' * depth + name for depth, name in zip(spans['depth'], spans['name'])]
+            columns = {'Stage': 'Stage', 'ms': 'ms', 'peak_rss_delta_mb': 'Peak RSS +MB'}
+            st.dataframe(spans[[c for c in columns if c in spans]].rename(columns=columns),
+                         hide_index=True, use_container_width=True)
+        cache = get_cache_stats()
+        st.caption(f"Dataset registry (all sessions): {cache['entries']} lots, {cache['bytes'] / 1e6:,.1f} of "
+                   f"{cache['budget_bytes'] / 1e6:,.0f} MB · {cache['hits']:,} hits · {cache['misses']:,} misses "
+                   f"· {cache['evictions']:,} evictions")
+        st.caption(f"Spilled to disk: {cache['spilled_lots']} lots, {cache['spill_bytes'] / 1e6:,.1f} MB "
+                   f"· {cache['spills']:,} spills · {cache['reloads']:,} reloads")
+        for name, value in {**run['counters'], **run['values']}.items():
+            st.caption(f"{name}: {value:,}")
+        if st.checkbox(f"Append reruns to {PERF_LOG_PATH}", key='perf_export'):
+            # The registry counters are logged with each rerun, for sizing the server offline.
+            recorder.values['dataset_registry'] = cache
+            export_jsonl(recorder, PERF_LOG_PATH)
+
+def plotly_chart(fig, payload_bytes=None, **kwargs):
+    """st.plotly_chart with the figure's JSON payload size and serialization time recorded."""
+    if is_recording():
+        record('figure_payload_bytes', figure_payload_bytes(fig) if payload_bytes is None else payload_bytes)
+    with span('app.plotly_chart'):
+        return st.plotly_chart(fig, **kwargs)
 
 # ==============================================================================
 # --- STREAMLIT APP MAIN LOGIC (DEFINITIVE VERSION) ---
@@ -23,17 +392,25 @@ from src.reporting import generate_excel_report
 
 def main():
     """
-    Main function to run the Streamlit application.
+    Main function to run the Streamlit application. Each rerun is recorded for the
+    sidebar "Performance" panel while timing is switched on there.
+    """
+    recorder = start_run() if st.session_state.get('perf_enabled') else None
+    try:
+        with span('app.rerun'):
+            render_dashboard()
+    finally:
+        end_run()
+        with st.sidebar:
+            show_performance_panel(recorder)
+
+def render_dashboard():
+    """
+    Renders the page: sidebar controls, then the view area. The view area is a
+    fragment, so changing the view, quadrant or map selection reruns only that area.
     """
     st.set_page_config(layout="wide", page_title="Panel Defect Analysis")
 
-    # --- THEME COLORS: Centralized for a perfect match with the Colab version ---
-    APP_BACKGROUND_COLOR = '#F4A460'      # Sandy brown (for page background)
-    PANEL_FILL_COLOR = '#8B4B4513'          # Saddle brown (for panels)
-    GAP_COLOR = '#F4A460'                 # Sandy brown (for gaps and the outer visual boundary)
-    GRID_LINE_COLOR = 'black'
-    TEXT_COLOR = 'black'
-    
     st.markdown(f"""
         <style>
             .reportview-container, .main {{ background-color: {APP_BACKGROUND_COLOR}; }}
@@ -42,166 +419,346 @@ def main():
             body, .stRadio, .stSelectbox, .stNumberInput, .stFileUploader, p, .stMarkdown {{ color: {TEXT_COLOR}; }}
         </style>
     """, unsafe_allow_html=True)
-    
+
     st.title("Panel Defect Analysis Tool")
 
     with st.sidebar:
         st.header("Control Panel")
         st.divider()
         st.subheader("Data Source")
-        uploaded_file = st.file_uploader("Upload Your Defect Data (Excel)", type=["xlsx", "xls"])
+        live_mode = st.toggle("Watch a folder or file", value=bool(LIVE_SOURCE),
+                              help="Follows an AOI output folder or an append-only CSV/JSONL file and adds new defects as they are written.")
+        uploaded_file = watch_path = None
+        if live_mode:
+            watch_path = st.text_input("Folder or append-only CSV/JSONL file", value=LIVE_SOURCE).strip()
+        else:
+            uploaded_file = st.file_uploader("Upload Your Defect Data", type=["xlsx", "xls", "csv", "parquet", "feather", "jsonl"])
         st.divider()
         st.subheader("Configuration")
         panel_rows = st.number_input("Panel Rows", min_value=2, max_value=50, value=7)
         panel_cols = st.number_input("Panel Columns", min_value=2, max_value=50, value=7)
-        gap_size = 1 
-        st.divider()
-        st.subheader("Analysis Controls")
-        view_mode = st.radio("Select View", ["Defect View", "Pareto View", "Summary View"])
-        quadrant_selection = st.selectbox("Select Quadrant", ["All", "Q1", "Q2", "Q3", "Q4"])
+        gap_size = 1
 
-    if uploaded_file is None:
-        st.info("Welcome! Please upload a defect data file to begin analysis.")
-        return
+    # The Trend View reads the lot history only, so the view area is shown even without a lot.
+    lot = empty_message = None
+    if live_mode:
+        if not watch_path:
+            empty_message = "Enter the folder or file your inspection machines write to."
+        else:
+            # New rows are appended to the lot; projection and aggregate counts are updated incrementally.
+            with span('app.load'):
+                data_hash, parsed_df, full_df, cube, memory = load_live(watch_path, panel_rows, panel_cols, gap_size)
+            with st.sidebar:
+                watch_live_feed(watch_path, data_hash)
+            if full_df.empty:
+                empty_message = f"Waiting for defect data in {watch_path}..."
+            else:
+                lot = {'data_hash': data_hash, 'parsed_df': parsed_df, 'full_df': full_df, 'cube': cube}
+    elif uploaded_file is None:
+        empty_message = "Welcome! Please upload a defect data file to begin analysis."
+    else:
+        with span('app.load'):
+            data_hash, parsed_df = parse_data(uploaded_file)
+            full_df = get_projected_frame(data_hash, parsed_df, panel_rows, panel_cols, gap_size) if not parsed_df.empty else parsed_df
+        if full_df.empty:
+            st.error("The uploaded file is empty or could not be processed. Please check the file format and required columns (QUADRANT, UNIT_INDEX_X, UNIT_INDEX_Y, DEFECT_TYPE).")
+        else:
+            # Pareto, Summary and the report read the aggregate cube; only the map needs defect rows.
+            cube = get_defect_cube(data_hash, parsed_df)
+            memory = get_memory_report(data_hash)
+            lot = {'data_hash': data_hash, 'parsed_df': parsed_df, 'full_df': full_df, 'cube': cube}
 
-    full_df = load_data(uploaded_file, panel_rows, panel_cols, gap_size)
-    if full_df.empty:
-        st.error("The uploaded file is empty or could not be processed. Please check the file format and required columns (QUADRANT, UNIT_INDEX_X, UNIT_INDEX_Y, DEFECT_TYPE).")
+    if lot is None:
+        stop_warmup()
+        show_view_area(None, panel_rows, panel_cols, gap_size, None, False, empty_message)
         return
 
-    display_df = full_df[full_df['QUADRANT'] == quadrant_selection] if quadrant_selection != "All" else full_df
-
     with st.sidebar:
+        if memory:
+            st.caption(f"In-memory size: {memory['before_bytes'] / 1e6:.1f} MB → {memory['after_bytes'] / 1e6:.1f} MB")
+        st.divider()
+        st.subheader("Clusters")
+        has_coordinates = 'X_COORDINATES' in parsed_df.columns and 'Y_COORDINATES' in parsed_df.columns
+        cluster_by = st.radio("Cluster by", ["Unit grid", "Coordinates"] if has_coordinates else ["Unit grid"], horizontal=True,
+                              help="Unit grid joins defective units that touch; Coordinates joins defects whose X/Y grid cells touch.")
+        cluster_mode = 'coordinates' if cluster_by == "Coordinates" else 'units'
+        cell_size = CLUSTER_CELL_SIZE
+        if cluster_mode == 'coordinates':
+            cell_size = st.number_input("Grid cell size (coordinate units)", min_value=0.001, value=CLUSTER_CELL_SIZE)
+        min_cluster_defects = st.number_input("Minimum defects per cluster", min_value=2, value=CLUSTER_MIN_DEFECTS)
+        min_cell_defects = st.number_input("Minimum defects per cell", min_value=1, value=1,
+                                           help="Cells with fewer defects are ignored, so scattered defects do not link clusters together.")
+        show_clusters = st.toggle("Outline clusters on the defect map", value=True)
+        cluster_params = (cluster_mode, cell_size, min_cluster_defects, min_cell_defects)
         st.divider()
         st.subheader("Reporting")
-        excel_report_bytes = generate_excel_report(full_df, panel_rows, panel_cols)
-        st.download_button(
-            label="Download Full Report",
-            data=excel_report_bytes,
-            file_name="full_defect_report.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
-
-    if view_mode == "Defect View":
-        fig = go.Figure()
-        # This will now work because load_data creates PLOT_X and PLOT_Y
-        defect_traces = create_defect_traces(display_df)
-        for trace in defect_traces: fig.add_trace(trace)
-        
-        total_grid_width = (2 * panel_cols) + gap_size
-        total_grid_height = (2 * panel_rows) + gap_size
-        
-        if quadrant_selection == "All":
-            x_axis_range = [-gap_size, total_grid_width + gap_size]
-            y_axis_range = [-gap_size, total_grid_height + gap_size]
-            plot_shapes = create_grid_shapes(panel_rows, panel_cols, gap_size, quadrant='All', panel_fill_color=PANEL_FILL_COLOR, grid_line_color=GRID_LINE_COLOR)
-            plot_bg_color = GAP_COLOR
-            show_axes = True
+        include_maps = st.checkbox("Include defect map images", value=False,
+                                   help="Adds static maps of the whole panel and each quadrant to the report.")
+        job = start_warmup(lot, panel_rows, panel_cols, gap_size, cluster_params, show_clusters, include_maps)
+        report_key = (data_hash, panel_rows, panel_cols, cluster_params, include_maps)
+        if st.session_state.get('report_key') != report_key:
+            st.button("Prepare Full Report", on_click=st.session_state.__setitem__, args=('report_key', report_key))
         else:
-            x_axis_range = [0, panel_cols]
-            y_axis_range = [0, panel_rows]
-            plot_shapes = create_grid_shapes(panel_rows, panel_cols, gap_size, quadrant=quadrant_selection, panel_fill_color=PANEL_FILL_COLOR, grid_line_color=GRID_LINE_COLOR)
-            plot_bg_color = PANEL_FILL_COLOR
-            show_axes = False
-
-        x_tick_pos = [i + 0.5 for i in range(panel_cols)] + [i + 0.5 + panel_cols + gap_size for i in range(panel_cols)]
-        y_tick_pos = [i + 0.5 for i in range(panel_rows)] + [i + 0.5 + panel_rows + gap_size for i in range(panel_rows)]
-        
-        # --- SYNTAX ERROR FIXED IN THIS BLOCK ---
-        fig.update_layout(
-            title=dict(text=f"Panel Defect Map - Quadrant: {quadrant_selection} ({len(display_df)} Defects)", font=dict(color=TEXT_COLOR)),
-            xaxis=dict(
-                title="Unit Column Index" if show_axes else "",
-                title_font=dict(color=TEXT_COLOR),
-                tickfont=dict(color=TEXT_COLOR),
-                range=x_axis_range,
-                tickvals=x_tick_pos if show_axes else [],
-                ticktext=list(range(2 * panel_cols)) if show_axes else [],
-                showgrid=False, zeroline=False, showline=show_axes,
-                linewidth=3, linecolor=GRID_LINE_COLOR, mirror=True
-            ),
-            yaxis=dict(
-                title="Unit Row Index" if show_axes else "",
-                title_font=dict(color=TEXT_COLOR),
-                tickfont=dict(color=TEXT_COLOR),
-                range=y_axis_range,
-                tickvals=y_tick_pos if show_axes else [],
-                ticktext=list(range(2 * panel_rows)) if show_axes else [],
-                scaleanchor="x", scaleratio=1,
-                showgrid=False, zeroline=False, showline=show_axes,
-                linewidth=3, linecolor=GRID_LINE_COLOR, mirror=True
-            ),
-            plot_bgcolor=plot_bg_color,
-            paper_bgcolor=APP_BACKGROUND_COLOR,
-            shapes=plot_shapes,
-            legend=dict(title_font=dict(color=TEXT_COLOR), font=dict(color=TEXT_COLOR), x=1.02, y=1, xanchor='left', yanchor='top')
-        )
-        st.plotly_chart(fig, use_container_width=True)
-
-    elif view_mode == "Pareto View":
-        # ... (This section is fine, but updated with consistent color variables)
-        fig = go.Figure()
-        pareto_trace = create_pareto_trace(display_df)
-        fig.add_trace(pareto_trace)
-        fig.update_layout(
-            title=dict(text=f"Pareto Analysis - Quadrant: {quadrant_selection}", font=dict(color=TEXT_COLOR)),
-            xaxis=dict(title="Defect Type", title_font=dict(color=TEXT_COLOR), tickfont=dict(color=TEXT_COLOR)),
-            yaxis=dict(title="Count", title_font=dict(color=TEXT_COLOR), tickfont=dict(color=TEXT_COLOR)),
-            plot_bgcolor=PANEL_FILL_COLOR, 
-            paper_bgcolor=APP_BACKGROUND_COLOR,
-            showlegend=False
-        )
-        st.plotly_chart(fig, use_container_width=True)
-
-    elif view_mode == "Summary View":
-        # ... (This section is fine, summary logic remains the same)
-        st.header(f"Statistical Summary for Quadrant: {quadrant_selection}")
-        if display_df.empty:
-            st.info("No defects to summarize in the selected quadrant.")
-            return
+            with span('app.build_report'):
+                await_warmup(('report',) + report_key)
+                clusters = lot_clusters(lot, panel_rows, panel_cols, cluster_params)
+                if len(full_df) > REPORT_SPILL_ROWS or os.path.exists(report_path(*report_key)):
+                    # Read on the download thread when clicked, not on every rerun.
+                    report = Path(build_report_file(*report_key, full_df, cube, clusters)).read_bytes
+                else:
+                    report = build_report(*report_key, full_df, cube, clusters)
+            st.download_button(
+                label="Download Full Report",
+                data=report,
+                file_name="full_defect_report.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            )
+        st.divider()
+        st.subheader("Background Precompute")
+        pending = not job.done()
+        st.fragment(show_warmup_status, run_every=WARMUP_POLL_SECONDS if pending else None)(job, pending)
+        # Watched lots are still growing, so only uploaded lots are recorded in the history.
+        if not live_mode:
+            st.divider()
+            st.subheader("History")
+            history = get_history_store()
+            if history.has_lot(data_hash):
+                st.caption("This lot is recorded in the history (see the Trend View).")
+            else:
+                st.button("Add Lot to History", on_click=history.add_lot,
+                          args=(data_hash, uploaded_file.name, cube), kwargs={'source': 'upload'})
+
+    show_view_area(lot, panel_rows, panel_cols, gap_size, cluster_params, show_clusters, None)
 
+# Fragments cannot write to the sidebar, so the view and quadrant selectors live at the
+# top of the view area. Their changes, map selections and the heatmap and trend controls
+# rerun this function only; the lot is loaded and the sidebar drawn by the last full run.
+@st.fragment
+def show_view_area(lot, panel_rows, panel_cols, gap_size, cluster_params, show_clusters, empty_message):
+    """
+    Renders the view selectors and the selected view.
+
+    Args:
+        lot (dict): data_hash, parsed_df, full_df and cube of the current lot, or None.
+        cluster_params (tuple): (mode, cell size, min defects, min cell defects).
+        show_clusters (bool): Whether the defect map outlines the clusters.
+        empty_message (str): Shown instead of the lot views while there is no lot.
+    """
+    # A fragment rerun does not pass through main(), so it records itself; its timings
+    # go to the JSON-lines log, as the sidebar panel is only redrawn by full reruns.
+    recorder = start_run('fragment') if st.session_state.get('perf_enabled') and not is_recording() else None
+    try:
+        col1, col2 = st.columns([3, 1])
+        view_mode = col1.radio("Select View", VIEWS, horizontal=True, key='view_mode')
+        quadrant_selection = col2.selectbox("Select Quadrant", QUADRANTS, key='quadrant_selection')
+
+        with span('app.view'):
+            if view_mode == "Trend View":
+                show_trend_view(quadrant_selection, PANEL_FILL_COLOR, APP_BACKGROUND_COLOR, TEXT_COLOR)
+            elif lot is None:
+                if empty_message:
+                    st.info(empty_message)
+            elif view_mode == "Defect View":
+                show_defect_view(lot, quadrant_selection, panel_rows, panel_cols, gap_size, cluster_params, show_clusters)
+            elif view_mode == "Pareto View":
+                show_pareto_view(lot, quadrant_selection)
+            elif view_mode == "Summary View":
+                show_summary_view(lot, quadrant_selection, panel_rows, panel_cols, gap_size)
+    finally:
+        if recorder is not None:
+            end_run()
+            if st.session_state.get('perf_export'):
+                export_jsonl(recorder, PERF_LOG_PATH)
+
+def build_defect_map_figure(full_df, quadrant_selection, panel_rows, panel_cols, gap_size, clusters=None):
+    """The panel defect map for a quadrant, with cluster outlines when ``clusters`` is given."""
+    display_df = full_df[full_df['QUADRANT'] == quadrant_selection] if quadrant_selection != "All" else full_df
+    fig = go.Figure()
+    # This will now work because load_data creates PLOT_X and PLOT_Y
+    defect_traces = create_defect_traces(display_df)
+    for trace in defect_traces: fig.add_trace(trace)
+
+    total_grid_width = (2 * panel_cols) + gap_size
+    total_grid_height = (2 * panel_rows) + gap_size
+
+    if quadrant_selection == "All":
+        x_axis_range = [-gap_size, total_grid_width + gap_size]
+        y_axis_range = [-gap_size, total_grid_height + gap_size]
+        plot_shapes = create_grid_shapes(panel_rows, panel_cols, gap_size, quadrant='All', panel_fill_color=PANEL_FILL_COLOR, grid_line_color=GRID_LINE_COLOR)
+        plot_bg_color = GAP_COLOR
+        show_axes = True
+    else:
+        x_axis_range = [0, panel_cols]
+        y_axis_range = [0, panel_rows]
+        plot_shapes = create_grid_shapes(panel_rows, panel_cols, gap_size, quadrant=quadrant_selection, panel_fill_color=PANEL_FILL_COLOR, grid_line_color=GRID_LINE_COLOR)
+        plot_bg_color = PANEL_FILL_COLOR
+        show_axes = False
+
+    cluster_annotations = None
+    if clusters is not None:
+        cluster_shapes, cluster_annotations = create_cluster_overlay(full_df, clusters, quadrant_selection)
+        plot_shapes = plot_shapes + cluster_shapes
+
+    x_tick_pos = [i + 0.5 for i in range(panel_cols)] + [i + 0.5 + panel_cols + gap_size for i in range(panel_cols)]
+    y_tick_pos = [i + 0.5 for i in range(panel_rows)] + [i + 0.5 + panel_rows + gap_size for i in range(panel_rows)]
+
+    # --- SYNTAX ERROR FIXED IN THIS BLOCK ---
+    fig.update_layout(
+        title=dict(text=f"Panel Defect Map - Quadrant: {quadrant_selection} ({len(display_df)} Defects)", font=dict(color=TEXT_COLOR)),
+        xaxis=dict(
+            title="Unit Column Index" if show_axes else "",
+            title_font=dict(color=TEXT_COLOR),
+            tickfont=dict(color=TEXT_COLOR),
+            range=x_axis_range,
+            tickvals=x_tick_pos if show_axes else [],
+            ticktext=list(range(2 * panel_cols)) if show_axes else [],
+            showgrid=False, zeroline=False, showline=show_axes,
+            linewidth=3, linecolor=GRID_LINE_COLOR, mirror=True
+        ),
+        yaxis=dict(
+            title="Unit Row Index" if show_axes else "",
+            title_font=dict(color=TEXT_COLOR),
+            tickfont=dict(color=TEXT_COLOR),
+            range=y_axis_range,
+            tickvals=y_tick_pos if show_axes else [],
+            ticktext=list(range(2 * panel_rows)) if show_axes else [],
+            scaleanchor="x", scaleratio=1,
+            showgrid=False, zeroline=False, showline=show_axes,
+            linewidth=3, linecolor=GRID_LINE_COLOR, mirror=True
+        ),
+        plot_bgcolor=plot_bg_color,
+        paper_bgcolor=APP_BACKGROUND_COLOR,
+        shapes=plot_shapes,
+        annotations=cluster_annotations,
+        legend=dict(title_font=dict(color=TEXT_COLOR), font=dict(color=TEXT_COLOR), x=1.02, y=1, xanchor='left', yanchor='top')
+    )
+    return {'fig': fig, 'defects': len(display_df)}
+
+def show_defect_view(lot, quadrant_selection, panel_rows, panel_cols, gap_size, cluster_params, show_clusters):
+    """Renders the defect map, its cluster table and the drill-down for a map selection."""
+    data_hash, full_df = lot['data_hash'], lot['full_df']
+    clusters = None
+    if show_clusters:
+        with span('app.find_clusters'):
+            clusters = lot_clusters(lot, panel_rows, panel_cols, cluster_params)
+    key = (data_hash, 'defect', quadrant_selection, (panel_rows, panel_cols, gap_size), THEME,
+           cluster_params if show_clusters else None)
+    entry = memo_figure(key, lambda: build_defect_map_figure(full_df, quadrant_selection, panel_rows, panel_cols, gap_size, clusters))
+    payload_bytes = entry['payload_bytes']
+    record('figure_payload_bytes', payload_bytes)
+    with span('app.plotly_chart'):
+        map_event = st.plotly_chart(entry['fig'], use_container_width=True, on_select="rerun", selection_mode=("points", "box", "lasso"), key="defect_map")
+    render_mode = "points" if entry['defects'] <= RENDER_POINT_THRESHOLD else "per-cell counts"
+    st.caption(f"Rendered as {render_mode} · figure payload {payload_bytes / 1024:,.0f} KB · "
+               "click, box or lasso defects to inspect them")
+    if clusters is not None:
+        table = clusters.table
         if quadrant_selection != "All":
-            total_defects = len(display_df)
-            total_cells = panel_rows * panel_cols
-            defective_cells = len(display_df[['UNIT_INDEX_X', 'UNIT_INDEX_Y']].drop_duplicates())
-            defect_density = total_defects / total_cells if total_cells > 0 else 0
-            yield_estimate = (total_cells - defective_cells) / total_cells if total_cells > 0 else 0
-            st.markdown("### Key Performance Indicators (KPIs)")
-            col1, col2, col3 = st.columns(3)
-            col1.metric("Total Defect Count", f"{total_defects:,}")
-            col2.metric("Defect Density", f"{defect_density:.2f} defects/cell")
-            col3.metric("Yield Estimate", f"{yield_estimate:.2%}")
-            st.divider()
-            st.markdown("### Top Defect Types")
-            top_offenders = display_df['DEFECT_TYPE'].value_counts().reset_index()
-            top_offenders.columns = ['Defect Type', 'Count']
-            top_offenders['Percentage'] = (top_offenders['Count'] / total_defects) * 100
-            st.dataframe(top_offenders.style.format({'Percentage': '{:.2f}%'}).background_gradient(cmap='Reds', subset=['Count']), use_container_width=True)
-        else:
-            st.markdown("### Quarterly KPI Breakdown")
-            kpi_data = []
-            quadrants = ['Q1', 'Q2', 'Q3', 'Q4']
-            for quad in quadrants:
-                quad_df = full_df[full_df['QUADRANT'] == quad]
-                total_defects = len(quad_df)
-                density = total_defects / (panel_rows * panel_cols) if (panel_rows * panel_cols) > 0 else 0
-                kpi_data.append({"Quadrant": quad, "Total Defects": total_defects, "Defect Density": f"{density:.2f}"})
-            kpi_df = pd.DataFrame(kpi_data)
-            st.dataframe(kpi_df, use_container_width=True)
-            st.divider()
-            st.markdown("### Defect Distribution by Quadrant")
-            fig = go.Figure()
-            grouped_traces = create_grouped_pareto_trace(full_df)
-            for trace in grouped_traces: fig.add_trace(trace)
-            fig.update_layout(
-                barmode='group',
-                xaxis=dict(title="Defect Type", title_font=dict(color=TEXT_COLOR), tickfont=dict(color=TEXT_COLOR)),
-                yaxis=dict(title="Count", title_font=dict(color=TEXT_COLOR), tickfont=dict(color=TEXT_COLOR)),
-                plot_bgcolor=PANEL_FILL_COLOR,
-                paper_bgcolor=APP_BACKGROUND_COLOR,
-                legend=dict(font=dict(color=TEXT_COLOR))
-            )
-            st.plotly_chart(fig, use_container_width=True)
+            table = table[table['QUADRANTS'].str.contains(quadrant_selection, regex=False)]
+        outlined = f" (the largest {CLUSTER_OVERLAY_MAX} are outlined)" if len(table) > CLUSTER_OVERLAY_MAX else ""
+        with st.expander(f"Defect Clusters: {len(table):,}{outlined}"):
+            st.dataframe(table, hide_index=True, use_container_width=True)
+
+    # --- Selection Drill-Down ---
+    selection = map_event.selection if map_event else {}
+    if selection.get('points') or selection.get('box') or selection.get('lasso'):
+        await_warmup(('cell_index', data_hash, panel_rows, panel_cols, gap_size))
+        cell_index = get_cell_index(data_hash, full_df, panel_rows, panel_cols, gap_size)
+        with span('app.resolve_selection'):
+            selected_df = full_df.iloc[cell_index.rows_for_selection(selection)]
+        if quadrant_selection != "All":
+            selected_df = selected_df[selected_df['QUADRANT'] == quadrant_selection]
+        show_selection(selected_df, panel_rows, panel_cols, gap_size, PANEL_FILL_COLOR, APP_BACKGROUND_COLOR, TEXT_COLOR)
+
+def build_pareto_figure(cube, quadrant_selection):
+    """The Pareto bar chart of one quadrant (or 'All')."""
+    fig = go.Figure()
+    pareto_trace = create_pareto_trace(cube, quadrant_selection)
+    fig.add_trace(pareto_trace)
+    fig.update_layout(
+        title=dict(text=f"Pareto Analysis - Quadrant: {quadrant_selection}", font=dict(color=TEXT_COLOR)),
+        xaxis=dict(title="Defect Type", title_font=dict(color=TEXT_COLOR), tickfont=dict(color=TEXT_COLOR)),
+        yaxis=dict(title="Count", title_font=dict(color=TEXT_COLOR), tickfont=dict(color=TEXT_COLOR)),
+        plot_bgcolor=PANEL_FILL_COLOR,
+        paper_bgcolor=APP_BACKGROUND_COLOR,
+        showlegend=False
+    )
+    return {'fig': fig}
+
+def show_pareto_view(lot, quadrant_selection):
+    # The Pareto is read from the cube, so it does not depend on the panel geometry.
+    entry = memo_figure((lot['data_hash'], 'pareto', quadrant_selection, None, THEME),
+                        lambda: build_pareto_figure(lot['cube'], quadrant_selection))
+    plotly_chart(entry['fig'], payload_bytes=entry['payload_bytes'], use_container_width=True)
+
+def build_grouped_pareto_figure(cube):
+    """Defect counts per type, grouped by quadrant."""
+    fig = go.Figure()
+    grouped_traces = create_grouped_pareto_trace(cube)
+    for trace in grouped_traces: fig.add_trace(trace)
+    fig.update_layout(
+        barmode='group',
+        xaxis=dict(title="Defect Type", title_font=dict(color=TEXT_COLOR), tickfont=dict(color=TEXT_COLOR)),
+        yaxis=dict(title="Count", title_font=dict(color=TEXT_COLOR), tickfont=dict(color=TEXT_COLOR)),
+        plot_bgcolor=PANEL_FILL_COLOR,
+        paper_bgcolor=APP_BACKGROUND_COLOR,
+        legend=dict(font=dict(color=TEXT_COLOR))
+    )
+    return {'fig': fig}
+
+def show_summary_view(lot, quadrant_selection, panel_rows, panel_cols, gap_size):
+    """Renders the KPI tables, the defects-per-unit heatmap and, for 'All', the grouped Pareto."""
+    data_hash, cube = lot['data_hash'], lot['cube']
+    st.header(f"Statistical Summary for Quadrant: {quadrant_selection}")
+    if cube.quadrant_total(quadrant_selection) == 0:
+        st.info("No defects to summarize in the selected quadrant.")
+        return
+
+    # Yield and the heatmap come from per-unit count matrices built in one pass over the lot.
+    await_warmup(('unit_counts', data_hash, panel_rows, panel_cols))
+    unit_counts = get_unit_counts(data_hash, lot['parsed_df'], panel_rows, panel_cols)
+
+    if quadrant_selection != "All":
+        total_defects = cube.quadrant_total(quadrant_selection)
+        total_cells = unit_counts.units_per_quadrant
+        defect_density = total_defects / total_cells if total_cells > 0 else 0
+        yield_estimate = unit_counts.unit_yield(quadrant_selection)
+        st.markdown("### Key Performance Indicators (KPIs)")
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Total Defect Count", f"{total_defects:,}")
+        col2.metric("Defect Density", f"{defect_density:.2f} defects/cell")
+        col3.metric("Yield Estimate", f"{yield_estimate:.2%}")
+        st.divider()
+        st.markdown("### Top Defect Types")
+        top_offenders = cube.defect_counts(quadrant_selection).reset_index()
+        top_offenders.columns = ['Defect Type', 'Count']
+        top_offenders['Percentage'] = (top_offenders['Count'] / total_defects) * 100
+        st.dataframe(top_offenders.style.format({'Percentage': '{:.2f}%'}).background_gradient(cmap='Reds', subset=['Count']), use_container_width=True)
+        st.divider()
+        st.markdown("### Defects per Unit")
+        show_unit_heatmap(data_hash, unit_counts, quadrant_selection, gap_size)
+    else:
+        st.markdown("### Quarterly KPI Breakdown")
+        kpi_data = []
+        quadrants = ['Q1', 'Q2', 'Q3', 'Q4']
+        units = unit_counts.units_per_quadrant
+        for quad in quadrants + ['Panel']:
+            total_defects = cube.quadrant_total('All' if quad == 'Panel' else quad)
+            quad_units = units * (len(quadrants) if quad == 'Panel' else 1)
+            density = total_defects / quad_units if quad_units > 0 else 0
+            defective_units = unit_counts.defective_units('All' if quad == 'Panel' else quad)
+            unit_yield = unit_counts.unit_yield('All' if quad == 'Panel' else quad)
+            kpi_data.append({"Quadrant": quad, "Total Defects": total_defects, "Defect Density": f"{density:.2f}",
+                             "Defective Units": defective_units, "Yield": f"{unit_yield:.2%}"})
+        kpi_df = pd.DataFrame(kpi_data)
+        st.dataframe(kpi_df, use_container_width=True)
+        st.divider()
+        st.markdown("### Defects per Unit")
+        show_unit_heatmap(data_hash, unit_counts, "All", gap_size)
+        st.divider()
+        st.markdown("### Defect Distribution by Quadrant")
+        entry = memo_figure((data_hash, 'grouped_pareto', 'All', None, THEME), lambda: build_grouped_pareto_figure(cube))
+        plotly_chart(entry['fig'], payload_bytes=entry['payload_bytes'], use_container_width=True)
 
 if __name__ == '__main__':
     main()
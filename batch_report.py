@@ -0,0 +1,13 @@
+# batch_report.py
+
+"""
+Command-line entry point for headless batch reporting.
+Example: python batch_report.py lots/ --output-dir reports --workers 8
+"""
+
+import sys
+
+from src.batch import main
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+# benchmarks/run_benchmarks.py
+
+"""
+Reproducible benchmark suite for the processing and rendering stages.
+
+Each stage is run on seeded synthetic lots of increasing size. Wall time is the best
+of several repeats; peak memory comes from a separate tracemalloc-instrumented run so
+that tracing does not distort the timings. Results are written as JSON and can be
+compared against a stored baseline, failing on regressions beyond a tolerance.
+
+Examples:
+    python benchmarks/run_benchmarks.py --sizes 10k 100k --save-baseline benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --sizes 10k 100k --baseline benchmarks/baseline.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from src.aggregates import build_defect_cube  # noqa: E402
+from src.ingest import read_defect_table  # noqa: E402
+from src.pipeline import process_defect_table, project_layout  # noqa: E402
+from src.plotting import (  # noqa: E402
+    clear_render_caches, create_defect_traces, create_grid_shapes, create_grouped_pareto_trace
+)
+from src.reporting import generate_excel_report  # noqa: E402
+from src.synthetic import generate_lot, write_lot  # noqa: E402
+
+PANEL_ROWS = 7
+PANEL_COLS = 7
+GAP_SIZE = 1
+DEFAULT_SIZES = ['10k', '100k', '1M', '10M']
+STAGES = ['load_data', 'project_layout', 'build_defect_cube', 'create_defect_traces',
+          'create_grid_shapes', 'create_grouped_pareto_trace', 'generate_excel_report']
+
+
+def parse_size(text):
+    multipliers = {'k': 1_000, 'm': 1_000_000}
+    suffix = text[-1].lower()
+    return int(float(text[:-1]) * multipliers[suffix]) if suffix in multipliers else int(text)
+
+
+def _stage_calls(lot_path, max_report_rows):
+    """
+    Returns (stage name, setup, call) triples. setup() runs outside the measurement and
+    returns the argument handed to call(), so each stage is timed on its own.
+    """
+    def parsed():
+        return process_defect_table(read_defect_table(lot_path, cache_dir=None))[0]
+
+    def projected():
+        return project_layout(parsed(), PANEL_ROWS, PANEL_COLS, GAP_SIZE)
+
+    def grid_shapes(_):
+        clear_render_caches()  # Measure a cold build, not the memoized lookup.
+        return create_grid_shapes(PANEL_ROWS, PANEL_COLS, GAP_SIZE, quadrant='All')
+
+    def report(df):
+        if len(df) > max_report_rows:
+            return None
+        return generate_excel_report(df, PANEL_ROWS, PANEL_COLS)
+
+    return [
+        ('load_data', lambda: None, lambda _: parsed()),
+        ('project_layout', parsed, lambda df: project_layout(df, PANEL_ROWS, PANEL_COLS, GAP_SIZE)),
+        ('build_defect_cube', parsed, build_defect_cube),
+        ('create_defect_traces', projected, create_defect_traces),
+        ('create_grid_shapes', lambda: None, grid_shapes),
+        ('create_grouped_pareto_trace', lambda: build_defect_cube(parsed()), create_grouped_pareto_trace),
+        ('generate_excel_report', projected, report),
+    ]
+
+
+def _measure(setup, call, repeats):
+    arg = setup()
+    timings = []
+    for _ in range(repeats):
+        gc.collect()
+        start = time.perf_counter()
+        result = call(arg)
+        timings.append(time.perf_counter() - start)
+        del result
+    gc.collect()
+    tracemalloc.start()
+    call(arg)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(timings), peak
+
+
+def run_benchmarks(sizes, stages, repeats=3, skew=1.0, seed=0, max_report_rows=1_000_000, log=print):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n in sizes:
+            lot_path = os.path.join(tmp_dir, f"lot_{n}.csv")
+            write_lot(generate_lot(n, PANEL_ROWS, PANEL_COLS, GAP_SIZE, skew=skew, seed=seed), lot_path)
+            for stage, setup, call in _stage_calls(lot_path, max_report_rows):
+                if stage not in stages:
+                    continue
+                if stage == 'generate_excel_report' and n > max_report_rows:
+                    log(f"{stage:<30} {n:>10,}   skipped (above --max-report-rows)")
+                    continue
+                stage_repeats = 1 if stage in ('load_data', 'generate_excel_report') and n >= 1_000_000 else repeats
+                seconds, peak = _measure(setup, call, stage_repeats)
+                results.append({'stage': stage, 'n': n, 'seconds': seconds, 'peak_mb': peak / 1e6})
+                log(f"{stage:<30} {n:>10,} {seconds:>10.4f}s {peak / 1e6:>10.1f} MB")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Returns the (stage, n, seconds, baseline seconds) entries slower than baseline * (1 + tolerance)."""
+    reference = {(r['stage'], r['n']): r['seconds'] for r in baseline['results']}
+    regressions = []
+    for r in results:
+        base = reference.get((r['stage'], r['n']))
+        if base is not None and r['seconds'] > base * (1 + tolerance):
+            regressions.append((r['stage'], r['n'], r['seconds'], base))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the AOI processing and rendering stages.")
+    parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES, help="Defect counts, e.g. 10k 1M.")
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES, help="Stages to run.")
+    parser.add_argument('--repeats', type=int, default=3, help="Timing repeats per stage (best is kept).")
+    parser.add_argument('--skew', type=float, default=1.0, help="Defect-type skew of the synthetic lots.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic lots.")
+    parser.add_argument('--max-report-rows', type=int, default=1_000_000,
+                        help="Skip the Excel report above this many defects.")
+    parser.add_argument('-o', '--output', default='benchmark_results.json', help="Results file.")
+    parser.add_argument('--baseline', help="Baseline results file to compare against.")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Allowed slowdown against the baseline (0.25 = 25%%).")
+    parser.add_argument('--save-baseline', help="Also write the results to this baseline file.")
+    args = parser.parse_args(argv)
+
+    log = lambda line: print(line, flush=True)  # noqa: E731
+    log(f"{'stage':<30} {'defects':>10} {'time':>11} {'peak':>13}")
+    results = run_benchmarks([parse_size(s) for s in args.sizes], args.stages, args.repeats,
+                             args.skew, args.seed, args.max_report_rows, log)
+    payload = {
+        'meta': {
+            'python': platform.python_version(), 'platform': platform.platform(),
+            'pandas': pd.__version__, 'numpy': np.__version__,
+            'skew': args.skew, 'seed': args.seed, 'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, 'w') as f:
+            json.dump(payload, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for stage, n, seconds, base in regressions:
+            log(f"REGRESSION {stage} @ {n:,}: {seconds:.4f}s vs baseline {base:.4f}s")
+        if regressions:
+            return 1
+        log(f"No regressions beyond {args.tolerance:.0%} of the baseline.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,21 @@
+import argparse
+import errno
 import os
-import shutil
 import random
+import shutil
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.config import QUADRANT_ORDER, defect_style_map
+from src.synthetic import WRITABLE_EXTENSIONS, check_writable, write_lot
 
 # --- CONFIGURATION ---
+# These are the defaults; every one of them can be overridden on the command line
+# (run `python generate_test_images.py --help`).
 # 1. UPDATE these two lines with the names of your two source photos.
 #    Make sure these photos are in the same directory as this script.
 SOURCE_IMAGE_1 = "photo1.jpg"  # Replace with your first image file
@@ -15,9 +28,115 @@ NUMBER_OF_PAIRS = 500
 # 3. DEFINE the output folder.
 OUTPUT_FOLDER = "images"
 
+# 4. DEFINE the coordinate space (inclusive). Each (x, y) pair is used at most once,
+#    so NUMBER_OF_PAIRS can be at most (X_MAX - X_MIN + 1) * (Y_MAX - Y_MIN + 1).
+X_RANGE = (0, 50)
+Y_RANGE = (0, 50)
+
+# Image pairs handed to one worker at a time; keeps the task queue small for million-file runs.
+BATCH_SIZE = 1000
+
 # --- SCRIPT LOGIC (No changes needed below) ---
 
-def generate_images():
+# Linux FICLONE ioctl: asks copy-on-write filesystems (btrfs, XFS) to share the source blocks.
+_FICLONE = 0x40049409
+
+
+def sample_coordinates(count, x_range, y_range, seed=None):
+    """
+    Draws `count` distinct (x, y) pairs without replacement. Coordinates are sampled
+    as flat indices into the grid, so no retry loop is needed and the grid is never
+    materialized.
+    """
+    width = x_range[1] - x_range[0] + 1
+    height = y_range[1] - y_range[0] + 1
+    if count > width * height:
+        raise ValueError(f"Cannot create {count} unique pairs in a {width}x{height} coordinate space "
+                         f"({width * height} positions).")
+    flat = np.fromiter(random.Random(seed).sample(range(width * height), count), dtype=np.int64, count=count)
+    return flat % width + x_range[0], flat // width + y_range[0]
+
+
+def _reflink(source, dest):
+    import fcntl
+    with open(source, 'rb') as src, open(dest, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+
+
+# Filesystems cap the number of hard links per file (65000 on ext4). When a source hits
+# the cap, one real copy is made and later links point at that copy instead.
+_link_bases = {}
+_link_lock = threading.Lock()
+
+
+def _hardlink(source, dest):
+    base = _link_bases.get(source, source)
+    try:
+        os.link(base, dest)
+    except OSError as e:
+        if e.errno != errno.EMLINK:
+            raise
+        with _link_lock:
+            if _link_bases.get(source, source) == base:
+                shutil.copyfile(source, dest)
+                _link_bases[source] = dest
+                return
+        os.link(_link_bases[source], dest)
+
+
+def _place(source, dest, mode):
+    """Creates `dest` from `source` without copying bytes unless mode is 'copy'."""
+    if os.path.lexists(dest):
+        os.remove(dest)
+    if mode == 'hardlink':
+        _hardlink(source, dest)
+    elif mode == 'symlink':
+        os.symlink(os.path.abspath(source), dest)
+    elif mode == 'reflink':
+        try:
+            _reflink(source, dest)
+        except (OSError, ImportError) as e:
+            if isinstance(e, OSError) and e.errno not in (errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL, errno.ENOTTY):
+                raise
+            # The filesystem cannot share blocks; fall back to a real copy.
+            shutil.copyfile(source, dest)
+    else:
+        shutil.copyfile(source, dest)
+
+
+def sample_quadrants(count, seed=None):
+    """Draws the quadrant of each generated unit; image names and the defect sheet share it."""
+    return np.random.default_rng(seed).choice(QUADRANT_ORDER, size=count)
+
+
+def _place_batch(quadrants, xs, ys, source_1, source_2, output_folder, mode):
+    """Creates the image pairs for one slice of coordinates; paths are built here to keep memory flat."""
+    for quadrant, x, y in zip(quadrants.tolist(), xs.tolist(), ys.tolist()):
+        # Create the new filenames based on our pattern (see src/image_store.py)
+        _place(source_1, os.path.join(output_folder, f"defect_{quadrant}_{x}_{y}_m1.jpg"), mode)
+        _place(source_2, os.path.join(output_folder, f"defect_{quadrant}_{x}_{y}_m2.jpg"), mode)
+    return 2 * len(xs)
+
+
+def write_defect_sheet(path, xs, ys, quadrants, seed=None):
+    """
+    Writes a defect spreadsheet in the schema load_data expects, with one defect per
+    generated image pair so the image set and the data set line up. The format follows
+    the extension (see src.synthetic.write_lot).
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'UNIT_INDEX_X': xs,
+        'UNIT_INDEX_Y': ys,
+        'DEFECT_TYPE': rng.choice(list(defect_style_map), size=len(xs)),
+        'QUADRANT': quadrants,
+    })
+    write_lot(df, path)
+
+
+def generate_images(source_1=SOURCE_IMAGE_1, source_2=SOURCE_IMAGE_2, pairs=NUMBER_OF_PAIRS,
+                    output_folder=OUTPUT_FOLDER, x_range=X_RANGE, y_range=Y_RANGE,
+                    mode='copy', workers=8, seed=None, spreadsheet=None):
     """
     Creates multiple copies of two source images with unique names
     based on a coordinate-based naming convention.
@@ -25,53 +144,76 @@ def generate_images():
     print("Starting test image generation...")
 
     # Check if the source images exist before starting
-    if not os.path.exists(SOURCE_IMAGE_1) or not os.path.exists(SOURCE_IMAGE_2):
+    if not os.path.exists(source_1) or not os.path.exists(source_2):
+        print("\n--- ERROR ---")
+        print(f"Source images not found! Please make sure '{source_1}' and '{source_2}' exist.")
+        print("Aborting.")
+        return False
+
+    try:
+        if spreadsheet:
+            check_writable(spreadsheet)   # before any image is created
+        xs, ys = sample_coordinates(pairs, x_range, y_range, seed)
+        quadrants = sample_quadrants(pairs, seed)
+    except ValueError as e:
         print("\n--- ERROR ---")
-        print(f"Source images not found! Please make sure '{SOURCE_IMAGE_1}' and '{SOURCE_IMAGE_2}' are in the same folder as this script.")
+        print(e)
         print("Aborting.")
-        return
+        return False
 
     # Create the output directory if it doesn't exist
-    if not os.path.exists(OUTPUT_FOLDER):
-        os.makedirs(OUTPUT_FOLDER)
-        print(f"Created output folder: '{OUTPUT_FOLDER}'")
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+        print(f"Created output folder: '{output_folder}'")
 
-    # Keep track of coordinates to ensure they are unique
-    used_coords = set()
     files_created = 0
-
-    while files_created < NUMBER_OF_PAIRS:
-        # Generate random coordinates (e.g., from 0 to 50)
-        x = random.randint(0, 50)
-        y = random.randint(0, 50)
-
-        # Ensure we haven't used this coordinate pair before
-        if (x, y) in used_coords:
-            continue
-        
-        used_coords.add((x, y))
-
-        # Create the new filenames based on our pattern
-        new_filename_1 = f"defect_{x}_{y}_m1.jpg"
-        new_filename_2 = f"defect_{x}_{y}_m2.jpg"
-
-        # Define the full path for the new files
-        dest_path_1 = os.path.join(OUTPUT_FOLDER, new_filename_1)
-        dest_path_2 = os.path.join(OUTPUT_FOLDER, new_filename_2)
-
-        # Copy the source images to the destination with the new names
-        shutil.copy(SOURCE_IMAGE_1, dest_path_1)
-        shutil.copy(SOURCE_IMAGE_2, dest_path_2)
-
-        files_created += 1
-
-        # Print progress to the console
-        if files_created % 50 == 0:
-            print(f"  ...created {files_created * 2} images so far.")
+    report_every = max(2 * pairs // 10, 100)
+    next_report = report_every
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(_place_batch, quadrants[i:i + BATCH_SIZE], xs[i:i + BATCH_SIZE], ys[i:i + BATCH_SIZE],
+                               source_1, source_2, output_folder, mode)
+                   for i in range(0, pairs, BATCH_SIZE)]
+        for future in futures:
+            created = future.result()
+            files_created += created
+            # Print progress to the console
+            if files_created >= next_report:
+                print(f"  ...created {files_created} images so far.")
+                next_report += report_every
+
+    if spreadsheet:
+        write_defect_sheet(spreadsheet, xs, ys, quadrants, seed)
+        print(f"Wrote matching defect data for {pairs} defects to '{spreadsheet}'.")
 
     print("\n--- SUCCESS ---")
-    print(f"Successfully created {files_created * 2} test images in the '{OUTPUT_FOLDER}' folder.")
+    print(f"Successfully created {files_created} test images ({mode}) in the '{output_folder}' folder.")
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate defect_{quadrant}_{x}_{y}_m1/_m2 test image pairs.")
+    parser.add_argument('--source-1', default=SOURCE_IMAGE_1, help="Image used for every _m1 file.")
+    parser.add_argument('--source-2', default=SOURCE_IMAGE_2, help="Image used for every _m2 file.")
+    parser.add_argument('-n', '--pairs', type=int, default=NUMBER_OF_PAIRS, help="Number of image pairs.")
+    parser.add_argument('-o', '--output', default=OUTPUT_FOLDER, help="Output folder.")
+    parser.add_argument('--x-range', type=int, nargs=2, default=X_RANGE, metavar=('MIN', 'MAX'),
+                        help="Inclusive x coordinate range.")
+    parser.add_argument('--y-range', type=int, nargs=2, default=Y_RANGE, metavar=('MIN', 'MAX'),
+                        help="Inclusive y coordinate range.")
+    parser.add_argument('--mode', choices=['copy', 'hardlink', 'symlink', 'reflink'], default='copy',
+                        help="How files are created. Links and reflinks do not duplicate image bytes; "
+                             "reflink falls back to copy where unsupported.")
+    parser.add_argument('-j', '--workers', type=int, default=8, help="Threads used to create files.")
+    parser.add_argument('--seed', type=int, default=None, help="Seed for reproducible coordinates.")
+    parser.add_argument('--spreadsheet', default=None,
+                        help=f"Also write a matching defect file ({', '.join(WRITABLE_EXTENSIONS)}).")
+    args = parser.parse_args(argv)
+
+    ok = generate_images(args.source_1, args.source_2, args.pairs, args.output, tuple(args.x_range),
+                         tuple(args.y_range), args.mode, args.workers, args.seed, args.spreadsheet)
+    return 0 if ok else 1
+
 
 # Run the function
 if __name__ == "__main__":
-    generate_images()
+    sys.exit(main())
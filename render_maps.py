@@ -0,0 +1,13 @@
+# render_maps.py
+
+"""
+Command-line entry point for static defect map packs.
+Example: python render_maps.py lots/ --format pdf -o shift_review.pdf --workers 8
+"""
+
+import sys
+
+from src.static_maps import main
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,184 @@
+# src/aggregates.py
+# This module contains the per-lot aggregates: the layout-independent defect cube that feeds
+# the Pareto, Summary and report views, and the per-unit count matrices behind yield and
+# the defect heatmap.
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from src.config import QUADRANT_ORDER
+from src.instrumentation import timed
+from src.pipeline import quadrant_codes_from_labels
+
+_CELL_KEYS = ['QUADRANT', 'DEFECT_TYPE', 'UNIT_INDEX_X', 'UNIT_INDEX_Y']
+
+
+@dataclass(frozen=True)
+class DefectCube:
+    """
+    Defect counts for one lot, built in a single pass over the defect rows.
+
+    Attributes:
+        cell_counts (pd.Series): Counts indexed by (QUADRANT, DEFECT_TYPE, UNIT_INDEX_X,
+            UNIT_INDEX_Y); only observed combinations are stored.
+        type_counts (pd.DataFrame): Defect type x quadrant count table, zero-filled.
+        defective_cells (pd.Series): Number of distinct defective unit cells per quadrant.
+    """
+    cell_counts: pd.Series
+    type_counts: pd.DataFrame
+    defective_cells: pd.Series
+
+    @property
+    def total(self):
+        return int(self.type_counts.to_numpy().sum())
+
+    def quadrant_total(self, quadrant='All'):
+        """Number of defects in a quadrant, or in the whole lot for 'All'."""
+        if quadrant == 'All':
+            return self.total
+        return int(self.type_counts[quadrant].sum()) if quadrant in self.type_counts else 0
+
+    def defect_counts(self, quadrant='All'):
+        """Defect counts by type for a quadrant (or 'All'), highest first, zero counts dropped."""
+        if quadrant == 'All':
+            counts = self.type_counts.sum(axis=1)
+        elif quadrant in self.type_counts:
+            counts = self.type_counts[quadrant]
+        else:
+            return pd.Series(dtype='int64', name='count')
+        counts = counts[counts > 0].sort_values(ascending=False, kind='stable')
+        return counts.rename('count').rename_axis('DEFECT_TYPE')
+
+    def defective_cell_count(self, quadrant):
+        return int(self.defective_cells.get(quadrant, 0))
+
+
+@timed('aggregates.build_defect_cube')
+def build_defect_cube(df):
+    """
+    Builds the aggregate cube for a parsed lot. Only the quadrant, defect type and unit
+    index columns are read, so the cube is independent of the panel layout.
+    """
+    cell_counts = df.groupby(_CELL_KEYS, observed=True, sort=False, dropna=False).size()
+    defect_order = getattr(df['DEFECT_TYPE'].dtype, 'categories', None)
+    return _cube_from_cell_counts(cell_counts, defect_order)
+
+
+@timed('aggregates.merge_defect_cubes')
+def merge_defect_cubes(cube, other):
+    """
+    Combines the cubes of two disjoint sets of defects, e.g. a lot and rows appended to
+    it. The cost depends on the number of distinct cells, not on the number of defects.
+    """
+    if cube.cell_counts.empty:
+        return other
+    if other.cell_counts.empty:
+        return cube
+    cell_counts = _as_object_levels(cube.cell_counts).add(_as_object_levels(other.cell_counts), fill_value=0).astype('int64')
+    defect_order = list(cube.type_counts.index) + [t for t in other.type_counts.index if t not in cube.type_counts.index]
+    return _cube_from_cell_counts(cell_counts, defect_order)
+
+
+def _as_object_levels(counts):
+    # Categorical levels of two cubes may carry different categories; plain labels align safely.
+    index = counts.index
+    levels = [level.astype(object) if isinstance(level.dtype, pd.CategoricalDtype) else level for level in index.levels]
+    return counts.set_axis(index.set_levels(levels))
+
+
+def _cube_from_cell_counts(cell_counts, defect_order=None):
+    type_counts = (
+        cell_counts.groupby(level=['DEFECT_TYPE', 'QUADRANT'], observed=True, sort=False).sum()
+        .unstack('QUADRANT', fill_value=0)
+    )
+    # Keep the fixed category order on both axes so every view lists types and quadrants consistently.
+    defect_order = [t for t in (defect_order if defect_order is not None else type_counts.index) if t in type_counts.index]
+    quadrants = QUADRANT_ORDER + [q for q in type_counts.columns if q not in QUADRANT_ORDER]
+    type_counts = type_counts.reindex(index=defect_order, columns=quadrants, fill_value=0)
+    type_counts.index = pd.Index(type_counts.index.astype(object), name='DEFECT_TYPE')
+    type_counts.columns = pd.Index(type_counts.columns.astype(object), name='QUADRANT')
+
+    cells = cell_counts.index.droplevel('DEFECT_TYPE').unique()
+    defective_cells = pd.Series(cells.get_level_values('QUADRANT').astype(object)).value_counts()
+
+    return DefectCube(cell_counts=cell_counts, type_counts=type_counts, defective_cells=defective_cells)
+
+
+@dataclass(frozen=True)
+class UnitCounts:
+    """
+    Per-unit-cell defect counts of one lot on a given panel geometry.
+
+    Attributes:
+        by_type (np.ndarray): Counts shaped (defect type, quadrant, row, col); quadrants
+            follow QUADRANT_ORDER, rows UNIT_INDEX_Y and columns UNIT_INDEX_X.
+        defect_types (list): Defect type of each slice of ``by_type``.
+        out_of_range (int): Defects outside the panel geometry or without a quadrant.
+    """
+    by_type: np.ndarray
+    defect_types: list
+    out_of_range: int
+
+    @property
+    def counts(self):
+        """All-type counts shaped (quadrant, row, col)."""
+        return self.by_type.sum(axis=0)
+
+    @property
+    def units_per_quadrant(self):
+        return self.by_type.shape[2] * self.by_type.shape[3]
+
+    def matrix(self, quadrant, defect_type=None):
+        """Count matrix (row, col) of one quadrant, for all types or a single defect type."""
+        q = QUADRANT_ORDER.index(quadrant)
+        if defect_type is None:
+            return self.by_type[:, q].sum(axis=0)
+        return self.by_type[self.defect_types.index(defect_type), q]
+
+    def defective_units(self, quadrant='All'):
+        """Number of unit cells with at least one defect, in a quadrant or the whole panel."""
+        counts = self.counts if quadrant == 'All' else self.matrix(quadrant)
+        return int(np.count_nonzero(counts))
+
+    def unit_yield(self, quadrant='All'):
+        """Share of defect-free unit cells in a quadrant, or across the whole panel for 'All'."""
+        units = self.units_per_quadrant * (len(QUADRANT_ORDER) if quadrant == 'All' else 1)
+        return (units - self.defective_units(quadrant)) / units if units else 0.0
+
+
+@timed('aggregates.build_unit_counts')
+def build_unit_counts(df, panel_rows, panel_cols):
+    """
+    Builds the per-unit count matrices for every defect type and quadrant with a single
+    np.bincount over the linearized (type, quadrant, row, col) index, so the cost is one
+    O(N) pass however many quadrants, types and units there are.
+    """
+    quadrant = quadrant_codes_from_labels(df['QUADRANT']).astype(np.int64)
+    unit_x = df['UNIT_INDEX_X'].to_numpy(dtype=np.float64)
+    unit_y = df['UNIT_INDEX_Y'].to_numpy(dtype=np.float64)
+    defect_type = df['DEFECT_TYPE']
+    if isinstance(defect_type.dtype, pd.CategoricalDtype):
+        type_codes = defect_type.cat.codes.to_numpy().astype(np.int64)
+        defect_types = [str(t) for t in defect_type.cat.categories]
+    else:
+        type_codes, uniques = pd.factorize(defect_type)
+        defect_types = [str(t) for t in uniques]
+
+    # NaN indices fail every comparison and are therefore counted as out of range.
+    valid = ((quadrant >= 0) & (type_codes >= 0)
+             & (unit_x >= 0) & (unit_x < panel_cols) & (unit_y >= 0) & (unit_y < panel_rows))
+    if not valid.all():
+        quadrant, type_codes, unit_x, unit_y = quadrant[valid], type_codes[valid], unit_x[valid], unit_y[valid]
+
+    n_quadrants = len(QUADRANT_ORDER)
+    linear = type_codes * n_quadrants
+    linear += quadrant
+    linear *= panel_rows
+    linear += unit_y.astype(np.int64)
+    linear *= panel_cols
+    linear += unit_x.astype(np.int64)
+    shape = (len(defect_types), n_quadrants, panel_rows, panel_cols)
+    by_type = np.bincount(linear, minlength=int(np.prod(shape))).reshape(shape)
+    return UnitCounts(by_type=by_type, defect_types=defect_types, out_of_range=int(len(valid) - valid.sum()))
@@ -0,0 +1,243 @@
+# src/batch.py
+# This module contains the headless batch pipeline: it turns a directory of AOI lot files
+# into one Excel report per lot plus a combined summary, without any Streamlit UI.
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from src.aggregates import build_defect_cube
+from src.clusters import find_defect_clusters
+from src.config import QUADRANT_ORDER
+from src.history import HistoryStore
+from src.ingest import file_digest, is_supported_file, read_source_bytes
+from src.pipeline import parse_defect_source
+from src.reporting import write_report_file
+
+SUMMARY_FILENAME = 'batch_summary.csv'
+
+
+def find_lots(inputs):
+    """
+    Expands directories and glob patterns into a sorted, de-duplicated list of lot files:
+    those whose extension src.ingest can read (is_supported_file).
+    """
+    lots = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            candidates = [os.path.join(item, name) for name in os.listdir(item)]
+        else:
+            candidates = glob.glob(item)
+        lots.update(
+            os.path.abspath(path) for path in candidates
+            if os.path.isfile(path) and is_supported_file(path)
+            and not os.path.basename(path).startswith('~$')  # Excel lock files
+        )
+    return sorted(lots)
+
+
+def output_stems(lots):
+    """
+    Maps each lot path to the stem its outputs are named after: the path relative to the
+    deepest folder holding every lot, without the extension, with folders joined by '__'
+    (so lots/a.csv gives 'a' and lots/l1/a.csv gives 'l1__a'). Lots that would still share
+    a stem, such as a.csv and a.parquet side by side, keep their extension ('a_csv').
+
+    Raises:
+        ValueError: If two lots still map to the same stem, so neither would overwrite the other's report.
+    """
+    lots = [os.path.abspath(path) for path in lots]
+    if not lots:
+        return {}
+    root = os.path.commonpath([os.path.dirname(path) for path in lots])
+    plain = {path: os.path.splitext(os.path.relpath(path, root))[0].replace(os.sep, '__') for path in lots}
+    shared = {stem for stem, n in Counter(plain.values()).items() if n > 1}
+    stems = {path: f"{stem}_{os.path.splitext(path)[1].lstrip('.').lower()}" if stem in shared else stem
+             for path, stem in plain.items()}
+    clashes = sorted(stem for stem, n in Counter(stems.values()).items() if n > 1)
+    if clashes:
+        raise ValueError(f"Several lots would write the same report: {', '.join(clashes)}. "
+                         f"Rename them or run them in separate batches.")
+    return stems
+
+
+def _output_paths(stem, output_dir):
+    return (os.path.join(output_dir, f"{stem}_report.xlsx"),
+            os.path.join(output_dir, f"{stem}_summary.json"))
+
+
+def is_up_to_date(lot_path, output_dir, stem=None):
+    """
+    A lot is done when its report and summary both exist and are newer than the input.
+    ``stem`` names the outputs (see output_stems); it defaults to the lot's file name.
+    """
+    input_mtime = os.path.getmtime(lot_path)
+    stem = stem or os.path.splitext(os.path.basename(lot_path))[0]
+    return all(os.path.exists(path) and os.path.getmtime(path) >= input_mtime
+               for path in _output_paths(stem, output_dir))
+
+
+def process_lot(lot_path, output_dir, panel_rows, panel_cols, history_path=None, embed_maps=False, stem=None):
+    """
+    Loads one lot, writes its Excel report and returns its summary row.
+    Runs inside a worker process, so it only touches its own output files (and, with
+    ``history_path``, appends the lot's aggregates to the shared history store). With
+    ``embed_maps`` the report also gets static defect map images of the lot. ``stem``
+    names the outputs (see output_stems); it defaults to the lot's file name.
+    """
+    start = time.perf_counter()
+    stem = stem or os.path.splitext(os.path.basename(lot_path))[0]
+    report_path, summary_path = _output_paths(stem, output_dir)
+
+    data = read_source_bytes(lot_path)
+    digest = file_digest(data)
+    df, diagnostics = parse_defect_source(lot_path, data=data, digest=digest)
+    cube = build_defect_cube(df)
+    if history_path:
+        HistoryStore(history_path).add_lot(digest, os.path.basename(lot_path), cube,
+                                           lot_time=os.path.getmtime(lot_path), source=lot_path)
+
+    clusters = find_defect_clusters(df, panel_rows, panel_cols)
+    map_images = None
+    if embed_maps:
+        # Imported here, so batches without maps never load matplotlib.
+        from src.static_maps import render_map_images
+        map_images = render_map_images(df, panel_rows, panel_cols)
+    # Written through a temporary file, so an interrupted or failed run never leaves a
+    # report that a resumed run would mistake for a finished one.
+    write_report_file(report_path, df, panel_rows, panel_cols, cube=cube, clusters=clusters, map_images=map_images)
+
+    top_defects = cube.defect_counts('All')
+    summary = {
+        'lot': os.path.basename(lot_path),
+        'report': os.path.basename(report_path),
+        'total_defects': cube.total,
+        **{quad: cube.quadrant_total(quad) for quad in QUADRANT_ORDER},
+        'top_defect_type': str(top_defects.index[0]) if len(top_defects) else '',
+        'malformed_rows': diagnostics['malformed_rows'],
+        'clusters': clusters.count,
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+    with open(summary_path, 'w') as f:
+        json.dump(summary, f)
+    return summary
+
+
+def _load_summary(stem, output_dir):
+    with open(_output_paths(stem, output_dir)[1]) as f:
+        return json.load(f)
+
+
+def run_batch(lots, output_dir, panel_rows=7, panel_cols=7, workers=None, force=False, history_path=None,
+              embed_maps=False, log=print):
+    """
+    Processes lots across a process pool and writes the combined summary CSV.
+
+    Args:
+        lots (list): Lot file paths.
+        output_dir (str): Directory for reports, per-lot summaries and the combined summary.
+        panel_rows (int): The number of rows in a single panel.
+        panel_cols (int): The number of columns in a single panel.
+        workers (int, optional): Worker process count; defaults to the CPU count.
+        force (bool): Reprocess lots whose outputs are already up to date.
+        history_path (str, optional): History database that processed lots are recorded in.
+        embed_maps (bool): Embed static defect map images in each report.
+        log (callable): Receives one progress line per lot.
+
+    Returns:
+        pd.DataFrame: One summary row per lot, including skipped and failed ones.
+    """
+    stems = output_stems(lots)
+    os.makedirs(output_dir, exist_ok=True)
+    rows = []
+    pending = []
+    for lot_path in lots:
+        stem = stems[os.path.abspath(lot_path)]
+        if not force and is_up_to_date(lot_path, output_dir, stem):
+            rows.append({**_load_summary(stem, output_dir), 'status': 'skipped'})
+        else:
+            pending.append(lot_path)
+
+    total = len(lots)
+    done = len(rows)
+    if done:
+        log(f"Skipping {done} lot(s) with up-to-date reports.")
+
+    def _record(lot_path, future_or_error):
+        nonlocal done
+        done += 1
+        try:
+            row = {**future_or_error(), 'status': 'ok'}
+            log(f"[{done}/{total}] {row['lot']}: {row['total_defects']:,} defects in {row['seconds']:.2f}s")
+        except Exception as e:
+            row = {'lot': os.path.basename(lot_path), 'report': _output_paths(stems[os.path.abspath(lot_path)], '')[0],
+                   'status': 'failed', 'error': str(e)}
+            log(f"[{done}/{total}] {row['lot']}: FAILED ({e})")
+        rows.append(row)
+
+    if workers == 1 or len(pending) <= 1:
+        for lot_path in pending:
+            _record(lot_path, lambda: process_lot(lot_path, output_dir, panel_rows, panel_cols, history_path, embed_maps,
+                                                  stems[os.path.abspath(lot_path)]))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(process_lot, lot_path, output_dir, panel_rows, panel_cols, history_path, embed_maps,
+                                   stems[os.path.abspath(lot_path)]): lot_path
+                       for lot_path in pending}
+            for future in as_completed(futures):
+                _record(futures[future], future.result)
+
+    summary_df = pd.DataFrame(rows).sort_values(['lot', 'report'], kind='stable').reset_index(drop=True)
+    # Failed lots have no counts; nullable integers keep the other rows from turning into floats.
+    count_columns = [col for col in ['total_defects'] + QUADRANT_ORDER + ['malformed_rows', 'clusters'] if col in summary_df.columns]
+    summary_df[count_columns] = summary_df[count_columns].astype('Int64')
+    summary_df.to_csv(os.path.join(output_dir, SUMMARY_FILENAME), index=False)
+    return summary_df
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate Excel defect reports for a batch of AOI lot files.")
+    parser.add_argument('inputs', nargs='+', help="Lot files, directories or glob patterns.")
+    parser.add_argument('-o', '--output-dir', default='reports', help="Output directory (default: reports).")
+    parser.add_argument('--panel-rows', type=int, default=7, help="Rows in a single panel (default: 7).")
+    parser.add_argument('--panel-cols', type=int, default=7, help="Columns in a single panel (default: 7).")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="Worker processes (default: CPU count).")
+    parser.add_argument('--force', action='store_true', help="Reprocess lots whose reports are already up to date.")
+    parser.add_argument('--history', metavar='DB', default=None,
+                        help="Also record processed lots in this history database (see the Trend View).")
+    parser.add_argument('--embed-maps', action='store_true',
+                        help="Embed static defect map images (All and Q1-Q4) in each report.")
+    args = parser.parse_args(argv)
+
+    lots = find_lots(args.inputs)
+    if not lots:
+        print("No lot files found.", file=sys.stderr)
+        return 1
+
+    start = time.perf_counter()
+    print(f"Processing {len(lots)} lot(s) into '{args.output_dir}'...")
+    try:
+        summary_df = run_batch(lots, args.output_dir, args.panel_rows, args.panel_cols,
+                               workers=args.workers, force=args.force, history_path=args.history,
+                               embed_maps=args.embed_maps,
+                               log=lambda line: print(line, flush=True))
+    except ValueError as e:   # Lots whose outputs would overwrite each other (see output_stems).
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    statuses = summary_df['status'].value_counts()
+    failed = int(statuses.get('failed', 0))
+    print(f"Finished in {time.perf_counter() - start:.1f}s: {statuses.get('ok', 0)} processed, "
+          f"{statuses.get('skipped', 0)} skipped, {failed} failed. "
+          f"Summary written to {os.path.join(args.output_dir, SUMMARY_FILENAME)}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
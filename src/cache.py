@@ -0,0 +1,122 @@
+# src/cache.py
+# This module contains the small in-process caches shared by the data and view layers.
+
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    A thread-safe mapping bounded by entry count and, optionally, by total size.
+
+    Eviction policy: whenever an insert pushes the cache over either bound, the
+    least-recently-used entries (by get or put) are dropped until both bounds hold
+    again, except that the entry inserted last is never dropped by its own insert: an
+    item that on its own exceeds ``max_bytes`` stays cached, alone, until the next put
+    (see _oversize), so it is not thrown away as soon as it is stored.
+    ``on_evict(key, value)`` is called for every dropped entry (not for pop or clear),
+    after the lock is released.
+    """
+
+    def __init__(self, max_entries=8, max_bytes=None, sizeof=None, on_evict=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof or (lambda value: 0)
+        self._on_evict = on_evict
+        self._items = OrderedDict()   # key -> (value, size)
+        self._lock = threading.RLock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return self._items[key][0]
+
+    def peek(self, key, default=None):
+        """Looks up a key without touching its recency or the hit/miss counters."""
+        with self._lock:
+            item = self._items.get(key)
+            return item[0] if item is not None else default
+
+    def put(self, key, value):
+        size = self._sizeof(value)
+        with self._lock:
+            if key in self._items:
+                self.nbytes -= self._items.pop(key)[1]
+            self._items[key] = (value, size)
+            self.nbytes += size
+            evicted = self._evict()
+        if self.max_bytes is not None and size > self.max_bytes:
+            self._oversize(key, size)
+        self._notify(evicted)
+
+    def _oversize(self, key, size):
+        """Called (outside the lock) when an item larger than ``max_bytes`` is put. Subclasses may report it."""
+
+    def resize(self, key):
+        """Re-measures an entry whose value has grown in place, evicting others if needed."""
+        with self._lock:
+            if key not in self._items:
+                return
+            value, size = self._items[key]
+            new_size = self._sizeof(value)
+            self._items[key] = (value, new_size)
+            self.nbytes += new_size - size
+            evicted = self._evict()
+        self._notify(evicted)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            value, size = self._items.pop(key)
+            self.nbytes -= size
+            return value
+
+    def _evict(self):
+        evicted = []
+        # The most recent entry is kept even when it alone is over the byte budget.
+        while len(self._items) > 1 and (
+            len(self._items) > self.max_entries
+            or (self.max_bytes is not None and self.nbytes > self.max_bytes)
+        ):
+            key, (value, size) = self._items.popitem(last=False)
+            self.nbytes -= size
+            self.evictions += 1
+            evicted.append((key, value))
+        return evicted
+
+    def _notify(self, evicted):
+        if self._on_evict is not None:
+            for key, value in evicted:
+                self._on_evict(key, value)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        """Returns the counters used to size the cache."""
+        with self._lock:
+            return {'entries': len(self._items), 'bytes': self.nbytes, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions}
+
+    def keys(self):
+        """A snapshot of the keys, least recently used first."""
+        with self._lock:
+            return list(self._items)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def __len__(self):
+        return len(self._items)
@@ -0,0 +1,191 @@
+# src/clusters.py
+# This module contains the spatial cluster detection: defects are hashed into grid cells
+# (unit cells, or square cells over X/Y_COORDINATES) and touching occupied cells are joined
+# into clusters by connected-component labelling, so no pairwise distances are computed.
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from src.config import CLUSTER_MIN_DEFECTS, CLUSTER_CELL_SIZE, QUADRANT_ORDER
+from src.instrumentation import timed
+from src.pipeline import quadrant_codes_from_labels
+
+CLUSTER_MODES = ('units', 'coordinates')
+
+_TABLE_COLUMNS = ['CLUSTER_ID', 'DEFECTS', 'CELLS', 'DOMINANT_TYPE', 'QUADRANTS', 'X_MIN', 'X_MAX', 'Y_MIN', 'Y_MAX']
+
+
+@dataclass(frozen=True)
+class DefectClusters:
+    """
+    Clusters found in one lot.
+
+    Attributes:
+        labels (np.ndarray): Cluster ID of every defect row (int32, aligned with the frame
+            the clusters were built from); 0 for defects outside any cluster.
+        table (pd.DataFrame): One row per cluster, largest first: CLUSTER_ID, DEFECTS,
+            CELLS (occupied grid cells), DOMINANT_TYPE, QUADRANTS and the bounding box
+            X_MIN/X_MAX/Y_MIN/Y_MAX. In 'units' mode the box is in panel-wide unit
+            column/row indices (the Defect View axis labels), otherwise in coordinates.
+        mode (str): 'units' or 'coordinates'.
+    """
+    labels: np.ndarray
+    table: pd.DataFrame
+    mode: str
+
+    @property
+    def count(self):
+        return len(self.table)
+
+    @property
+    def clustered_defects(self):
+        return int(np.count_nonzero(self.labels))
+
+
+def _connected_components(n_nodes, a, b):
+    """
+    Labels the connected components of a graph given as edge arrays (a[i], b[i]).
+    Vectorized union-find: every round hooks the larger root of each cross-component edge
+    onto the smaller one, then pointer jumping flattens the trees.
+
+    Returns:
+        np.ndarray: The smallest node number of each node's component.
+    """
+    parent = np.arange(n_nodes)
+    while True:
+        root_a, root_b = parent[a], parent[b]
+        linked = root_a != root_b
+        if not linked.any():
+            return parent
+        np.minimum.at(parent, np.maximum(root_a, root_b)[linked], np.minimum(root_a, root_b)[linked])
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+
+
+def _label_cells(cell_x, cell_y, min_cell_defects, min_defects):
+    """
+    Groups points by grid cell and joins 8-connected occupied cells.
+
+    Returns:
+        tuple: (cluster ID per point, number of cells per cluster). IDs run from 1 in
+        order of decreasing cluster size; 0 marks points outside any cluster.
+    """
+    cell_x = cell_x - cell_x.min()
+    cell_y = cell_y - cell_y.min()
+    # One spare row per column, so stepping a row up or down never lands in another column.
+    height = int(cell_y.max()) + 2
+    keys = cell_x * height + cell_y
+    cells, point_cell, cell_counts = np.unique(keys, return_inverse=True, return_counts=True)
+
+    dense = np.flatnonzero(cell_counts >= min_cell_defects)
+    dense_keys = cells[dense]
+    if not len(dense_keys):
+        return np.zeros(len(keys), dtype=np.int32), np.zeros(0, dtype=np.int64)
+    edges_a, edges_b = [], []
+    # Half of the 8-neighbourhood; the other half is covered from the neighbour's side.
+    for offset in (1, height - 1, height, height + 1):
+        neighbour = dense_keys + offset
+        position = np.minimum(np.searchsorted(dense_keys, neighbour), len(dense_keys) - 1)
+        found = dense_keys[position] == neighbour
+        edges_a.append(np.flatnonzero(found))
+        edges_b.append(position[found])
+    component = _connected_components(len(dense_keys), np.concatenate(edges_a), np.concatenate(edges_b))
+
+    sizes = np.bincount(component, weights=cell_counts[dense], minlength=len(dense_keys))
+    roots = np.flatnonzero(sizes >= min_defects)
+    roots = roots[np.argsort(-sizes[roots], kind='stable')]
+    root_id = np.zeros(len(dense_keys), dtype=np.int32)
+    root_id[roots] = np.arange(1, len(roots) + 1, dtype=np.int32)
+
+    cell_id = np.zeros(len(cells), dtype=np.int32)
+    cell_id[dense] = root_id[component]
+    cells_per_cluster = np.bincount(cell_id, minlength=len(roots) + 1)[1:]
+    return cell_id[point_cell], cells_per_cluster
+
+
+@timed('clusters.find_defect_clusters')
+def find_defect_clusters(df, panel_rows, panel_cols, mode='units', cell_size=CLUSTER_CELL_SIZE,
+                         min_defects=CLUSTER_MIN_DEFECTS, min_cell_defects=1):
+    """
+    Finds spatial defect clusters in a parsed lot.
+
+    Args:
+        df (pd.DataFrame): Parsed defect table (QUADRANT, UNIT_INDEX_X/Y, DEFECT_TYPE and,
+            for 'coordinates', X/Y_COORDINATES).
+        panel_rows (int): The number of rows in a single panel.
+        panel_cols (int): The number of columns in a single panel.
+        mode (str): 'units' joins defective unit cells that touch within a quadrant;
+            'coordinates' hashes X/Y_COORDINATES into square cells of ``cell_size``.
+        cell_size (float): Grid cell size in coordinate units ('coordinates' only).
+        min_defects (int): Smallest number of defects reported as a cluster.
+        min_cell_defects (int): Cells with fewer defects are treated as empty, so sparse
+            background defects do not bridge clusters together.
+
+    Returns:
+        DefectClusters: Labels for every row plus the per-cluster table.
+    """
+    if mode not in CLUSTER_MODES:
+        raise ValueError(f"Unknown cluster mode '{mode}'; expected one of {', '.join(CLUSTER_MODES)}")
+    labels = np.zeros(len(df), dtype=np.int32)
+    quadrant = quadrant_codes_from_labels(df['QUADRANT'])
+    unit_x = df['UNIT_INDEX_X'].to_numpy(dtype=np.float64)
+    unit_y = df['UNIT_INDEX_Y'].to_numpy(dtype=np.float64)
+
+    if mode == 'units':
+        valid = (quadrant >= 0) & ~np.isnan(unit_x) & ~np.isnan(unit_y)
+        box_x = unit_x + (quadrant % 2) * panel_cols
+        box_y = unit_y + (quadrant // 2) * panel_rows
+        if valid.any():
+            # A spare column and row between quadrants keeps clusters from crossing the gap.
+            stride_x = int(unit_x[valid].max()) + 2
+            stride_y = int(unit_y[valid].max()) + 2
+            cell_x = (unit_x[valid] + (quadrant[valid] % 2) * stride_x).astype(np.int64)
+            cell_y = (unit_y[valid] + (quadrant[valid] // 2) * stride_y).astype(np.int64)
+    else:
+        box_x = df['X_COORDINATES'].to_numpy(dtype=np.float64)
+        box_y = df['Y_COORDINATES'].to_numpy(dtype=np.float64)
+        valid = ~np.isnan(box_x) & ~np.isnan(box_y)
+        if valid.any():
+            cell_x = np.floor(box_x[valid] / cell_size).astype(np.int64)
+            cell_y = np.floor(box_y[valid] / cell_size).astype(np.int64)
+
+    if not valid.any():
+        return DefectClusters(labels, pd.DataFrame(columns=_TABLE_COLUMNS), mode)
+    labels[valid], cells_per_cluster = _label_cells(cell_x, cell_y, min_cell_defects, min_defects)
+    table = _cluster_table(df, labels, quadrant, box_x, box_y, cells_per_cluster)
+    if mode == 'units':
+        table[['X_MIN', 'X_MAX', 'Y_MIN', 'Y_MAX']] = table[['X_MIN', 'X_MAX', 'Y_MIN', 'Y_MAX']].astype(np.int64)
+    return DefectClusters(labels, table, mode)
+
+
+def _cluster_table(df, labels, quadrant, box_x, box_y, cells_per_cluster):
+    """Per-cluster statistics; counts come from np.bincount over combined (cluster, code) keys."""
+    n_clusters = len(cells_per_cluster)
+    defect_type = df['DEFECT_TYPE'].astype('category')
+    type_codes = defect_type.cat.codes.to_numpy().astype(np.int64)
+    n_types = max(len(defect_type.cat.categories), 1)
+    known = type_codes >= 0
+    type_counts = np.bincount(labels[known] * n_types + type_codes[known],
+                              minlength=(n_clusters + 1) * n_types).reshape(n_clusters + 1, n_types)[1:]
+    placed = quadrant >= 0
+    quadrant_counts = np.bincount(labels[placed] * len(QUADRANT_ORDER) + quadrant[placed],
+                                  minlength=(n_clusters + 1) * len(QUADRANT_ORDER)).reshape(n_clusters + 1, -1)[1:]
+
+    member = labels > 0
+    bounds = pd.DataFrame({'X': box_x[member], 'Y': box_y[member]}).groupby(labels[member], sort=True)
+    bounds = bounds.agg(['min', 'max'])
+    table = pd.DataFrame({
+        'CLUSTER_ID': np.arange(1, n_clusters + 1),
+        'DEFECTS': np.bincount(labels, minlength=n_clusters + 1)[1:],
+        'CELLS': cells_per_cluster,
+        'DOMINANT_TYPE': defect_type.cat.categories.astype(str).to_numpy()[type_counts.argmax(axis=1)] if n_clusters else [],
+        'QUADRANTS': [', '.join(q for q, n in zip(QUADRANT_ORDER, row) if n) for row in quadrant_counts],
+        'X_MIN': bounds[('X', 'min')].to_numpy(), 'X_MAX': bounds[('X', 'max')].to_numpy(),
+        'Y_MIN': bounds[('Y', 'min')].to_numpy(), 'Y_MAX': bounds[('Y', 'max')].to_numpy(),
+    })
+    return table[_TABLE_COLUMNS]
@@ -1,6 +1,8 @@
 # src/config.py
 # This module contains all configuration and styling variables for the application.
 
+import os
+
 # --- Style Theme: Post-Etch AOI Panel ---
 # This palette is designed to look like a copper-clad panel from the PCB/IC Substrate industry.
 
@@ -17,3 +19,96 @@ defect_style_map = {
     'Cut/Short': '#00BFFF', 'Nick/Protrusion': 'yellow'
 }
 
+
+# --- Data Ingestion ---
+# Columns the application reads from a defect file; everything else is skipped at parse time.
+REQUIRED_COLUMNS = ['UNIT_INDEX_X', 'UNIT_INDEX_Y', 'DEFECT_TYPE']
+OPTIONAL_COLUMNS = ['QUADRANT', 'X_COORDINATES', 'Y_COORDINATES']
+NEEDED_COLUMNS = REQUIRED_COLUMNS + OPTIONAL_COLUMNS
+
+# Root of every on-disk cache (columnar copies, spilled lots, reports, image index). It defaults to
+# .aoi_cache/ next to the application rather than the working directory the server was started from.
+CACHE_DIR = os.environ.get('AOI_CACHE_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.aoi_cache'))
+# Content-hash keyed columnar copies of uploaded workbooks and CSVs.
+COLUMNAR_CACHE_DIR = os.path.join(CACHE_DIR, 'columnar')
+COLUMNAR_CACHE_MAX_BYTES = 4 * 1024 * 1024 * 1024  # 4 GiB on disk; least recently read copies are deleted first
+
+# --- Parsed Data Cache ---
+# Parsed, validated lots are kept in a process-wide registry keyed by file content hash and
+# shared by all sessions. The byte budget covers the frames and the arrays derived from them.
+PARSED_CACHE_MAX_ENTRIES = 8
+PARSED_CACHE_MAX_BYTES = int(os.environ.get('AOI_MEMORY_BUDGET_MB', 1024)) * 1024 * 1024  # 1 GiB by default
+# Lots evicted from memory are spilled here as Feather files and reloaded on the next upload.
+DATASET_SPILL_DIR = os.path.join(CACHE_DIR, 'lots')
+DATASET_SPILL_MAX_BYTES = 8 * 1024 * 1024 * 1024  # 8 GiB on disk; oldest lots are deleted first
+
+# --- Compact Storage ---
+# Fixed category order for the categorical columns; values not listed here are appended in sorted order.
+QUADRANT_ORDER = ['Q1', 'Q2', 'Q3', 'Q4']
+# Coordinates are stored as float32 only if no value moves by more than this amount.
+COORDINATE_TOLERANCE = 1e-3
+
+# --- Defect Map Rendering ---
+# Above this many defects the map switches from individual WebGL points to per-cell counts.
+RENDER_POINT_THRESHOLD = 50000
+# Built dashboard figures are memoized per (lot, view, quadrant, geometry, theme) for all sessions.
+FIGURE_CACHE_ENTRIES = 64
+FIGURE_CACHE_MAX_BYTES = 256 * 1024 * 1024  # 256 MiB of figure data (see figure_data_bytes)
+
+# --- Background Precompute ---
+# Worker threads shared by all sessions for warming a lot's aggregates, figures and report.
+WARMUP_WORKERS = 2
+# How often the sidebar checks on unfinished precompute tasks.
+WARMUP_POLL_SECONDS = 1.0
+
+# --- Reporting ---
+# Reports for lots with more defects than this are built in a temporary file instead of RAM.
+REPORT_SPILL_ROWS = 200000
+# The app keeps such reports, and every report the warm-up builds, as files here, read only when downloaded.
+REPORT_DIR = os.path.join(CACHE_DIR, 'reports')
+REPORT_FILES_KEPT = 8  # most recently used report files; older ones are deleted
+
+# --- Defect Images ---
+# Folder holding the defect_{quadrant}_{x}_{y}_m1/_m2 (or defect_{x}_{y}_m1/_m2) review image pairs
+# (see src/image_store.py).
+IMAGE_DIR = os.environ.get('AOI_IMAGE_DIR', 'images')
+THUMBNAIL_SIZE = (320, 320)
+THUMBNAIL_CACHE_ENTRIES = 512
+
+# --- Performance Instrumentation ---
+# JSON-lines file the sidebar "Performance" panel appends recorded reruns to.
+PERF_LOG_PATH = os.environ.get('AOI_PERF_LOG', 'perf_log.jsonl')
+
+# --- Live Ingestion ---
+# Folder or append-only CSV/JSONL file that watch mode follows (empty: start in upload mode).
+LIVE_SOURCE = os.environ.get('AOI_LIVE_SOURCE', '')
+# Seconds between polls of the watched source.
+LIVE_POLL_SECONDS = 5
+# Files in a watched folder are read only once they have not been modified for this long.
+LIVE_SETTLE_SECONDS = 2
+
+# --- Lot History ---
+# SQLite file holding the per-lot aggregates behind the Trend View.
+HISTORY_DB_PATH = os.environ.get('AOI_HISTORY_DB', 'aoi_history.sqlite')
+# Time window the Trend View opens with.
+TREND_DEFAULT_DAYS = 180
+
+# --- Excel Streaming ---
+# Rows of an .xlsx sheet converted to compact arrays at a time.
+XLSX_CHUNK_ROWS = 20000
+# Malformed rows listed by row number in the load diagnostics (all of them are counted).
+MALFORMED_ROW_EXAMPLES = 20
+
+# --- Cluster Detection ---
+# Smallest group of touching defective cells reported as a cluster.
+CLUSTER_MIN_DEFECTS = 5
+# Grid cell size, in X/Y_COORDINATES units, when clustering by coordinates.
+CLUSTER_CELL_SIZE = 500.0
+# Largest clusters outlined on the defect map; the full list is in the table and report.
+CLUSTER_OVERLAY_MAX = 50
+
+# --- Static Map Rendering ---
+# Defect map images for review packs and reports (see src/static_maps.py).
+MAP_QUADRANTS = ['All'] + QUADRANT_ORDER
+MAP_FIGURE_SIZE = (9.0, 7.0)  # inches, including the legend
+MAP_DPI = 110
@@ -1,93 +1,267 @@
 # src/data_handler.py
+# Streamlit adapter around src/pipeline.py: it owns the parsed-lot cache and turns
+# pipeline errors and diagnostics into UI messages.
+
+import threading
 
 import pandas as pd
-import numpy as np
 import streamlit as st
 
-def derive_quadrants(df):
+from src.aggregates import build_defect_cube, build_unit_counts
+from src.cache import LRUCache
+from src.clusters import find_defect_clusters
+from src.config import (
+    PARSED_CACHE_MAX_ENTRIES, PARSED_CACHE_MAX_BYTES, DATASET_SPILL_DIR, DATASET_SPILL_MAX_BYTES, HISTORY_DB_PATH
+)
+from src.history import HistoryStore
+from src.ingest import read_source_bytes, file_digest
+from src.instrumentation import count, span
+from src.live import LiveFeed
+from src.pipeline import (  # noqa: F401  (re-exported for existing callers)
+    DefectDataError, assign_quadrants, calculate_plot_coords, normalize_dtypes,
+    parse_defect_source, process_defect_table, project_layout, quadrant_codes
+)
+from src.registry import DatasetRegistry
+from src.spatial import CellIndex
+
+# Level 1 cache: parsed, validated lots keyed by file content hash (layout independent),
+# shared by every session. Each entry is a dict holding the compact frame ('df'), its
+# pipeline diagnostics ('diagnostics'), the aggregate cube ('cube') and the results
+# derived from it so far ('projected', 'clusters', 'unit_counts', 'cell_index', each
+# keyed by its parameters), so derived results are evicted together with the data.
+# Sessions and warm-up workers share the entries, so the derived dicts are only read or
+# changed under _DERIVED_LOCK. It is taken inside the registry's own lock (via sizeof),
+# so no registry method may be called while holding it.
+_DERIVED_LOCK = threading.Lock()
+
+def _entry_bytes(entry):
+    """Memory held by a cached lot: its frame plus the columns and arrays derived from it."""
+    with _DERIVED_LOCK:
+        projected = list(entry.get('projected', {}).values())
+        clusters = list(entry.get('clusters', {}).values())
+        indexes = list(entry.get('cell_index', {}).values())
+    size = entry['diagnostics']['after_bytes']
+    for frame in projected:
+        size += frame['PLOT_X'].nbytes + frame['PLOT_Y'].nbytes   # the other columns are shared with 'df'
+    for found in clusters:
+        size += found.labels.nbytes
+    for index in indexes:
+        size += index.rows.nbytes + index.offsets.nbytes
+    return size
+
+def _restore_entry(df, diagnostics):
+    # Derived results are not spilled; they are rebuilt on demand after a reload.
+    return {'df': df, 'diagnostics': diagnostics, 'cube': build_defect_cube(df)}
+
+_PARSED_CACHE = DatasetRegistry(max_entries=PARSED_CACHE_MAX_ENTRIES, max_bytes=PARSED_CACHE_MAX_BYTES,
+                                sizeof=_entry_bytes, restore=_restore_entry,
+                                spill_dir=DATASET_SPILL_DIR, spill_max_bytes=DATASET_SPILL_MAX_BYTES)
+
+def parse_data(uploaded_file):
+    """
+    Reads, validates and derives quadrants for an uploaded file. Nothing here depends
+    on the panel geometry, so the result is cached by the file's content hash.
+
+    Returns:
+        tuple: (content hash, parsed DataFrame). The frame is empty if parsing failed.
+    """
+    if uploaded_file is None:
+        return None, pd.DataFrame()
+
+    # The upload's digest is remembered per session, so reruns with the same upload
+    # skip re-reading and re-hashing the file.
+    file_id = getattr(uploaded_file, 'file_id', None)
+    known = st.session_state.get('upload_digest')
+    data = None
+    if file_id is not None and known is not None and known[0] == file_id:
+        digest = known[1]
+    else:
+        with span('data_handler.hash_upload'):
+            data = read_source_bytes(uploaded_file)
+            digest = file_digest(data)
+        if file_id is not None:
+            st.session_state['upload_digest'] = (file_id, digest)
+    cached = _PARSED_CACHE.get(digest)
+    if cached is not None:
+        count('parsed_cache.hit')
+        return digest, cached['df']
+    count('parsed_cache.miss')
+    if data is None:
+        data = read_source_bytes(uploaded_file)
+
+    progress_bar = None
+
+    def report_progress(rows_read, total_rows):
+        # Only streamed Excel files report progress; other formats load in one step.
+        nonlocal progress_bar
+        if progress_bar is None:
+            progress_bar = st.progress(0.0)
+        fraction = min(rows_read / total_rows, 1.0) if total_rows else 0.0
+        total = f" of {total_rows:,}" if total_rows else ""
+        progress_bar.progress(fraction, text=f"Reading rows: {rows_read:,}{total}")
+
+    try:
+        with span('data_handler.parse'):
+            df, diagnostics = parse_defect_source(uploaded_file, data=data, digest=digest,
+                                                  progress=report_progress)
+            cube = build_defect_cube(df)
+
+    except DefectDataError as e:
+        st.error(f"Error: {e}")
+        return digest, pd.DataFrame()
+    except Exception as e:
+        st.error(f"An error occurred while processing the data file: {e}")
+        return digest, pd.DataFrame()
+    finally:
+        if progress_bar is not None:
+            progress_bar.empty()
+
+    if diagnostics['quadrants_derived'] and diagnostics['quadrant_midpoint'] is not None:
+        st.success("Successfully derived defect quadrants from X/Y coordinates.")
+    if diagnostics['unknown_quadrants']:
+        st.warning(f"{diagnostics['unknown_quadrants']:,} defects could not be placed in a quadrant and are labelled 'Unknown'.")
+    if diagnostics['malformed_rows']:
+        examples = ", ".join(f"row {row} ({reason})" for row, reason in diagnostics['malformed_examples'])
+        more = diagnostics['malformed_rows'] - len(diagnostics['malformed_examples'])
+        st.warning(f"{diagnostics['malformed_rows']:,} malformed rows were skipped: {examples}"
+                   + (f" and {more:,} more." if more else "."))
+        if not diagnostics['rows']:
+            st.error("No valid defect rows remain after skipping the malformed rows.")
+            return digest, df
+    # Only successful parses are cached, so a bad file (including one whose every row is
+    # malformed) reports its errors on every rerun.
+    _PARSED_CACHE.put(digest, {'df': df, 'diagnostics': diagnostics, 'cube': cube})
+    return digest, df
+
+def get_memory_report(digest):
+    """Returns the pipeline diagnostics (including before/after bytes) of a cached lot, or None."""
+    entry = _PARSED_CACHE.peek(digest)
+    return entry['diagnostics'] if entry is not None else None
+
+def load_data(uploaded_file, panel_rows, panel_cols, gap_size):
     """
-    Derives the QUADRANT column from X_COORDINATES and Y_COORDINATES if it doesn't exist.
-    It finds the center of the defect cloud and assigns quadrants based on that center.
+    Loads data, derives quadrants if necessary, and calculates plot coordinates.
+    Accepts Excel, CSV, Parquet and Feather files (see src/ingest.py).
+
+    Parsing goes through the content-hash cache in parse_data, so changing the panel
+    layout only re-runs the cheap projection stage and never touches the file again.
     """
-    if 'X_COORDINATES' not in df.columns or 'Y_COORDINATES' not in df.columns:
-        st.error("Cannot derive quadrants because 'X_COORDINATES' or 'Y_COORDINATES' are missing.")
+    digest, df = parse_data(uploaded_file)
+    if df.empty:
         return df
+    # --- Data Transformation Step ---
+    return get_projected_frame(digest, df, panel_rows, panel_cols, gap_size)
 
-    # Find the midpoint of the entire dataset
-    x_midpoint = (df['X_COORDINATES'].min() + df['X_COORDINATES'].max()) / 2
-    y_midpoint = (df['Y_COORDINATES'].min() + df['Y_COORDINATES'].max()) / 2
-
-    # Define conditions for each quadrant based on the midpoint
-    conditions = [
-        (df['X_COORDINATES'] <= x_midpoint) & (df['Y_COORDINATES'] <= y_midpoint),  # Q1 (Bottom-Left)
-        (df['X_COORDINATES'] > x_midpoint)  & (df['Y_COORDINATES'] <= y_midpoint),  # Q2 (Bottom-Right)
-        (df['X_COORDINATES'] <= x_midpoint) & (df['Y_COORDINATES'] > y_midpoint),   # Q3 (Top-Left)
-        (df['X_COORDINATES'] > x_midpoint)  & (df['Y_COORDINATES'] > y_midpoint)    # Q4 (Top-Right)
-    ]
-    
-    # Define the corresponding quadrant labels
-    quadrant_labels = ['Q1', 'Q2', 'Q3', 'Q4']
-    
-    # Use numpy.select to efficiently assign the quadrant labels
-    df['QUADRANT'] = np.select(conditions, quadrant_labels, default='Unknown')
-    
-    st.success("Successfully derived defect quadrants from X/Y coordinates.")
-    return df
-
-def calculate_plot_coords(df, panel_rows, panel_cols, gap_size):
+def get_defect_cube(digest, df=None):
     """
-    Calculates the global plot coordinates (PLOT_X, PLOT_Y) based on quadrant and unit indices.
+    Returns the aggregate cube cached with a lot. If the lot has been evicted, the cube
+    is rebuilt from ``df`` when given, otherwise None is returned.
     """
-    # Define offsets for each quadrant
-    q2_x_offset = panel_cols + gap_size
-    q3_y_offset = panel_rows + gap_size
-    q4_x_offset = panel_cols + gap_size
-    q4_y_offset = panel_rows + gap_size
-
-    # Add 0.5 to center the defect marker within its unit cell
-    df['PLOT_X'] = df['UNIT_INDEX_X'] + 0.5
-    df['PLOT_Y'] = df['UNIT_INDEX_Y'] + 0.5
-
-    # Apply offsets based on the (now guaranteed) QUADRANT column
-    df.loc[df['QUADRANT'] == 'Q2', 'PLOT_X'] += q2_x_offset
-    df.loc[df['QUADRANT'] == 'Q3', 'PLOT_Y'] += q3_y_offset
-    df.loc[df['QUADRANT'] == 'Q4', 'PLOT_X'] += q4_x_offset
-    df.loc[df['QUADRANT'] == 'Q4', 'PLOT_Y'] += q4_y_offset
-    
-    return df
-
-# Use caching to improve performance on re-runs
-@st.cache_data
-def load_data(uploaded_file, panel_rows, panel_cols, gap_size):
+    entry = _PARSED_CACHE.peek(digest)
+    if entry is not None:
+        return entry['cube']
+    return build_defect_cube(df) if df is not None else None
+
+# Results derived from lots that are not in the parsed cache (watched lots) are kept here instead.
+# A watched lot gets a new key with every append, so load_live drops the results of its
+# earlier versions (see _drop_stale_derived) rather than leaving them to age out.
+_DERIVED_CACHE = LRUCache(max_entries=16)
+
+def _drop_stale_derived(key_prefix, current_key):
+    """Drops the derived results of every version of a watched lot except ``current_key``."""
+    for key in _DERIVED_CACHE.keys():
+        digest = key[0]
+        if digest != current_key and digest.startswith(key_prefix):
+            _DERIVED_CACHE.pop(key)
+
+def _derived(digest, kind, params, build):
     """
-    Loads data, derives quadrants if necessary, and calculates plot coordinates.
+    Returns a result derived from a lot, computed once per parameter set and cached
+    with the lot's parsed data under entry[kind][params].
+
+    ``build()`` runs outside the lock; if another thread stored the same result in the
+    meantime, that one is kept and returned, so every caller sees a single instance.
     """
-    if uploaded_file is None:
-        return pd.DataFrame()
+    entry = _PARSED_CACHE.peek(digest)
+    if entry is not None:
+        with _DERIVED_LOCK:
+            value = entry.get(kind, {}).get(params)
+        if value is not None:
+            return value
+        value = build()
+        with _DERIVED_LOCK:
+            found = entry.setdefault(kind, {})
+            stored = params in found
+            value = found.setdefault(params, value)
+        if not stored:
+            _PARSED_CACHE.resize(digest)
+        return value
+    key = (digest, kind, params)
+    value = _DERIVED_CACHE.get(key)
+    if value is None:
+        value = build()
+        with _DERIVED_LOCK:
+            # Re-checked so two concurrent builds still leave one shared result.
+            existing = _DERIVED_CACHE.peek(key)
+            if existing is None:
+                _DERIVED_CACHE.put(key, value)
+            else:
+                value = existing
+    return value
 
-    try:
-        df = pd.read_excel(uploaded_file)
-        
-        # --- Data Validation ---
-        # We now check for the columns needed for derivation.
-        base_required_columns = ['UNIT_INDEX_X', 'UNIT_INDEX_Y', 'DEFECT_TYPE']
-        if not all(col in df.columns for col in base_required_columns):
-            st.error(f"Error: Excel file is missing required columns. Please ensure it has: {', '.join(base_required_columns)}")
-            return pd.DataFrame()
-
-        # --- Data Derivation Step ---
-        # If the QUADRANT column is not in the uploaded file, create it.
-        if 'QUADRANT' not in df.columns:
-            df = derive_quadrants(df)
-            if 'QUADRANT' not in df.columns: # Check if derivation failed
-                return pd.DataFrame()
-
-        # --- Data Transformation Step ---
-        # Now that QUADRANT is guaranteed to exist, calculate plot coordinates.
-        df = calculate_plot_coords(df, panel_rows, panel_cols, gap_size)
+def get_projected_frame(digest, df, panel_rows, panel_cols, gap_size):
+    """Returns the lot projected onto a panel layout (see project_layout), shared by all sessions."""
+    return _derived(digest, 'projected', (panel_rows, panel_cols, gap_size),
+                    lambda: project_layout(df, panel_rows, panel_cols, gap_size))
 
-        return df
-        
-    except Exception as e:
-        st.error(f"An error occurred while processing the Excel file: {e}")
-        return pd.DataFrame()
+def get_defect_clusters(digest, df, panel_rows, panel_cols, mode, cell_size, min_defects, min_cell_defects=1):
+    """Returns the spatial clusters of a lot (see src/clusters.py)."""
+    params = (panel_rows, panel_cols, mode, cell_size if mode == 'coordinates' else None, min_defects, min_cell_defects)
+    return _derived(digest, 'clusters', params, lambda: find_defect_clusters(
+        df, panel_rows, panel_cols, mode, cell_size, min_defects, min_cell_defects))
+
+def get_unit_counts(digest, df, panel_rows, panel_cols):
+    """Returns the per-unit count matrices of a lot (see build_unit_counts); they depend on the panel size only."""
+    return _derived(digest, 'unit_counts', (panel_rows, panel_cols), lambda: build_unit_counts(df, panel_rows, panel_cols))
+
+def get_cell_index(digest, full_df, panel_rows, panel_cols, gap_size):
+    """Returns the map-selection index of a projected lot (see src/spatial.py)."""
+    return _derived(digest, 'cell_index', (panel_rows, panel_cols, gap_size),
+                    lambda: CellIndex(full_df, panel_rows, panel_cols, gap_size))
+
+def get_cache_stats():
+    """
+    Returns the dataset registry counters: entries, bytes, budget_bytes, hits, misses,
+    evictions, spills, reloads, spilled_lots and spill_bytes.
+    """
+    return _PARSED_CACHE.stats()
+
+# --- Watch Mode ---
+# One feed per watched path for the whole server process, so sessions watching the same
+# folder or file share the accumulated lot and each new row is parsed only once.
+@st.cache_resource
+def get_live_feed(path):
+    return LiveFeed(path)
+
+def load_live(path, panel_rows, panel_cols, gap_size):
+    """
+    Polls a watched folder or append-only file and returns its lot so far.
+
+    Returns:
+        tuple: (feed key, parsed DataFrame, projected DataFrame, cube, diagnostics). The
+        frames are empty until the first rows arrive; the key changes with every append.
+    """
+    feed = get_live_feed(path)
+    with span('data_handler.live_poll'):
+        feed.poll()
+    if feed.error:
+        st.error(f"Error: {feed.error}")
+    snapshot = feed.snapshot(panel_rows, panel_cols, gap_size)
+    _drop_stale_derived(feed.key_prefix, snapshot[0])
+    return snapshot
+
+# --- Lot History ---
+@st.cache_resource
+def get_history_store(path=HISTORY_DB_PATH):
+    """The process-wide history store behind the Trend View."""
+    return HistoryStore(path)
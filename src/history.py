@@ -0,0 +1,167 @@
+# src/history.py
+# This module contains the persistent multi-lot history store. Each processed lot is
+# recorded once as lot metadata plus its lot x quadrant x defect-type counts, so trends
+# across thousands of lots are answered from these aggregates without reading raw rows.
+# Totals over all quadrants are stored as quadrant 'All', next to Q1-Q4.
+
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+import pandas as pd
+
+from src.config import HISTORY_DB_PATH
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS lots (
+    lot_id        TEXT PRIMARY KEY,   -- content hash of the lot file
+    name          TEXT NOT NULL,
+    source        TEXT,
+    lot_time      REAL NOT NULL,      -- production time (epoch seconds), used for trends
+    ingested_at   REAL NOT NULL,
+    total_defects INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS lots_by_time ON lots (lot_time);
+CREATE TABLE IF NOT EXISTS lot_counts (
+    lot_id      TEXT NOT NULL REFERENCES lots (lot_id) ON DELETE CASCADE,
+    quadrant    TEXT NOT NULL,      -- 'All' rows hold the lot totals, so no query has to sum
+    defect_type TEXT NOT NULL,
+    count       INTEGER NOT NULL,
+    PRIMARY KEY (lot_id, quadrant, defect_type)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS lot_quadrants (
+    lot_id          TEXT NOT NULL REFERENCES lots (lot_id) ON DELETE CASCADE,
+    quadrant        TEXT NOT NULL,
+    defects         INTEGER NOT NULL,
+    defective_cells INTEGER NOT NULL,
+    PRIMARY KEY (lot_id, quadrant)
+) WITHOUT ROWID;
+"""
+
+
+class HistoryStore:
+    """
+    SQLite-backed store of per-lot aggregates.
+
+    Every call opens its own short-lived connection, so one store can be shared by
+    Streamlit sessions and batch worker processes; WAL journaling lets readers run
+    while a lot is being written.
+    """
+
+    def __init__(self, path=HISTORY_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA foreign_keys=ON")
+        # With WAL, NORMAL still never corrupts the file; it only skips an fsync per commit.
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def has_lot(self, lot_id):
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT 1 FROM lots WHERE lot_id = ?", (lot_id,)).fetchone() is not None
+
+    def add_lot(self, lot_id, name, cube, lot_time=None, source=None, replace=False):
+        """
+        Records a lot from its aggregate cube.
+
+        Args:
+            lot_id (str): Content hash of the lot; a lot is stored at most once.
+            name (str): Display name, usually the file name.
+            cube (DefectCube): The lot's aggregate cube.
+            lot_time (float, optional): Production time in epoch seconds; defaults to now.
+            source (str, optional): Where the lot came from (path or "upload").
+            replace (bool): Overwrite an existing record of the same lot.
+
+        Returns:
+            bool: True if the lot was written, False if it was already stored.
+        """
+        type_counts = cube.type_counts.assign(All=cube.type_counts.sum(axis=1))
+        counts = type_counts.stack()
+        counts = counts[counts > 0]
+        count_rows = [(lot_id, str(quadrant), str(defect_type), int(n))
+                      for (defect_type, quadrant), n in counts.items()]
+        quadrant_rows = [(lot_id, str(quadrant), cube.quadrant_total(quadrant),
+                          int(cube.defective_cells.sum()) if quadrant == 'All' else cube.defective_cell_count(quadrant))
+                         for quadrant in type_counts.columns]
+        now = time.time()
+
+        with closing(self._connect()) as conn, conn:
+            if replace:
+                conn.execute("DELETE FROM lots WHERE lot_id = ?", (lot_id,))
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO lots (lot_id, name, source, lot_time, ingested_at, total_defects) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (lot_id, name, source, lot_time if lot_time is not None else now, now, cube.total),
+            ).rowcount
+            if not inserted:
+                return False
+            conn.executemany("INSERT INTO lot_counts VALUES (?, ?, ?, ?)", count_rows)
+            conn.executemany("INSERT INTO lot_quadrants VALUES (?, ?, ?, ?)", quadrant_rows)
+        return True
+
+    def remove_lot(self, lot_id):
+        with closing(self._connect()) as conn, conn:
+            return conn.execute("DELETE FROM lots WHERE lot_id = ?", (lot_id,)).rowcount > 0
+
+    def lots(self, start=None, end=None):
+        """Lot metadata ordered by lot_time, optionally limited to [start, end] epoch seconds."""
+        where, params = _time_filter(start, end)
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(
+                f"SELECT lot_id, name, source, lot_time, ingested_at, total_defects FROM lots {where} "
+                "ORDER BY lot_time, name", conn, params=params)
+
+    def trend(self, start=None, end=None, quadrant='All', defect_types=None):
+        """
+        Per-lot defect counts by type, read from the stored aggregates only.
+
+        Args:
+            start, end (float, optional): Lot time bounds in epoch seconds (inclusive).
+            quadrant (str): A quadrant label, or 'All' for whole-lot counts.
+            defect_types (list, optional): Restrict to these defect types.
+
+        Returns:
+            pd.DataFrame: Columns lot_id, name, lot_time, total_defects, defect_type and
+            count; one row per lot and defect type with a non-zero count, in lot_time order.
+        """
+        where, params = _time_filter(start, end, 'l.')
+        clauses = [where[len('WHERE '):]] if where else []
+        if defect_types is not None:
+            if not defect_types:
+                return pd.DataFrame(columns=['lot_id', 'name', 'lot_time', 'total_defects', 'defect_type', 'count'])
+            clauses.append(f"c.defect_type IN ({', '.join('?' * len(defect_types))})")
+            params.extend(defect_types)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        query = (
+            "SELECT l.lot_id, l.name, l.lot_time, q.defects AS total_defects, c.defect_type, c.count "
+            "FROM lots l "
+            "JOIN lot_quadrants q ON q.lot_id = l.lot_id AND q.quadrant = ? "
+            f"JOIN lot_counts c ON c.lot_id = l.lot_id AND c.quadrant = ? {where} "
+            "ORDER BY l.lot_time, l.name"
+        )
+        with closing(self._connect()) as conn:
+            return pd.read_sql_query(query, conn, params=[quadrant, quadrant] + params)
+
+    def defect_types(self, start=None, end=None, quadrant='All'):
+        """Defect types seen in a time range, most frequent first."""
+        trend = self.trend(start, end, quadrant)
+        return trend.groupby('defect_type')['count'].sum().sort_values(ascending=False, kind='stable')
+
+
+def _time_filter(start, end, prefix=''):
+    clauses, params = [], []
+    if start is not None:
+        clauses.append(f"{prefix}lot_time >= ?")
+        params.append(float(start))
+    if end is not None:
+        clauses.append(f"{prefix}lot_time <= ?")
+        params.append(float(end))
+    return (f"WHERE {' AND '.join(clauses)}" if clauses else ''), params
@@ -0,0 +1,193 @@
+# src/image_store.py
+# This module contains the defect review image store: a persistent index of the
+# defect_{quadrant}_{x}_{y}_m1/_m2 (or legacy defect_{x}_{y}_m1/_m2) image pairs and a
+# bounded cache of decoded thumbnails.
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from functools import lru_cache
+
+from PIL import Image
+
+from src.config import CACHE_DIR, THUMBNAIL_CACHE_ENTRIES, THUMBNAIL_SIZE
+
+# File naming convention written by generate_test_images.py and the AOI review stations:
+# defect_{quadrant}_{x}_{y}_{m1|m2}.{ext}, e.g. defect_Q2_3_5_m1.jpg, where x and y are the
+# quadrant-local UNIT_INDEX_X / UNIT_INDEX_Y. Unit indices repeat in every quadrant, so
+# the quadrant is part of the name. The original defect_{x}_{y}_{m1|m2} names are still
+# indexed, without a quadrant; lookup falls back to them for a unit with no quadrant image.
+_IMAGE_NAME = re.compile(r'^defect_(?:(Q[1-4])_)?(-?\d+)_(-?\d+)_(m[12])\.(?:jpe?g|png|bmp|tiff?)$', re.IGNORECASE)
+_INDEX_VERSION = 3
+
+logger = logging.getLogger(__name__)
+
+
+class DefectImageIndex:
+    """
+    Maps (quadrant, x, y) unit positions to their (m1, m2) image file names; images
+    named without a quadrant are stored under quadrant None.
+
+    The index is persisted as JSON in the cache directory and refreshed incrementally:
+    if the image directory's mtime is unchanged nothing is read, otherwise the directory
+    listing is diffed against the known names and only new names are parsed.
+    """
+
+    def __init__(self, image_dir, cache_dir=CACHE_DIR):
+        self.image_dir = os.path.abspath(image_dir)
+        path_key = hashlib.sha1(self.image_dir.encode()).hexdigest()[:16]
+        self.index_path = os.path.join(cache_dir, f"image_index_{path_key}.json") if cache_dir else None
+        self._pairs = {}        # (quadrant, x, y) -> [m1 name or None, m2 name or None]
+        self._names = set()     # every file name currently in the index
+        self.unmatched = set()  # defect_* files whose name does not follow either convention
+        self._dir_mtime_ns = None
+        self._lock = threading.Lock()
+        self._load()
+        self.refresh()
+
+    def _load(self):
+        if not self.index_path or not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path) as f:
+                stored = json.load(f)
+            if stored.get('version') != _INDEX_VERSION or stored.get('image_dir') != self.image_dir:
+                return
+            self._pairs = {_parse_key(key): pair for key, pair in stored['pairs'].items()}
+            self.unmatched = set(stored['unmatched'])
+            self._names = {name for pair in self._pairs.values() for name in pair if name} | self.unmatched
+            self._dir_mtime_ns = stored['dir_mtime_ns']
+        except (OSError, ValueError, KeyError):
+            self._pairs, self._names, self.unmatched, self._dir_mtime_ns = {}, set(), set(), None
+
+    def _save(self):
+        if not self.index_path:
+            return
+        stored = {
+            'version': _INDEX_VERSION,
+            'image_dir': self.image_dir,
+            'dir_mtime_ns': self._dir_mtime_ns,
+            'pairs': {f"{quadrant or ''},{x},{y}": pair for (quadrant, x, y), pair in self._pairs.items()},
+            'unmatched': sorted(self.unmatched),
+        }
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(stored, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError:
+            pass  # The persisted index is an optimization; it is rebuilt if missing.
+
+    def refresh(self):
+        """
+        Brings the index up to date with the directory. Costs a single stat call when
+        nothing changed.
+
+        Returns:
+            bool: True if the index changed.
+        """
+        with self._lock:
+            try:
+                mtime_ns = os.stat(self.image_dir).st_mtime_ns
+            except OSError:
+                changed = bool(self._pairs)
+                self._pairs, self._names, self.unmatched, self._dir_mtime_ns = {}, set(), set(), None
+                return changed
+            if mtime_ns == self._dir_mtime_ns:
+                return False
+
+            with os.scandir(self.image_dir) as entries:
+                current = {entry.name for entry in entries if entry.name.startswith('defect_')}
+            unmatched = len(self.unmatched)
+            for name in self._names - current:
+                self._remove(name)
+            for name in current - self._names:
+                self._add(name)
+            if len(self.unmatched) > unmatched:
+                logger.warning("%d file(s) in %s are not named defect_[{quadrant}_]{x}_{y}_m1/_m2 and are "
+                               "not indexed, e.g. %s", len(self.unmatched), self.image_dir, min(self.unmatched))
+            self._dir_mtime_ns = mtime_ns
+            self._save()
+            return True
+
+    def _add(self, name):
+        match = _IMAGE_NAME.match(name)
+        self._names.add(name)
+        if not match:
+            self.unmatched.add(name)
+            return
+        self._pairs.setdefault(_match_key(match), [None, None])[_slot(match)] = name
+
+    def _remove(self, name):
+        match = _IMAGE_NAME.match(name)
+        self._names.discard(name)
+        self.unmatched.discard(name)
+        if not match:
+            return
+        key = _match_key(match)
+        pair = self._pairs.get(key)
+        if pair:
+            pair[_slot(match)] = None
+            if pair == [None, None]:
+                del self._pairs[key]
+
+    def lookup(self, quadrant, x, y):
+        """
+        Returns the (m1, m2) image paths for a unit; missing images are None. A unit
+        without images named for its quadrant gets the images named by (x, y) alone.
+
+        Args:
+            quadrant (str): 'Q1' to 'Q4'.
+            x, y (int): The quadrant-local unit indices (UNIT_INDEX_X, UNIT_INDEX_Y).
+        """
+        x, y = int(x), int(y)
+        pair = self._pairs.get((str(quadrant).upper(), x, y)) or self._pairs.get((None, x, y))
+        if pair is None:
+            return None, None
+        return tuple(os.path.join(self.image_dir, name) if name else None for name in pair)
+
+    def __len__(self):
+        return len(self._pairs)
+
+
+def _match_key(match):
+    quadrant = match.group(1)
+    return quadrant.upper() if quadrant else None, int(match.group(2)), int(match.group(3))
+
+
+def _slot(match):
+    return 0 if match.group(4).lower() == 'm1' else 1
+
+
+def _parse_key(key):
+    quadrant, x, y = key.split(',')
+    return quadrant or None, int(x), int(y)
+
+
+@lru_cache(maxsize=THUMBNAIL_CACHE_ENTRIES)
+def _decode_thumbnail(path, mtime_ns, size):
+    with open(path, 'rb') as f:
+        head = f.read(256).lstrip()
+    if head.startswith((b'<svg', b'<?xml')):
+        # Vector placeholders (such as the generated test images) are passed through as
+        # markup; they are already small and the browser scales them.
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+    with Image.open(path) as image:
+        # draft() lets the JPEG decoder skip straight to a reduced scale.
+        image.draft('RGB', size)
+        image = image.convert('RGB')
+        image.thumbnail(size)
+        return image
+
+
+def load_thumbnail(path, size=THUMBNAIL_SIZE):
+    """
+    Returns a decoded, downscaled PIL image (or the markup of an SVG file), served from
+    a bounded LRU. The file's mtime is part of the key, so a replaced image is decoded again.
+    """
+    return _decode_thumbnail(path, os.stat(path).st_mtime_ns, tuple(size))
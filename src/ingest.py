@@ -0,0 +1,336 @@
+# src/ingest.py
+# This module contains the file-reading layer: format sniffing, column-pruned readers
+# and the on-disk columnar cache that makes re-opening a lot nearly free.
+
+import glob
+import hashlib
+import io
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from src.config import (
+    NEEDED_COLUMNS, REQUIRED_COLUMNS, COLUMNAR_CACHE_DIR, COLUMNAR_CACHE_MAX_BYTES, XLSX_CHUNK_ROWS,
+)
+from src.instrumentation import count, timed
+
+# --- Format Sniffing ---
+# Magic bytes are checked first; the file extension is only a fallback for text formats.
+_MAGIC_NUMBERS = [
+    (b'PK\x03\x04', 'xlsx'),                       # Office Open XML (zip container)
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'xls'),  # Legacy OLE2 workbook
+    (b'PAR1', 'parquet'),
+    (b'ARROW1', 'feather'),                        # Feather v2 / Arrow IPC file
+    (b'FEA1', 'feather'),                          # Feather v1
+]
+_EXTENSIONS = {
+    '.xlsx': 'xlsx', '.xlsm': 'xlsx', '.xls': 'xls', '.csv': 'csv', '.txt': 'csv',
+    '.parquet': 'parquet', '.pq': 'parquet', '.feather': 'feather', '.arrow': 'feather',
+    '.jsonl': 'jsonl', '.ndjson': 'jsonl',
+}
+
+# Readers that accept a progress callback (see _read_xlsx).
+_PROGRESS_FORMATS = {'xlsx'}
+
+# Formats that are slow to parse and therefore worth converting to the columnar cache once.
+_CONVERTIBLE_FORMATS = {'xlsx', 'xls', 'csv', 'jsonl'}
+
+
+# --- Source Rows ---
+# Frames read from row-oriented files are indexed by the file row each defect came from,
+# as a RangeIndex named SOURCE_ROW_INDEX (free in memory), so validation reports the row
+# an engineer sees in Excel or an editor. Blank rows are read as all-missing rows rather
+# than skipped, which keeps the numbering contiguous; pandas does skip blank JSONL lines,
+# so rows after one are numbered one too low. Other frames are numbered by position.
+SOURCE_ROW_INDEX = 'source_row'
+_FIRST_SOURCE_ROW = {'xlsx': 2, 'xls': 2, 'csv': 2, 'jsonl': 1}   # the header, if any, is row 1
+
+# The streamed Excel reader compacts cells as it goes, so it records the size the sheet
+# would have as a plain pandas frame (as pd.read_excel returns it) in df.attrs under this
+# key, for the memory report (see process_defect_table). attrs survive the columnar cache.
+SOURCE_BYTES_ATTR = 'source_bytes'
+
+
+def number_source_rows(df, first_row):
+    """Indexes ``df`` by source row, ``first_row`` being the row of its first defect."""
+    df.index = pd.RangeIndex(first_row, first_row + len(df), name=SOURCE_ROW_INDEX)
+    return df
+
+
+def _wanted(column):
+    """Column filter shared by every reader: keep only what the app actually uses."""
+    return column in NEEDED_COLUMNS
+
+
+def _read_excel(buffer):
+    return pd.read_excel(buffer, usecols=_wanted)
+
+
+# --- Streaming Excel Reader ---
+# Columns holding numbers; every other wanted column holds labels.
+_NUMERIC_COLUMNS = {'UNIT_INDEX_X', 'UNIT_INDEX_Y', 'X_COORDINATES', 'Y_COORDINATES'}
+
+
+def _plain_nbytes(values):
+    """Bytes ``values`` take as the column pandas would infer for them, as pd.read_excel does."""
+    return int(pd.Series(values).memory_usage(deep=True, index=False))
+
+
+def _compact_chunk(column, values):
+    """Converts one chunk of cell values to a compact array; unparseable numbers become NaN."""
+    if column in _NUMERIC_COLUMNS:
+        numbers = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce')
+        # float32 holds unit indices exactly; coordinates keep full precision until normalize_dtypes.
+        return numbers.to_numpy(dtype='float32' if column.startswith('UNIT_INDEX') else 'float64')
+    return pd.Categorical([None if v is None else str(v) for v in values])
+
+
+def _concat_chunks(parts):
+    if not parts:
+        return []
+    if isinstance(parts[0], pd.Categorical):
+        return union_categoricals(parts)
+    return np.concatenate(parts)
+
+
+def _read_xlsx(buffer, progress=None, chunk_rows=XLSX_CHUNK_ROWS):
+    """
+    Streams the first worksheet with openpyxl in read-only mode, converting each block of
+    ``chunk_rows`` rows to compact arrays as it arrives. Only one block of cell objects
+    exists at a time, so peak memory stays close to the size of the resulting frame.
+
+    If the header lacks a required column no rows are read; the returned header-only frame
+    is rejected by validation straight away.
+
+    Args:
+        progress (callable, optional): Called as progress(rows_read, total_rows) after each
+            block; total_rows is None when the sheet does not declare its size.
+    """
+    from openpyxl import load_workbook
+    workbook = load_workbook(buffer, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, ())
+        positions = [(i, name) for i, name in enumerate(header) if _wanted(name)]
+        if not set(REQUIRED_COLUMNS) <= {name for _, name in positions}:
+            return pd.DataFrame(columns=[name for _, name in positions])
+
+        total_rows = sheet.max_row - 1 if sheet.max_row else None
+        parts = {name: [] for _, name in positions}
+        rows_read = 0
+        plain_bytes = 0
+        while True:
+            block = list(itertools.islice(rows, chunk_rows))
+            if not block:
+                break
+            for i, name in positions:
+                values = [row[i] if i < len(row) else None for row in block]
+                plain_bytes += _plain_nbytes(values)
+                parts[name].append(_compact_chunk(name, values))
+            rows_read += len(block)
+            del block
+            if progress is not None:
+                progress(rows_read, total_rows)
+        df = pd.DataFrame({name: _concat_chunks(chunks) for name, chunks in parts.items()})
+        df.attrs[SOURCE_BYTES_ATTR] = plain_bytes + int(df.index.memory_usage())
+        return df
+    finally:
+        workbook.close()
+
+
+def _read_csv(buffer):
+    return pd.read_csv(buffer, usecols=_wanted, skip_blank_lines=False)
+
+
+def _read_jsonl(buffer):
+    # One JSON object per line, as written by the inspection machines' live output.
+    df = pd.read_json(buffer, lines=True, dtype=False)
+    return df[[c for c in df.columns if _wanted(c)]]
+
+
+def _read_parquet(buffer):
+    import pyarrow.parquet as pq
+    schema = pq.read_schema(buffer)
+    buffer.seek(0)
+    return pd.read_parquet(buffer, columns=[c for c in schema.names if _wanted(c)])
+
+
+def _read_feather(buffer):
+    import pyarrow.feather as feather
+    # Cache files on disk are memory-mapped; in-memory uploads are read directly.
+    table = feather.read_table(buffer, memory_map=isinstance(buffer, str))
+    return table.select([c for c in table.column_names if _wanted(c)]).to_pandas()
+
+
+# Pluggable reader registry: format name -> callable(file-like) -> DataFrame.
+READERS = {
+    'xlsx': _read_xlsx,
+    'xls': _read_excel,
+    'csv': _read_csv,
+    'jsonl': _read_jsonl,
+    'parquet': _read_parquet,
+    'feather': _read_feather,
+}
+
+
+def register_reader(fmt, reader):
+    """Registers (or replaces) the reader used for a given format name."""
+    READERS[fmt] = reader
+
+
+def is_supported_file(name):
+    """True if a file name has the extension of a format with a registered reader (see READERS)."""
+    return _EXTENSIONS.get(os.path.splitext(str(name))[1].lower()) in READERS
+
+
+def read_source_bytes(source):
+    """
+    Returns the raw bytes of an upload, an open binary file, a path or a bytes object.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if hasattr(source, 'getvalue'):
+        return source.getvalue()
+    if hasattr(source, 'read'):
+        return source.read()
+    with open(source, 'rb') as f:
+        return f.read()
+
+
+def file_digest(data):
+    """Content hash used to key every cache layer for a lot."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def sniff_format(data, filename=None):
+    """
+    Identifies the file format from its leading bytes, falling back to the file
+    extension and finally to CSV.
+    """
+    for magic, fmt in _MAGIC_NUMBERS:
+        if data.startswith(magic):
+            return fmt
+    if filename:
+        fmt = _EXTENSIONS.get(os.path.splitext(str(filename))[1].lower())
+        if fmt:
+            return fmt
+    if data[:64].lstrip()[:1] == b'{':
+        return 'jsonl'
+    return 'csv'
+
+
+def _cache_path(digest, cache_dir):
+    return os.path.join(cache_dir, f"{digest}.feather")
+
+
+def _write_columnar_cache(df, path):
+    """Writes the cache file atomically so a concurrent reader never sees a partial file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    df.reset_index(drop=True).to_feather(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def prune_columnar_cache(cache_dir, max_bytes):
+    """
+    Deletes the least recently read columnar copies until the folder fits in ``max_bytes``.
+
+    A hit touches its file, so modification time orders the copies by last use.
+
+    Returns:
+        int: The number of files deleted.
+    """
+    paths = glob.glob(os.path.join(cache_dir, '*.feather'))
+    stats = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue  # Deleted by a concurrent prune.
+        stats.append((st.st_mtime, st.st_size, path))
+    stats.sort()
+    total = sum(size for _, size, _ in stats)
+    removed = 0
+    for _, size, path in stats:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass
+        total -= size
+    if removed:
+        count('columnar_cache.pruned', removed)
+    return removed
+
+
+@timed('ingest.read_defect_table')
+def read_defect_table(source, filename=None, cache_dir=COLUMNAR_CACHE_DIR, data=None, digest=None, progress=None,
+                      cache_max_bytes=COLUMNAR_CACHE_MAX_BYTES):
+    """
+    Reads a defect file of any supported format, keeping only the needed columns.
+
+    Slow formats (Excel, CSV) are converted once into a Feather file named after the
+    content hash, so re-opening the same lot is a memory-mapped columnar read. The cache
+    folder is kept under ``cache_max_bytes`` by deleting the least recently read copies.
+
+    Args:
+        source: An uploaded file, open binary file, path or bytes.
+        filename (str, optional): Used for format sniffing when magic bytes are inconclusive.
+        cache_dir (str, optional): Columnar cache directory; pass None to disable the cache.
+        data (bytes, optional): Pre-read file contents, to avoid reading the source twice.
+        digest (str, optional): Pre-computed content hash of ``data``.
+        progress (callable, optional): Progress callback for streaming readers, called as
+            progress(rows_read, total_rows).
+        cache_max_bytes (int, optional): Size cap of the columnar cache; None disables pruning.
+
+    Returns:
+        pd.DataFrame: The raw (unvalidated) defect table, indexed by source row for
+        row-oriented formats (see SOURCE_ROW_INDEX).
+    """
+    if data is None:
+        data = read_source_bytes(source)
+    if filename is None:
+        filename = getattr(source, 'name', None) or (source if isinstance(source, (str, os.PathLike)) else None)
+    fmt = sniff_format(data, filename)
+
+    cache_path = None
+    if cache_dir and fmt in _CONVERTIBLE_FORMATS:
+        cache_path = _cache_path(digest or file_digest(data), cache_dir)
+        if os.path.exists(cache_path):
+            try:
+                df = number_source_rows(_read_feather(cache_path), _FIRST_SOURCE_ROW[fmt])
+                count('columnar_cache.hit')
+                try:
+                    os.utime(cache_path)  # Marks the copy as recently used for pruning.
+                except OSError:
+                    pass
+                return df
+            except Exception:
+                pass  # A corrupt cache entry is simply rebuilt below.
+
+        count('columnar_cache.miss')
+
+    reader = READERS.get(fmt)
+    if reader is None:
+        raise ValueError(f"Unsupported file format: {fmt}")
+    if progress is not None and fmt in _PROGRESS_FORMATS:
+        df = reader(io.BytesIO(data), progress=progress)
+    else:
+        df = reader(io.BytesIO(data))
+
+    if fmt in _FIRST_SOURCE_ROW:
+        number_source_rows(df, _FIRST_SOURCE_ROW[fmt])
+    if cache_path is not None:
+        try:
+            _write_columnar_cache(df, cache_path)
+            if cache_max_bytes is not None:
+                prune_columnar_cache(cache_dir, cache_max_bytes)
+        except Exception:
+            pass  # The cache is an optimization; a read-only disk must not break loading.
+    return df
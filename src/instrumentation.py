@@ -0,0 +1,140 @@
+# src/instrumentation.py
+# This module contains the lightweight per-rerun instrumentation: timing spans, counters
+# and recorded values, collected only while a run is being recorded.
+
+import contextvars
+import functools
+import json
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; memory deltas are then omitted.
+    resource = None
+
+# The active recorder for the current Streamlit script thread (or batch worker), if any.
+# When nothing is recording, span() returns a shared no-op object, so instrumented code
+# costs one ContextVar lookup per call.
+_current = contextvars.ContextVar('aoi_perf_recorder', default=None)
+
+# ru_maxrss is reported in kilobytes on Linux and in bytes on macOS.
+_RSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+
+def _peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _RSS_UNIT if resource else None
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.entry = {'name': self.name, 'depth': self.recorder.depth}
+        self.recorder.depth += 1
+        self.recorder.spans.append(self.entry)
+        self.rss = _peak_rss()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        self.recorder.depth -= 1
+        self.entry['start_ms'] = (self.start - self.recorder.started) * 1000
+        self.entry['ms'] = (end - self.start) * 1000
+        if self.rss is not None:
+            self.entry['peak_rss_delta_mb'] = (_peak_rss() - self.rss) / 1e6
+        return False
+
+
+class Recorder:
+    """Collects the spans, counters and values of one run."""
+
+    def __init__(self, label=''):
+        self.label = label
+        self.started = time.perf_counter()
+        self.timestamp = time.time()
+        self.depth = 0
+        self.spans = []
+        self.counters = {}
+        self.values = {}
+
+    def to_dict(self):
+        return {
+            'label': self.label, 'timestamp': self.timestamp,
+            'total_ms': (time.perf_counter() - self.started) * 1000,
+            'spans': self.spans, 'counters': self.counters, 'values': self.values,
+        }
+
+
+def start_run(label=''):
+    """Starts recording in the current thread; returns the new Recorder."""
+    recorder = Recorder(label)
+    _current.set(recorder)
+    return recorder
+
+
+def end_run():
+    """Stops recording in the current thread and returns the finished Recorder (or None)."""
+    recorder = _current.get()
+    _current.set(None)
+    return recorder
+
+
+def span(name):
+    """Context manager timing a stage of the current run; a no-op when not recording."""
+    recorder = _current.get()
+    return _Span(recorder, name) if recorder is not None else _NULL_SPAN
+
+
+def timed(name=None):
+    """Decorator form of span(); the span name defaults to the function's qualified name."""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            recorder = _current.get()
+            if recorder is None:
+                return func(*args, **kwargs)
+            with _Span(recorder, span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, n=1):
+    """Increments a counter of the current run (e.g. cache hits)."""
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.counters[name] = recorder.counters.get(name, 0) + n
+
+
+def record(name, value):
+    """Stores a value of the current run (e.g. a payload size)."""
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.values[name] = value
+
+
+def is_recording():
+    return _current.get() is not None
+
+
+def export_jsonl(recorder, path):
+    """Appends one run as a JSON line, for offline analysis."""
+    with open(path, 'a') as f:
+        f.write(json.dumps(recorder.to_dict(), default=str) + '\n')
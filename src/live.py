@@ -0,0 +1,411 @@
+# src/live.py
+# This module contains the live ingestion core for watch mode: sources that yield only
+# the defect rows written since the last poll, and a lot that grows by appending them
+# while keeping its derived columns and aggregate cube up to date incrementally.
+
+import functools
+import io
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.aggregates import build_defect_cube, merge_defect_cubes
+from src.cache import LRUCache
+from src.config import LIVE_SETTLE_SECONDS, REQUIRED_COLUMNS
+from src.ingest import READERS, is_supported_file, number_source_rows, read_defect_table
+from src.pipeline import (
+    DefectDataError, MissingColumnsError, assign_quadrants, cloud_midpoint, process_defect_table, project_layout
+)
+
+# --- Sources ---
+# A source's read_new() returns (batches, restarted): batches is a list of
+# (label, load) pairs where load() parses one batch of new raw rows, so that a batch that
+# fails to parse or validate is reported on its own without blocking the others.
+
+class TailSource:
+    """
+    Follows an append-only CSV or JSONL file by byte offset. Only complete lines are
+    consumed, so a row that is still being written is picked up on the next poll.
+    The CSV header is remembered and prepended to every new chunk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fmt = 'jsonl' if os.path.splitext(path)[1].lower() in ('.jsonl', '.ndjson') else 'csv'
+        self.offset = 0
+        self._lines = 0   # complete lines consumed, so batches are numbered by file row
+        self._inode = None
+        self._header = b''
+
+    def read_new(self):
+        """
+        Returns:
+            tuple: (batches, restarted). ``restarted`` is True when the file was truncated
+            or replaced and is being read from the start.
+        """
+        stat = os.stat(self.path)
+        restarted = self._inode is not None and (stat.st_ino != self._inode or stat.st_size < self.offset)
+        if restarted:
+            self.offset, self._lines, self._header = 0, 0, b''
+        self._inode = stat.st_ino
+        if stat.st_size == self.offset:
+            return [], restarted
+
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            chunk = f.read(stat.st_size - self.offset)
+        end = chunk.rfind(b'\n') + 1
+        if end == 0:
+            return [], restarted
+        chunk = chunk[:end]
+        self.offset += end
+        first_row = self._lines + 1
+        self._lines += chunk.count(b'\n')
+
+        if self.fmt == 'csv' and not self._header:
+            header_end = chunk.index(b'\n') + 1
+            self._header, chunk = chunk[:header_end], chunk[header_end:]
+            first_row += 1
+        if not chunk.strip():
+            return [], restarted
+        data = self._header + chunk
+        label = f"{os.path.basename(self.path)} (bytes {self.offset - end:,}-{self.offset:,})"
+        return [(label, lambda: number_source_rows(READERS[self.fmt](io.BytesIO(data)), first_row))], restarted
+
+
+class FolderSource:
+    """
+    Picks up defect files dropped into a folder, each file exactly once and in
+    modification order. Files modified within the last ``settle_seconds`` are assumed
+    to be still in the middle of being written and are left for a later poll.
+    """
+
+    def __init__(self, path, settle_seconds=LIVE_SETTLE_SECONDS):
+        self.path = path
+        self.settle_seconds = settle_seconds
+        self.seen = set()
+
+    def read_new(self):
+        """
+        Returns:
+            tuple: (one batch per newly completed file, False).
+        """
+        now = time.time()
+        ready = []
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if entry.name in self.seen or entry.name.startswith('.') or not is_supported_file(entry.name):
+                    continue
+                if not entry.is_file():
+                    continue
+                mtime = entry.stat().st_mtime
+                if now - mtime >= self.settle_seconds:
+                    ready.append((mtime, entry.name, entry.path))
+
+        self.seen.update(name for _, name, _ in ready)
+        # Drop files are read once, so they are not converted to the columnar cache.
+        return [(name, functools.partial(read_defect_table, path, cache_dir=None))
+                for _, name, path in sorted(ready)], False
+
+
+def open_live_source(path):
+    """Returns a FolderSource for a directory and a TailSource for a file."""
+    return FolderSource(path) if os.path.isdir(path) else TailSource(path)
+
+# --- Incremental Lot ---
+
+class _FrameBuffer:
+    """
+    Rows appended batch by batch into preallocated column arrays whose capacity doubles
+    when full, so an append copies only its own rows (amortized) and frame() is a
+    zero-copy view of the rows so far. Categorical columns are kept as codes against an
+    append-only category list, so the codes of earlier rows never change.
+
+    Appends only write past the rows of frames already handed out, and a column that has
+    to grow or widen its dtype is reallocated, so those frames never change. They share
+    memory with the buffer and must be treated as read-only.
+    """
+
+    _MIN_CAPACITY = 1024
+
+    def __init__(self):
+        self._arrays = {}       # column -> values, or codes for categorical columns
+        self._categories = {}   # categorical column -> (categories in order of appearance, category -> code, ordered)
+        self._dtypes = {}       # column -> extension dtype restored in frame() (stored as object)
+        self._capacity = 0
+        self._frame = None
+        self.rows = 0
+
+    def __len__(self):
+        return self.rows
+
+    def append(self, df):
+        n = len(df)
+        if not n:
+            return
+        self._reserve(self.rows + n)
+        for col in df.columns:
+            if col not in self._arrays:
+                self._add_column(col, df[col])
+        start, stop = self.rows, self.rows + n
+        for col in list(self._arrays):
+            if col not in df.columns:
+                self._fill_missing(col, start, stop)
+            elif col in self._categories:
+                self._arrays[col][start:stop] = self._codes(col, df[col])
+            else:
+                values = df[col].to_numpy(dtype=object if col in self._dtypes else None)
+                self._widen(col, values.dtype)[start:stop] = values
+        self.rows = stop
+        self._frame = None
+
+    def frame(self):
+        if self._frame is None:
+            data = {}
+            for col, array in self._arrays.items():
+                if col in self._categories:
+                    categories, _, ordered = self._categories[col]
+                    data[col] = pd.Categorical.from_codes(array[:self.rows], categories=categories,
+                                                          ordered=ordered, validate=False)
+                elif col in self._dtypes:
+                    data[col] = pd.array(array[:self.rows], dtype=self._dtypes[col])
+                else:
+                    data[col] = array[:self.rows]
+            self._frame = pd.DataFrame(data, copy=False)
+        return self._frame
+
+    def _reserve(self, rows):
+        if rows <= self._capacity:
+            return
+        self._capacity = max(rows, 2 * self._capacity, self._MIN_CAPACITY)
+        for col, array in self._arrays.items():
+            grown = np.empty(self._capacity, dtype=array.dtype)
+            grown[:self.rows] = array[:self.rows]
+            self._arrays[col] = grown
+
+    def _add_column(self, col, series):
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            self._categories[col] = ([], {}, series.dtype.ordered)
+            self._arrays[col] = np.empty(self._capacity, dtype=np.int32)
+        elif isinstance(series.dtype, np.dtype):
+            self._arrays[col] = np.empty(self._capacity, dtype=series.dtype)
+        else:
+            self._dtypes[col] = series.dtype
+            self._arrays[col] = np.empty(self._capacity, dtype=object)
+        # Rows appended before the column first appeared are missing values, as in pd.concat.
+        self._fill_missing(col, 0, self.rows)
+
+    def _fill_missing(self, col, start, stop):
+        if start == stop:
+            return
+        if col in self._categories:
+            self._arrays[col][start:stop] = -1
+            return
+        array = self._arrays[col]
+        if array.dtype.kind in 'biu':
+            array = self._widen(col, np.result_type(array.dtype, np.float32))
+        array[start:stop] = None if array.dtype == object else np.nan
+
+    def _widen(self, col, dtype):
+        array = self._arrays[col]
+        dtype = np.result_type(array.dtype, dtype)
+        if dtype != array.dtype:
+            array = self._arrays[col] = array.astype(dtype)
+        return array
+
+    def _codes(self, col, series):
+        """The batch's values as codes of the column's category list, extended with new categories."""
+        categories, index, _ = self._categories[col]
+        values = series.astype('category') if not isinstance(series.dtype, pd.CategoricalDtype) else series
+        for category in values.cat.categories:
+            if category not in index:
+                index[category] = len(categories)
+                categories.append(category)
+        lookup = np.array([index[category] for category in values.cat.categories] + [-1], dtype=np.int32)
+        return lookup[values.cat.codes.to_numpy()]   # code -1 (missing) picks the trailing -1
+
+
+class LiveLot:
+    """
+    A lot that grows by appending batches of raw rows.
+
+    Each batch goes through process_defect_table on its own and its cube is merged into
+    the lot's cube, so an append costs time proportional to the batch, not to the lot.
+    Rows are kept in a _FrameBuffer (and so are the projections of each panel layout),
+    so neither an append nor reading ``frame`` recopies the rows received earlier.
+    When quadrants are derived from coordinates, the midpoint is frozen (taken from the
+    first batch unless given), so earlier rows never change quadrant as new rows extend
+    the defect cloud; recentre() re-derives every row around the current cloud on demand.
+    """
+
+    def __init__(self, quadrant_midpoint=None):
+        self.quadrant_midpoint = quadrant_midpoint
+        self._buffer = _FrameBuffer()
+        self.cube = None
+        self.version = 0
+        self.diagnostics = {'before_bytes': 0, 'after_bytes': 0, 'rows': 0, 'quadrants_derived': False,
+                            'quadrant_midpoint': quadrant_midpoint, 'unknown_quadrants': 0,
+                            'malformed_rows': 0, 'malformed_examples': []}
+        self._projections = LRUCache(max_entries=4)   # layout -> _FrameBuffer of projected rows
+
+    @property
+    def rows(self):
+        return self._buffer.rows
+
+    @property
+    def frame(self):
+        """The lot's rows as one read-only frame, a view of the row buffer."""
+        return self._buffer.frame()
+
+    def append(self, raw):
+        """
+        Validates and appends a batch of raw rows.
+
+        Raises:
+            DefectDataError: If the batch fails validation; the lot is left unchanged.
+
+        Returns:
+            int: The number of rows appended.
+        """
+        missing = [col for col in REQUIRED_COLUMNS if col not in raw.columns]
+        if missing:
+            raise MissingColumnsError(missing)
+        if raw.empty:
+            return 0
+        batch, diagnostics = process_defect_table(raw, self.quadrant_midpoint)
+        if diagnostics['quadrants_derived'] and self.quadrant_midpoint is None:
+            self.quadrant_midpoint = diagnostics['quadrant_midpoint']
+        cube = build_defect_cube(batch)
+
+        first = self.rows == 0
+        self._buffer.append(batch)
+        self.cube = cube if first else merge_defect_cubes(self.cube, cube)
+        self.version += 1
+
+        totals = self.diagnostics
+        totals['before_bytes'] += diagnostics['before_bytes']
+        totals['after_bytes'] += diagnostics['after_bytes']
+        totals['rows'] = self.rows
+        totals['quadrants_derived'] = diagnostics['quadrants_derived'] and (first or totals['quadrants_derived'])
+        totals['quadrant_midpoint'] = self.quadrant_midpoint
+        totals['unknown_quadrants'] += diagnostics['unknown_quadrants']
+        totals['malformed_rows'] += diagnostics['malformed_rows']
+        return len(batch)
+
+    def recentre(self):
+        """
+        Re-derives every quadrant around the centre of all rows received so far. Only
+        possible when every batch had its quadrants derived from coordinates.
+
+        Returns:
+            bool: True if the quadrants were re-derived.
+        """
+        if self.frame.empty or not self.diagnostics['quadrants_derived']:
+            return False
+        self.quadrant_midpoint = cloud_midpoint(self.frame['X_COORDINATES'], self.frame['Y_COORDINATES'])
+        frame = assign_quadrants(self.frame.copy(deep=False), self.quadrant_midpoint)
+        self._buffer = _FrameBuffer()
+        self._buffer.append(frame)
+        self.cube = build_defect_cube(frame)
+        self.diagnostics['quadrant_midpoint'] = self.quadrant_midpoint
+        self.diagnostics['unknown_quadrants'] = int((self.frame['QUADRANT'] == 'Unknown').sum())
+        self._projections.clear()
+        self.version += 1
+        return True
+
+    def projected(self, panel_rows, panel_cols, gap_size):
+        """
+        Returns the lot projected onto a panel layout. Rows projected on an earlier call
+        are reused; only rows appended since then are projected.
+        """
+        layout = (panel_rows, panel_cols, gap_size)
+        buffer = self._projections.get(layout)
+        if buffer is None:
+            buffer = _FrameBuffer()
+            self._projections.put(layout, buffer)
+        if buffer.rows < self.rows:
+            buffer.append(project_layout(self.frame.iloc[buffer.rows:], *layout))
+        return buffer.frame()
+
+
+class LiveFeed:
+    """
+    A live source paired with the lot it feeds. poll() and snapshot() are serialized by a
+    lock, so several sessions can share one feed.
+    """
+
+    def __init__(self, path, quadrant_midpoint=None):
+        self.path = path
+        self.source = None        # Opened on the first poll that finds the path.
+        self._initial_midpoint = quadrant_midpoint
+        self.lot = LiveLot(quadrant_midpoint)
+        self.generation = 0      # Bumped whenever the source restarts from scratch.
+        self.error = None
+        self.last_update = None
+        self._lock = threading.Lock()
+
+    @property
+    def key(self):
+        """Identifies the current contents; stands in for the content hash of uploaded lots."""
+        return f"{self.key_prefix}{self.generation}:{self.lot.version}"
+
+    @property
+    def key_prefix(self):
+        """Shared by the keys of every version of this feed's lot."""
+        return f"live:{self.path}:"
+
+    def poll(self):
+        """
+        Reads and appends whatever the source has written since the last poll.
+
+        Returns:
+            int: The number of rows appended.
+        """
+        with self._lock:
+            try:
+                if self.source is None:
+                    if not os.path.exists(self.path):
+                        raise FileNotFoundError(f"No such file or folder: '{self.path}'")
+                    self.source = open_live_source(self.path)
+                batches, restarted = self.source.read_new()
+            except OSError as e:
+                self.error = f"Could not read {self.path}: {e}"
+                return 0
+            if restarted:
+                self.lot = LiveLot(self._initial_midpoint)
+                self.generation += 1
+
+            added, errors = 0, []
+            for label, load in batches:
+                try:
+                    added += self.lot.append(load())
+                except DefectDataError as e:
+                    errors.append(f"{label}: {e}")
+                except Exception as e:
+                    errors.append(f"{label}: could not be read ({e})")
+            # Errors are kept until a later poll appends rows, so a rejected batch stays visible.
+            if errors:
+                self.error = "; ".join(errors)
+            elif added:
+                self.error = None
+            if added:
+                self.last_update = time.time()
+            return added
+
+    def recentre(self):
+        with self._lock:
+            return self.lot.recentre()
+
+    def snapshot(self, panel_rows, panel_cols, gap_size):
+        """
+        Returns:
+            tuple: (key, parsed DataFrame, projected DataFrame, cube, diagnostics) taken
+            consistently under the feed's lock.
+        """
+        with self._lock:
+            lot = self.lot
+            projected = lot.projected(panel_rows, panel_cols, gap_size) if lot.rows else lot.frame
+            return self.key, lot.frame, projected, lot.cube, dict(lot.diagnostics)
@@ -0,0 +1,318 @@
+# src/pipeline.py
+# This module contains the UI-free processing core: validation, quadrant derivation, dtype
+# compaction and layout projection. It never imports Streamlit, so batch jobs, tests and
+# worker processes can use it cheaply; src/data_handler.py adapts it for the app.
+
+import numpy as np
+import pandas as pd
+
+from src.config import (
+    REQUIRED_COLUMNS, QUADRANT_ORDER, COORDINATE_TOLERANCE, MALFORMED_ROW_EXAMPLES, defect_style_map
+)
+from src.ingest import SOURCE_BYTES_ATTR, SOURCE_ROW_INDEX, read_defect_table
+from src.instrumentation import timed
+
+# --- Validation Errors ---
+
+class DefectDataError(ValueError):
+    """Base class for problems with the content of a defect file."""
+
+class MissingColumnsError(DefectDataError):
+    """Raised when a defect file lacks one or more of REQUIRED_COLUMNS."""
+
+    def __init__(self, missing):
+        self.missing = list(missing)
+        super().__init__(f"Data file is missing required columns: {', '.join(self.missing)}. "
+                         f"Please ensure it has: {', '.join(REQUIRED_COLUMNS)}")
+
+    def __reduce__(self):
+        # Rebuilt from the column list, not the message in self.args, so the error
+        # survives the trip back from a batch worker process intact.
+        return (type(self), (self.missing,))
+
+class QuadrantDerivationError(DefectDataError):
+    """Raised when QUADRANT is absent and cannot be derived from coordinates."""
+
+# --- Row Validation ---
+# Row numbers in reports are file rows. Readers index their frames by source row (see
+# SOURCE_ROW_INDEX); any other frame is numbered as a file whose header is row 1, so its
+# first row is row 2.
+_FIRST_DATA_ROW = 2
+
+
+def _source_rows(df):
+    if df.index.name == SOURCE_ROW_INDEX:
+        return df.index.to_numpy()
+    return np.arange(_FIRST_DATA_ROW, _FIRST_DATA_ROW + len(df))
+
+def find_malformed_rows(df):
+    """
+    Checks the required columns row by row. A row is malformed when a unit index is
+    missing, not a number or not a whole number, or its DEFECT_TYPE is missing. Rows that are blank in
+    every required column (e.g. trailing formatted rows in a spreadsheet) are not malformed.
+
+    Returns:
+        tuple: (boolean Series marking rows to drop, list of malformed rows as
+        (file row number, reason) pairs).
+    """
+    problems = {}
+    numeric = {}   # the coerced unit indices, which the reasons are worded from
+    for col in ('UNIT_INDEX_X', 'UNIT_INDEX_Y'):
+        numeric[col] = values = pd.to_numeric(df[col], errors='coerce')
+        problems[col] = values.isna() | (values % 1 != 0)
+    problems['DEFECT_TYPE'] = df['DEFECT_TYPE'].isna()
+    bad = problems['UNIT_INDEX_X'] | problems['UNIT_INDEX_Y'] | problems['DEFECT_TYPE']
+    if not bad.any():
+        return bad, []
+
+    blank = df[REQUIRED_COLUMNS].isna().all(axis=1)
+    source_rows = _source_rows(df)
+    malformed = []
+    for position in np.flatnonzero((bad & ~blank).to_numpy()):
+        reasons = []
+        for col, flags in problems.items():
+            if flags.iloc[position]:
+                if col == 'DEFECT_TYPE':
+                    reasons.append(f"{col} is missing")
+                elif pd.notna(numeric[col].iloc[position]) and np.isfinite(numeric[col].iloc[position]):
+                    reasons.append(f"{col} is not a whole number ({df[col].iloc[position]})")
+                else:
+                    reasons.append(f"{col} is missing or not a number")
+        malformed.append((int(source_rows[position]), '; '.join(reasons)))
+    return bad, malformed
+
+# --- Quadrant Kernel ---
+# Quadrants are handled as small integer codes: 0..3 for Q1..Q4 and -1 for a defect that
+# cannot be placed (missing coordinates or an unrecognised label). Code -1 deliberately
+# indexes the last row of the offset lookup table below, which holds a zero offset.
+_UNASSIGNED = -1
+
+def cloud_midpoint(x, y):
+    """
+    Returns the (x, y) centre of the defect cloud: the midpoint of the coordinate extents.
+    Returns None when there is no point to centre on (no rows, or an axis with no
+    coordinates at all), rather than a (nan, nan) midpoint that every row would fall below.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if np.isnan(x).all() or np.isnan(y).all():   # also true for empty arrays
+        return None
+    return (float(np.nanmin(x) + np.nanmax(x)) / 2, float(np.nanmin(y) + np.nanmax(y)) / 2)
+
+def quadrant_codes(x, y, midpoint=None):
+    """
+    Computes integer quadrant codes around the centre of the defect cloud in one pass.
+    Q1 is bottom-left, Q2 bottom-right, Q3 top-left and Q4 top-right; points on a
+    midpoint belong to the lower/left side.
+
+    A fixed ``midpoint`` (x, y) can be passed instead, so that rows arriving later are
+    split along the same lines as the rows before them. Without a usable midpoint
+    (see cloud_midpoint) every row is unassigned.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if midpoint is None:
+        midpoint = cloud_midpoint(x, y)
+    if midpoint is None:
+        return np.full(len(x), _UNASSIGNED, dtype=np.int8)
+    x_midpoint, y_midpoint = midpoint
+
+    codes = np.greater(x, x_midpoint).astype(np.int8)
+    codes += np.greater(y, y_midpoint).astype(np.int8) * 2
+    codes[np.isnan(x) | np.isnan(y)] = _UNASSIGNED
+    return codes
+
+def quadrant_codes_from_labels(quadrant):
+    """Maps a QUADRANT column (categorical or plain strings) to integer quadrant codes."""
+    if isinstance(quadrant.dtype, pd.CategoricalDtype) and list(quadrant.cat.categories[:4]) == QUADRANT_ORDER:
+        codes = quadrant.cat.codes.to_numpy()
+        return np.where(codes < len(QUADRANT_ORDER), codes, _UNASSIGNED).astype(np.int8)
+    return pd.Categorical(quadrant, categories=QUADRANT_ORDER).codes.astype(np.int8)
+
+@timed('pipeline.assign_quadrants')
+def assign_quadrants(df, midpoint=None):
+    """
+    Adds a categorical QUADRANT column computed with quadrant_codes. Defects without
+    coordinates are labelled 'Unknown', an extra category after Q1-Q4.
+    """
+    codes = quadrant_codes(df['X_COORDINATES'], df['Y_COORDINATES'], midpoint)
+    categories = list(QUADRANT_ORDER)
+    if (codes == _UNASSIGNED).any():
+        categories.append('Unknown')
+        codes = np.where(codes == _UNASSIGNED, len(QUADRANT_ORDER), codes)
+    df['QUADRANT'] = pd.Categorical.from_codes(codes, categories=categories)
+    return df
+
+@timed('pipeline.calculate_plot_coords')
+def calculate_plot_coords(df, panel_rows, panel_cols, gap_size):
+    """
+    Calculates the global plot coordinates (PLOT_X, PLOT_Y) based on quadrant and unit indices.
+    The per-quadrant offsets come from a lookup table indexed by quadrant code, so each
+    axis costs one gather and two in-place additions regardless of the quadrant mix.
+    """
+    x_shift = panel_cols + gap_size
+    y_shift = panel_rows + gap_size
+    # Rows: Q1, Q2, Q3, Q4, unassigned (reached through code -1).
+    x_offsets = np.array([0, x_shift, 0, x_shift, 0], dtype=np.float64)
+    y_offsets = np.array([0, 0, y_shift, y_shift, 0], dtype=np.float64)
+    codes = quadrant_codes_from_labels(df['QUADRANT'])
+
+    # Add 0.5 to center the defect marker within its unit cell
+    plot_x = x_offsets[codes]
+    plot_x += df['UNIT_INDEX_X'].to_numpy(dtype=np.float64)
+    plot_x += 0.5
+    plot_y = y_offsets[codes]
+    plot_y += df['UNIT_INDEX_Y'].to_numpy(dtype=np.float64)
+    plot_y += 0.5
+
+    df['PLOT_X'] = plot_x
+    df['PLOT_Y'] = plot_y
+    return df
+
+def plot_to_unit(plot_x, plot_y, panel_rows, panel_cols, gap_size):
+    """
+    Inverse of calculate_plot_coords for a single point on the 'All' map.
+
+    Returns:
+        tuple: (quadrant label, unit x index, unit y index), or None for a point in a gap.
+    """
+    grid_x, grid_y = int(np.floor(plot_x)), int(np.floor(plot_y))
+    right = grid_x >= panel_cols + gap_size
+    top = grid_y >= panel_rows + gap_size
+    unit_x = grid_x - (panel_cols + gap_size if right else 0)
+    unit_y = grid_y - (panel_rows + gap_size if top else 0)
+    if not (0 <= unit_x < panel_cols and 0 <= unit_y < panel_rows):
+        return None
+    return QUADRANT_ORDER[int(right) + 2 * int(top)], unit_x, unit_y
+
+def _to_categorical(series, seed_categories):
+    """Converts a column to a categorical whose categories start with a fixed, known order."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Already categorical (e.g. a derived QUADRANT): only the category order changes.
+        extra = sorted(set(series.cat.categories.astype(str)) - set(seed_categories))
+        return series.cat.rename_categories(lambda c: str(c)).cat.set_categories(list(seed_categories) + extra)
+    values = series.where(series.isna(), series.astype(str))
+    extra = sorted(set(values.dropna().unique()) - set(seed_categories))
+    return pd.Categorical(values, categories=list(seed_categories) + extra)
+
+def _downcast_index(series):
+    """Stores unit indices in the narrowest integer type, keeping a float type only if values are missing or fractional."""
+    values = pd.to_numeric(series, errors='coerce')
+    if values.notna().all() and (values % 1 == 0).all():
+        return pd.to_numeric(values.astype('int64'), downcast='integer')
+    return pd.to_numeric(values, downcast='float')
+
+def _downcast_coordinate(series):
+    """Stores coordinates as float32 when that loses no more than COORDINATE_TOLERANCE."""
+    values = pd.to_numeric(series, errors='coerce').astype('float64')
+    narrow = values.astype('float32')
+    error = (narrow.astype('float64') - values).abs().max()
+    return narrow if not error > COORDINATE_TOLERANCE else values
+
+@timed('pipeline.normalize_dtypes')
+def normalize_dtypes(df, before_bytes=None):
+    """
+    Converts a parsed frame to its compact in-memory form: DEFECT_TYPE and QUADRANT
+    become categoricals with a fixed category order, unit indices and coordinates are
+    downcast to the narrowest safe numeric types.
+
+    ``before_bytes`` is the size to report for the frame as parsed, for callers that
+    have already added compact columns (such as a derived QUADRANT); by default the
+    frame passed in is measured.
+
+    Returns:
+        tuple: (compact DataFrame, dict with 'before_bytes' and 'after_bytes').
+    """
+    before = _frame_nbytes(df) if before_bytes is None else before_bytes
+    df = df.copy(deep=False)
+    if 'DEFECT_TYPE' in df.columns:
+        df['DEFECT_TYPE'] = _to_categorical(df['DEFECT_TYPE'], list(defect_style_map))
+    if 'QUADRANT' in df.columns:
+        df['QUADRANT'] = _to_categorical(df['QUADRANT'], QUADRANT_ORDER)
+    for col in ('UNIT_INDEX_X', 'UNIT_INDEX_Y'):
+        if col in df.columns:
+            df[col] = _downcast_index(df[col])
+    for col in ('X_COORDINATES', 'Y_COORDINATES'):
+        if col in df.columns:
+            df[col] = _downcast_coordinate(df[col])
+    return df, {'before_bytes': before, 'after_bytes': _frame_nbytes(df)}
+
+def project_layout(df, panel_rows, panel_cols, gap_size):
+    """
+    Projects a parsed frame onto a panel layout by adding PLOT_X/PLOT_Y.
+    The cached parsed frame is never modified; a shallow copy carries the new columns.
+    """
+    return calculate_plot_coords(df.copy(deep=False), panel_rows, panel_cols, gap_size)
+
+def _frame_nbytes(df):
+    return int(df.memory_usage(deep=True).sum())
+
+@timed('pipeline.process_defect_table')
+def process_defect_table(df, quadrant_midpoint=None):
+    """
+    Validates a raw defect table, derives quadrants if needed and compacts the dtypes.
+    Quadrants are derived around the centre of the table's own coordinates unless a
+    fixed ``quadrant_midpoint`` (x, y) is given. A table left with no coordinates to
+    centre on (header only, every row malformed, or every coordinate missing) is not an
+    error: its rows are labelled 'Unknown' and no midpoint is reported.
+
+    Raises:
+        MissingColumnsError: If any of REQUIRED_COLUMNS is absent.
+        QuadrantDerivationError: If QUADRANT is absent and cannot be derived.
+
+    Returns:
+        tuple: (compact DataFrame, diagnostics dict). The diagnostics hold the memory
+        report from normalize_dtypes plus 'rows', 'quadrants_derived',
+        'quadrant_midpoint' (None unless derived from at least one coordinate), 'unknown_quadrants' (defects
+        that could not be placed in Q1-Q4), 'malformed_rows' (rows dropped by
+        find_malformed_rows) and 'malformed_examples' (the first MALFORMED_ROW_EXAMPLES
+        of them as (row number, reason) pairs).
+    """
+    # --- Data Validation ---
+    # We now check for the columns needed for derivation.
+    missing = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing:
+        raise MissingColumnsError(missing)
+    # Measured on the table as read (before rows are dropped or a QUADRANT is derived); the
+    # streamed Excel reader compacts as it reads, so it reports that size itself.
+    before_bytes = df.attrs.get(SOURCE_BYTES_ATTR) or _frame_nbytes(df)
+
+    # Malformed rows are dropped and reported rather than failing the whole file.
+    drop, malformed = find_malformed_rows(df)
+    if drop.any():
+        df = df[~drop.to_numpy()].reset_index(drop=True)
+    elif df.index.name == SOURCE_ROW_INDEX:
+        df.index = pd.RangeIndex(len(df))   # in place, as reset_index would copy the frame on older pandas
+
+    # --- Data Derivation Step ---
+    # If the QUADRANT column is not in the uploaded file, create it.
+    quadrants_derived = 'QUADRANT' not in df.columns
+    if quadrants_derived:
+        if 'X_COORDINATES' not in df.columns or 'Y_COORDINATES' not in df.columns:
+            raise QuadrantDerivationError("Cannot derive quadrants because 'X_COORDINATES' or 'Y_COORDINATES' are missing.")
+        if quadrant_midpoint is None:
+            quadrant_midpoint = cloud_midpoint(df['X_COORDINATES'], df['Y_COORDINATES'])
+        df = assign_quadrants(df, quadrant_midpoint)
+
+    # --- Compact Storage Step ---
+    df, memory = normalize_dtypes(df, before_bytes)
+    diagnostics = {
+        **memory,
+        'rows': len(df),
+        'quadrants_derived': quadrants_derived,
+        'quadrant_midpoint': quadrant_midpoint if quadrants_derived else None,
+        'unknown_quadrants': int((quadrant_codes_from_labels(df['QUADRANT']) == _UNASSIGNED).sum()),
+        'malformed_rows': len(malformed),
+        'malformed_examples': malformed[:MALFORMED_ROW_EXAMPLES],
+    }
+    return df, diagnostics
+
+def parse_defect_source(source, data=None, digest=None, progress=None):
+    """
+    Reads any supported defect file (see src/ingest.py) and runs process_defect_table on it.
+    ``progress`` is passed to read_defect_table for streaming readers.
+
+    Returns:
+        tuple: (compact DataFrame, diagnostics dict).
+    """
+    return process_defect_table(read_defect_table(source, data=data, digest=digest, progress=progress))
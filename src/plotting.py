@@ -1,23 +1,46 @@
 # src/plotting.py
 
+import copy
+from functools import lru_cache
+
 import plotly.graph_objects as go
 import pandas as pd
+import numpy as np
 
-# (You may have other plotting functions here like create_defect_traces, etc. Leave them as they are)
+from src.config import RENDER_POINT_THRESHOLD, QUADRANT_ORDER, CLUSTER_OVERLAY_MAX
+from src.instrumentation import timed
 
 # ==============================================================================
 # --- DEFINITIVE create_grid_shapes FUNCTION ---
 # ==============================================================================
 
+@timed('plotting.create_grid_shapes')
 def create_grid_shapes(panel_rows, panel_cols, gap_size, quadrant='All', panel_fill_color='#8B4513', grid_line_color='black'):
     """
     Generates the shape objects for the panel grid.
 
     This function is now a simple 'artist'. It only draws what it's told to draw
     with the colors it is given. It handles both the 'All' view and single quadrant views.
+
+    Each panel is one filled rectangle plus a single SVG path holding all of its inner
+    grid lines, so the layout carries 2 shapes per panel instead of one per line. The
+    shapes are memoized on the arguments and deep-copied on every call, so a caller
+    editing a figure's shapes in place cannot change the memoized ones.
     """
-    shapes = []
+    return copy.deepcopy(list(_grid_shapes(panel_rows, panel_cols, gap_size, quadrant, panel_fill_color, grid_line_color)))
 
+def clear_render_caches():
+    """Drops the memoized grid shapes, e.g. so a benchmark measures a cold build."""
+    _grid_shapes.cache_clear()
+
+def _panel_grid_path(x_start, y_start, panel_rows, panel_cols):
+    """SVG path with every inner grid line of one panel as a separate move/line segment."""
+    segments = [f"M{x_start + i},{y_start}V{y_start + panel_rows}" for i in range(1, panel_cols)]
+    segments += [f"M{x_start},{y_start + i}H{x_start + panel_cols}" for i in range(1, panel_rows)]
+    return "".join(segments)
+
+@lru_cache(maxsize=64)
+def _grid_shapes(panel_rows, panel_cols, gap_size, quadrant, panel_fill_color, grid_line_color):
     if quadrant == 'All':
         # Define the starting corner for each of the four panels
         panel_origins = [
@@ -26,28 +49,15 @@ def create_grid_shapes(panel_rows, panel_cols, gap_size, quadrant='All', panel_f
             (0, panel_rows + gap_size),                  # Top-Left (Q3)
             (panel_cols + gap_size, panel_rows + gap_size) # Top-Right (Q4)
         ]
-        
-        for x_start, y_start in panel_origins:
-            # Add the main panel rectangle
-            shapes.append(go.layout.Shape(
-                type="rect",
-                x0=x_start, y0=y_start,
-                x1=x_start + panel_cols, y1=y_start + panel_rows,
-                line=dict(color=grid_line_color, width=3),
-                fillcolor=panel_fill_color,
-                layer='below'
-            ))
-            # Add the inner grid lines
-            for i in range(1, panel_cols):
-                shapes.append(go.layout.Shape(type="line", x0=x_start + i, y0=y_start, x1=x_start + i, y1=y_start + panel_rows, line=dict(color=grid_line_color, width=0.5), layer='below'))
-            for i in range(1, panel_rows):
-                shapes.append(go.layout.Shape(type="line", x0=x_start, y0=y_start + i, x1=x_start + panel_cols, y1=y_start + i, line=dict(color=grid_line_color, width=0.5), layer='below'))
-    
     else: # Handle single quadrant view (e.g., 'Q1', 'Q2', etc.)
         # In a single quadrant view, we draw only one panel, and we draw it at origin (0,0)
         # because the axis range in app.py will handle the zoom.
-        x_start, y_start = 0, 0
-        shapes.append(go.layout.Shape(
+        panel_origins = [(0, 0)]
+
+    shapes = []
+    for x_start, y_start in panel_origins:
+        # Add the main panel rectangle
+        shapes.append(dict(
             type="rect",
             x0=x_start, y0=y_start,
             x1=x_start + panel_cols, y1=y_start + panel_rows,
@@ -55,52 +65,205 @@ def create_grid_shapes(panel_rows, panel_cols, gap_size, quadrant='All', panel_f
             fillcolor=panel_fill_color,
             layer='below'
         ))
-        for i in range(1, panel_cols):
-            shapes.append(go.layout.Shape(type="line", x0=x_start + i, y0=y_start, x1=x_start + i, y1=y_start + panel_rows, line=dict(color=grid_line_color, width=0.5), layer='below'))
-        for i in range(1, panel_rows):
-            shapes.append(go.layout.Shape(type="line", x0=x_start, y0=y_start + i, x1=x_start + panel_cols, y1=y_start + i, line=dict(color=grid_line_color, width=0.5), layer='below'))
-            
-    return shapes
+        # Add the inner grid lines as one path
+        if panel_rows > 1 or panel_cols > 1:
+            shapes.append(dict(
+                type="path",
+                path=_panel_grid_path(x_start, y_start, panel_rows, panel_cols),
+                line=dict(color=grid_line_color, width=0.5),
+                layer='below'
+            ))
+    return tuple(shapes)
 
 # ==============================================================================
-# --- Your Other Plotting Functions (Unchanged) ---
+# --- Defect Map, Heatmap and Chart Traces ---
 # ==============================================================================
 
-def create_defect_traces(df):
-    # Your existing code for this function...
+@timed('plotting.create_defect_traces')
+def create_defect_traces(df, max_points=RENDER_POINT_THRESHOLD):
+    """
+    Builds the defect map traces, choosing the renderer by data size.
+
+    Up to ``max_points`` defects are drawn individually as WebGL points. Larger
+    selections are aggregated server-side into per-unit-cell counts per defect type,
+    so the browser payload is bounded by the grid size rather than the defect count.
+    """
+    if len(df) <= max_points:
+        return _create_point_traces(df)
+    return _create_binned_traces(df)
+
+def _create_point_traces(df):
+    # One groupby pass gives the row positions of every defect type.
+    plot_x = df['PLOT_X'].to_numpy()
+    plot_y = df['PLOT_Y'].to_numpy()
     traces = []
-    defect_types = df['DEFECT_TYPE'].unique()
-    for defect in defect_types:
-        defect_df = df[df['DEFECT_TYPE'] == defect]
-        traces.append(go.Scatter(
-            x=defect_df['PLOT_X'],
-            y=defect_df['PLOT_Y'],
+    for defect, rows in df.groupby('DEFECT_TYPE', observed=True, sort=False).indices.items():
+        traces.append(go.Scattergl(
+            x=plot_x[rows],
+            y=plot_y[rows],
             mode='markers',
-            name=defect,
+            name=str(defect),
             marker=dict(size=8, opacity=0.8)
         ))
     return traces
 
-def create_pareto_trace(df):
-    # Your existing code for this function...
-    counts = df['DEFECT_TYPE'].value_counts()
+def _create_binned_traces(df):
+    counts = df.groupby(['DEFECT_TYPE', 'PLOT_X', 'PLOT_Y'], observed=True, sort=False).size()
+    counts = counts[counts > 0]
+    defect_types = counts.index.get_level_values('DEFECT_TYPE').unique()
+    max_count = counts.max() if len(counts) else 1
+    traces = []
+    for k, defect in enumerate(defect_types):
+        cell_counts = counts.xs(defect, level='DEFECT_TYPE')
+        # Each defect type gets its own slot on a small ring inside the cell so that
+        # markers of different types in the same cell do not hide each other.
+        angle = 2 * np.pi * k / len(defect_types)
+        offset = 0.25 if len(defect_types) > 1 else 0.0
+        traces.append(go.Scattergl(
+            x=cell_counts.index.get_level_values('PLOT_X') + offset * np.cos(angle),
+            y=cell_counts.index.get_level_values('PLOT_Y') + offset * np.sin(angle),
+            mode='markers',
+            name=str(defect),
+            text=cell_counts.to_numpy(),
+            hovertemplate='%{text} defects<extra>%{fullData.name}</extra>',
+            marker=dict(size=4 + 16 * np.sqrt(cell_counts.to_numpy() / max_count), opacity=0.8)
+        ))
+    return traces
+
+@timed('plotting.create_unit_heatmap')
+def create_unit_heatmap(unit_counts, gap_size, quadrant='All', defect_type=None, colorscale='Reds'):
+    """
+    Heatmap of defects per unit cell, laid out on the same coordinates as create_grid_shapes:
+    the four panels with their gaps for 'All', a single panel at the origin otherwise.
+    Defect-free cells and gaps are left transparent so the panel fill and grid show through.
+    """
+    panel_rows, panel_cols = unit_counts.by_type.shape[2:]
+    if quadrant == 'All':
+        z = np.full((2 * panel_rows + gap_size, 2 * panel_cols + gap_size), np.nan)
+        for q, quad in enumerate(QUADRANT_ORDER):
+            row0 = (q // 2) * (panel_rows + gap_size)
+            col0 = (q % 2) * (panel_cols + gap_size)
+            z[row0:row0 + panel_rows, col0:col0 + panel_cols] = unit_counts.matrix(quad, defect_type)
+    else:
+        z = unit_counts.matrix(quadrant, defect_type).astype(np.float64)
+    z[z == 0] = np.nan
+    return go.Heatmap(
+        z=z,
+        x=np.arange(z.shape[1]) + 0.5,
+        y=np.arange(z.shape[0]) + 0.5,
+        colorscale=colorscale,
+        xgap=1, ygap=1,
+        colorbar=dict(title='Defects'),
+        hovertemplate='%{z:,} defects<extra></extra>'
+    )
+
+@timed('plotting.create_cluster_overlay')
+def create_cluster_overlay(df, clusters, quadrant='All', max_clusters=CLUSTER_OVERLAY_MAX, line_color='#00E5FF'):
+    """
+    Outlines the largest clusters on the defect map.
+
+    Each box covers the unit cells of the cluster's defects in ``df`` (a projected frame
+    aligned with ``clusters.labels``), restricted to ``quadrant`` unless it is 'All'.
+
+    Returns:
+        tuple: (shapes, annotations) for fig.update_layout.
+    """
+    labels = clusters.labels
+    member = (labels > 0) & (labels <= max_clusters)
+    if quadrant != 'All':
+        member &= (df['QUADRANT'] == quadrant).to_numpy()
+    if not member.any():
+        return [], []
+    boxes = (pd.DataFrame({'X': df['PLOT_X'].to_numpy()[member], 'Y': df['PLOT_Y'].to_numpy()[member]})
+             .groupby(labels[member], sort=True).agg(['min', 'max']))
+    sizes = clusters.table.set_index('CLUSTER_ID')['DEFECTS']
+    shapes, annotations = [], []
+    for cluster_id, (x0, x1, y0, y1) in zip(boxes.index.tolist(), boxes[[('X', 'min'), ('X', 'max'), ('Y', 'min'), ('Y', 'max')]].to_numpy().tolist()):
+        # PLOT_X/PLOT_Y are cell centres; the box extends to the cell edges.
+        shapes.append(dict(type='rect', x0=x0 - 0.5, x1=x1 + 0.5, y0=y0 - 0.5, y1=y1 + 0.5,
+                           line=dict(color=line_color, width=2, dash='dash'), layer='above'))
+        annotations.append(dict(x=x0 - 0.5, y=y1 + 0.5, text=f"C{cluster_id} ({sizes[cluster_id]:,})",
+                                showarrow=False, xanchor='left', yanchor='bottom',
+                                font=dict(color=line_color, size=11), bgcolor='rgba(0,0,0,0.5)'))
+    return shapes, annotations
+
+@timed('plotting.figure_payload_bytes')
+def figure_payload_bytes(fig):
+    """Size of the JSON that Streamlit sends to the browser for a figure."""
+    return len(fig.to_json())
+
+# Allowance per layout shape or annotation in figure_data_bytes (a grid cell shape is ~200 bytes of JSON).
+_LAYOUT_ITEM_BYTES = 256
+
+def figure_data_bytes(fig):
+    """
+    Approximate size of a figure's data without encoding it: the bytes of every trace
+    array, string and number, plus an allowance per layout shape and annotation.
+    Several times cheaper than figure_payload_bytes, for budgeting the figure memo.
+    """
+    size = sum(_value_bytes(trace.to_plotly_json()) for trace in fig.data)
+    return size + _LAYOUT_ITEM_BYTES * (len(fig.layout.shapes) + len(fig.layout.annotations))
+
+def _value_bytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(_value_bytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_value_bytes(v) for v in value)
+    return 8
+
+@timed('plotting.create_pareto_trace')
+def create_pareto_trace(cube, quadrant='All'):
+    """Pareto bar trace for a quadrant (or 'All'), read from the lot's aggregate cube."""
+    counts = cube.defect_counts(quadrant)
     return go.Bar(x=counts.index, y=counts.values)
 
-def create_grouped_pareto_trace(df):
-    # Your existing code for this function...
-    grouped = df.groupby(['QUADRANT', 'DEFECT_TYPE']).size().reset_index(name='COUNT')
+@timed('plotting.create_grouped_pareto_trace')
+def create_grouped_pareto_trace(cube):
+    """One bar trace per quadrant with every defect type present, read from the aggregate cube."""
+    type_counts = cube.type_counts
+    # Ensure all defect types are present for consistent grouping
+    type_counts = type_counts[type_counts.sum(axis=1) > 0]
     traces = []
-    quadrants = ['Q1', 'Q2', 'Q3', 'Q4']
-    all_defects = df['DEFECT_TYPE'].unique()
-    for quad in quadrants:
-        quad_df = grouped[grouped['QUADRANT'] == quad]
-        # Ensure all defect types are present for consistent grouping
-        counts = {defect: 0 for defect in all_defects}
-        for _, row in quad_df.iterrows():
-            counts[row['DEFECT_TYPE']] = row['COUNT']
+    for quad in QUADRANT_ORDER:
+        counts = type_counts[quad] if quad in type_counts else pd.Series(0, index=type_counts.index)
         traces.append(go.Bar(
             name=quad,
-            x=list(counts.keys()),
-            y=list(counts.values())
+            x=list(type_counts.index),
+            y=counts.tolist()
+        ))
+    return traces
+
+@timed('plotting.create_trend_traces')
+def create_trend_traces(trend, share=False):
+    """
+    One line per defect type across lots, in lot-time order, from HistoryStore.trend().
+    With ``share`` the y values are percentages of each lot's defects instead of counts.
+    """
+    if trend.empty:
+        return []
+    lots = trend.drop_duplicates('lot_id')
+    counts = (trend.pivot_table(index='lot_id', columns='defect_type', values='count', aggfunc='sum', fill_value=0)
+              .reindex(lots['lot_id'], fill_value=0))
+    counts = counts[counts.sum().sort_values(ascending=False, kind='stable').index]
+    lot_times = pd.to_datetime(lots['lot_time'].to_numpy(), unit='s')
+    totals = lots['total_defects'].to_numpy(dtype=np.float64)
+    if share:
+        counts = counts.div(np.where(totals > 0, totals, np.nan), axis=0).fillna(0) * 100
+    hover = '%{text}<br>%{y:,.1f}%<extra>%{fullData.name}</extra>' if share else '%{text}<br>%{y:,} defects<extra>%{fullData.name}</extra>'
+    traces = []
+    for defect in counts.columns:
+        # WebGL lines keep a trend over thousands of lots responsive.
+        traces.append(go.Scattergl(
+            x=lot_times,
+            y=counts[defect].to_numpy(),
+            mode='lines+markers',
+            name=str(defect),
+            text=lots['name'].to_numpy(),
+            hovertemplate=hover,
+            marker=dict(size=4)
         ))
     return traces
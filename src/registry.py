@@ -0,0 +1,148 @@
+# src/registry.py
+# This module contains the process-wide dataset registry: parsed lots keyed by content
+# hash and shared by every session, held within one memory budget. Lots evicted from
+# memory are spilled to Feather files, so reopening them skips parsing and validation.
+
+import glob
+import json
+import logging
+import os
+import threading
+
+import pandas as pd
+
+from src.cache import LRUCache
+from src.instrumentation import count
+
+logger = logging.getLogger(__name__)
+
+class DatasetRegistry(LRUCache):
+    """
+    An LRUCache of parsed lots (dicts holding at least 'df' and 'diagnostics') with a
+    disk spill behind it.
+
+    Identical uploads share one entry, whichever session parsed them first, so callers
+    must not mutate a registry frame in place: derive new columns on a shallow copy
+    (as project_layout does) instead.
+    Entries evicted for the memory budget are written to ``spill_dir`` and loaded
+    again by get(); ``restore(df, diagnostics)`` rebuilds the entry from the spilled
+    frame. The spill directory is pruned oldest-first to ``spill_max_bytes``.
+    A lot larger than the whole budget stays in memory on its own until another lot is
+    put (see LRUCache), so it is not spilled and reloaded on every rerun; a warning
+    is logged because the budget is then too small for the lots being opened.
+    """
+
+    def __init__(self, max_entries, max_bytes, sizeof, restore, spill_dir=None, spill_max_bytes=None):
+        super().__init__(max_entries=max_entries, max_bytes=max_bytes, sizeof=sizeof, on_evict=self._spill)
+        self._restore = restore
+        self.spill_dir = spill_dir
+        self.spill_max_bytes = spill_max_bytes
+        self._spill_lock = threading.Lock()
+        self.spills = 0
+        self.reloads = 0
+
+    def _paths(self, key):
+        stem = os.path.join(self.spill_dir, str(key))
+        return f"{stem}.feather", f"{stem}.json"
+
+    def get(self, key, default=None):
+        entry = super().get(key)
+        if entry is None:
+            entry = self._reload(key)
+        return entry if entry is not None else default
+
+    def _reload(self, key):
+        if not self.spill_dir:
+            return None
+        frame_path, meta_path = self._paths(key)
+        if not os.path.exists(frame_path):
+            return None
+        try:
+            with open(meta_path) as f:
+                diagnostics = json.load(f)
+            df = pd.read_feather(frame_path)
+        except Exception:
+            return None  # A corrupt spill file is treated as a miss; the upload is parsed again.
+        entry = self._restore(df, diagnostics)
+        self.reloads += 1
+        count('dataset_registry.reload')
+        os.utime(frame_path)   # keeps recently reopened lots out of the pruning
+        super().put(key, entry)
+        return entry
+
+    def _oversize(self, key, size):
+        count('dataset_registry.oversize')
+        logger.warning("Lot %s needs %.0f MiB, more than the %.0f MiB dataset memory budget; it is kept "
+                       "in memory alone. Raise AOI_MEMORY_BUDGET_MB to cache it alongside other lots.",
+                       key, size / 2**20, self.max_bytes / 2**20)
+
+    def _spill(self, key, entry):
+        if not self.spill_dir:
+            return
+        frame_path, meta_path = self._paths(key)
+        if os.path.exists(frame_path):
+            return   # Spilled before and unchanged: lots are immutable per content hash.
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            # Written atomically, metadata first, so a reader never sees a frame without it.
+            for path, write in ((meta_path, lambda p: _write_json(entry['diagnostics'], p)),
+                                (frame_path, lambda p: entry['df'].reset_index(drop=True).to_feather(p))):
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                write(tmp_path)
+                os.replace(tmp_path, path)
+        except Exception:
+            return   # The spill is an optimization; a full or read-only disk must not break eviction.
+        self.spills += 1
+        count('dataset_registry.spill')
+        self._prune()
+
+    def _prune(self):
+        if self.spill_max_bytes is None:
+            return
+        with self._spill_lock:
+            frames = sorted(glob.glob(os.path.join(self.spill_dir, '*.feather')), key=_mtime)
+            sizes = [_size(path) for path in frames]
+            total = sum(sizes)
+            for path, size in zip(frames, sizes):
+                if total <= self.spill_max_bytes:
+                    break
+                for stale in (path, path[:-len('.feather')] + '.json'):
+                    try:
+                        os.remove(stale)
+                    except OSError:
+                        pass
+                total -= size
+
+    def spill_usage(self):
+        """Returns (number of spilled lots, bytes on disk)."""
+        if not self.spill_dir:
+            return 0, 0
+        frames = glob.glob(os.path.join(self.spill_dir, '*.feather'))
+        return len(frames), sum(_size(path) for path in frames)
+
+    def stats(self):
+        """LRUCache counters plus the memory budget and the spill counters and usage."""
+        stats = super().stats()
+        spilled, spill_bytes = self.spill_usage()
+        stats.update({'budget_bytes': self.max_bytes, 'spills': self.spills, 'reloads': self.reloads,
+                      'spilled_lots': spilled, 'spill_bytes': spill_bytes})
+        return stats
+
+
+def _write_json(value, path):
+    with open(path, 'w') as f:
+        json.dump(value, f, default=str)
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0.0
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
@@ -1,69 +1,204 @@
 # src/reporting.py
 # This module contains all functions related to generating professional, presentation-ready reports.
 
-import pandas as pd
+import glob
 import io
+import os
+import tempfile
+import threading
 
-def generate_excel_report(full_df, panel_rows, panel_cols):
+import numpy as np
+import xlsxwriter
+
+from src.aggregates import build_defect_cube
+from src.config import REPORT_SPILL_ROWS
+from src.instrumentation import timed
+
+# Excel's hard limit is 1,048,576 rows per sheet; one row is used by the header.
+_MAX_DATA_ROWS_PER_SHEET = 1048575
+# Rows converted to Python objects at a time when streaming the defect list.
+_STREAM_CHUNK_ROWS = 50000
+
+def _set_column_widths(worksheet, rows):
+    """Sizes columns to their longest value (autofit is unavailable in constant_memory mode)."""
+    widths = {}
+    for row in rows:
+        for col_num, value in enumerate(row):
+            text = f"{value:.2f}" if isinstance(value, float) else str(value)
+            widths[col_num] = max(widths.get(col_num, 0), len(text))
+    for col_num, width in widths.items():
+        worksheet.set_column(col_num, col_num, width + 2)
+
+def _write_defect_list(workbook, full_df, header_format):
+    """
+    Streams the defect rows into one or more 'Full Defect List' sheets, chunk by chunk,
+    so only a bounded slice of the frame is ever converted to Python objects.
+    """
+    # --- BUG FIX: Select only the relevant columns for the final report ---
+    report_columns = ['UNIT_INDEX_X', 'UNIT_INDEX_Y', 'DEFECT_TYPE', 'QUADRANT']
+    # Ensure columns exist before trying to select them
+    final_df = full_df[[col for col in report_columns if col in full_df.columns]]
+
+    sheet_starts = range(0, max(len(final_df), 1), _MAX_DATA_ROWS_PER_SHEET)
+    for sheet_num, sheet_start in enumerate(sheet_starts):
+        sheet_name = 'Full Defect List' if sheet_num == 0 else f'Full Defect List ({sheet_num + 1})'
+        worksheet = workbook.add_worksheet(sheet_name)
+        worksheet.set_column(0, len(final_df.columns) - 1, 16)
+        worksheet.write_row(0, 0, list(final_df.columns), header_format)
+
+        sheet_end = min(sheet_start + _MAX_DATA_ROWS_PER_SHEET, len(final_df))
+        row_num = 1
+        for chunk_start in range(sheet_start, sheet_end, _STREAM_CHUNK_ROWS):
+            chunk = final_df.iloc[chunk_start:min(chunk_start + _STREAM_CHUNK_ROWS, sheet_end)]
+            # Missing values become None, which xlsxwriter leaves as empty cells.
+            chunk = chunk.astype(object).where(chunk.notna(), None)
+            for values in chunk.itertuples(index=False, name=None):
+                worksheet.write_row(row_num, 0, values)
+                row_num += 1
+
+def _write_cluster_list(workbook, clusters, header_format):
+    """Lists every cluster, largest first, with its bounding box."""
+    worksheet = workbook.add_worksheet('Clusters')
+    box_label = 'Unit' if clusters.mode == 'units' else 'Coordinate'
+    header = ['Cluster', 'Defects', 'Cells', 'Dominant Type', 'Quadrants',
+              f'{box_label} X Min', f'{box_label} X Max', f'{box_label} Y Min', f'{box_label} Y Max']
+    rows = [tuple(v.item() if isinstance(v, np.generic) else v for v in row)
+            for row in clusters.table.itertuples(index=False, name=None)]
+    _set_column_widths(worksheet, [header] + rows)
+    worksheet.write_row(0, 0, header, header_format)
+    for row_num, values in enumerate(rows, start=1):
+        worksheet.write_row(row_num, 0, values)
+    if not rows:
+        worksheet.write(1, 0, 'No clusters found.')
+
+def _write_map_images(workbook, map_images, header_format):
+    """Stacks the rendered defect maps down one sheet, each under its label."""
+    worksheet = workbook.add_worksheet('Defect Maps')
+    worksheet.set_column(0, 0, 12)
+    row = 0
+    for label, png in map_images:
+        worksheet.write(row, 0, label, header_format)
+        worksheet.insert_image(row + 1, 0, f"{label}.png", {'image_data': io.BytesIO(png), 'object_position': 3})
+        # Default rows are 20 px high; leave room for the image plus a blank row.
+        _, height = _png_size(png)
+        row += 2 + -(-height // 20)
+
+def _png_size(png):
+    """(width, height) in pixels, read from the PNG header."""
+    return int.from_bytes(png[16:20], 'big'), int.from_bytes(png[20:24], 'big')
+
+@timed('reporting.generate_excel_report')
+def generate_excel_report(full_df, panel_rows, panel_cols, cube=None, output=None, clusters=None, map_images=None):
     """
     Generates a comprehensive, multi-sheet Excel report with professional
     formatting and an embedded summary chart.
-    
+
+    The workbook is written with xlsxwriter's constant_memory mode, streaming each
+    sheet row by row. Without ``output``, lots larger than REPORT_SPILL_ROWS are built
+    in a temporary file rather than in RAM, but the finished file is still returned as
+    bytes; pass ``output`` (or use write_report_file) to keep it out of memory.
+
     Args:
         full_df (pd.DataFrame): The complete, unfiltered dataframe.
         panel_rows (int): The number of rows in a single panel.
         panel_cols (int): The number of columns in a single panel.
+        cube (DefectCube, optional): The lot's aggregate cube; built from full_df if omitted.
+        output (str, optional): Path to write the workbook to instead of returning bytes.
+        clusters (DefectClusters, optional): Spatial clusters to list on a 'Clusters' sheet.
+        map_images (list, optional): (label, PNG bytes) pairs, e.g. from
+            static_maps.render_map_images, placed on a 'Defect Maps' sheet.
 
     Returns:
-        bytes: The Excel file as an in-memory bytes object.
+        bytes: The Excel file as an in-memory bytes object, or None if ``output`` was given.
+    """
+    if cube is None:
+        cube = build_defect_cube(full_df)
+
+    if output is not None:
+        _write_workbook(output, {'constant_memory': True}, full_df, panel_rows, panel_cols, cube, clusters, map_images)
+        return None
+
+    if len(full_df) <= REPORT_SPILL_ROWS:
+        output_buffer = io.BytesIO()
+        _write_workbook(output_buffer, {'in_memory': True}, full_df, panel_rows, panel_cols, cube, clusters, map_images)
+        return output_buffer.getvalue()
+
+    fd, tmp_path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        _write_workbook(tmp_path, {'constant_memory': True}, full_df, panel_rows, panel_cols, cube, clusters, map_images)
+        with open(tmp_path, 'rb') as f:
+            return f.read()
+    finally:
+        os.remove(tmp_path)
+
+def write_report_file(path, full_df, panel_rows, panel_cols, **kwargs):
     """
-    output_buffer = io.BytesIO()
+    Writes the report to ``path`` (see generate_excel_report for the keyword arguments)
+    through a temporary file beside it, so a reader never sees a half-written workbook.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        generate_excel_report(full_df, panel_rows, panel_cols, output=tmp_path, **kwargs)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def prune_report_files(report_dir, keep):
+    """Deletes all but the ``keep`` most recently modified .xlsx files in ``report_dir``."""
+    paths = sorted(glob.glob(os.path.join(report_dir, '*.xlsx')), key=_mtime, reverse=True)
+    for path in paths[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0.0
+
+def _write_workbook(target, options, full_df, panel_rows, panel_cols, cube, clusters, map_images):
+    with xlsxwriter.Workbook(target, options) as workbook:
 
-    with pd.ExcelWriter(output_buffer, engine='xlsxwriter') as writer:
-        workbook = writer.book
-        
         # --- Define Professional Formats ---
         header_format = workbook.add_format({
-            'bold': True, 'text_wrap': True, 'valign': 'top', 
+            'bold': True, 'text_wrap': True, 'valign': 'top',
             'fg_color': '#D7E4BC', 'border': 1, 'align': 'center'
         })
         cell_format = workbook.add_format({'border': 1})
+        density_format = workbook.add_format({'num_format': '0.00', 'border': 1})
         percent_format = workbook.add_format({'num_format': '0.00%', 'border': 1})
 
         # --- Sheet 1: Quarterly Summary ---
         worksheet = workbook.add_worksheet('Quarterly Summary')
-        writer.sheets['Quarterly Summary'] = worksheet
 
-        kpi_data = []
+        summary_header = ["Quadrant", "Total Defects", "Defect Density"]
+        summary_rows = []
         quadrants = ['Q1', 'Q2', 'Q3', 'Q4']
-        
+
         for quad in quadrants:
-            quad_df = full_df[full_df['QUADRANT'] == quad]
-            kpi_data.append({"Quadrant": quad, "Total Defects": len(quad_df), "Defect Density": len(quad_df) / (panel_rows * panel_cols)})
-        
+            quad_total = cube.quadrant_total(quad)
+            summary_rows.append((quad, quad_total, quad_total / (panel_rows * panel_cols)))
+
         total_defects_all = len(full_df)
         density_all = total_defects_all / (4 * panel_rows * panel_cols) if (panel_rows * panel_cols) > 0 else 0
-        kpi_data.append({"Quadrant": "Total", "Total Defects": total_defects_all, "Defect Density": density_all})
-        
-        summary_df = pd.DataFrame(kpi_data)
-        
-        summary_df.to_excel(writer, sheet_name='Quarterly Summary', startrow=1, header=False, index=False)
-        
-        for col_num, value in enumerate(summary_df.columns.values):
-            worksheet.write(0, col_num, value, header_format)
-            
-        for row_num in range(len(summary_df)):
-            worksheet.write(row_num + 1, 0, summary_df.iloc[row_num, 0], cell_format)
-            worksheet.write(row_num + 1, 1, summary_df.iloc[row_num, 1], cell_format)
-            worksheet.write(row_num + 1, 2, summary_df.iloc[row_num, 2], workbook.add_format({'num_format': '0.00', 'border': 1}))
-
-        worksheet.autofit()
-        
+        summary_rows.append(("Total", total_defects_all, density_all))
+
+        _set_column_widths(worksheet, [summary_header] + summary_rows)
+        worksheet.write_row(0, 0, summary_header, header_format)
+        for row_num, (quad, total, density) in enumerate(summary_rows, start=1):
+            worksheet.write(row_num, 0, quad, cell_format)
+            worksheet.write(row_num, 1, total, cell_format)
+            worksheet.write(row_num, 2, density, density_format)
+
         chart = workbook.add_chart({'type': 'column'})
         chart.add_series({
             'name':       'Total Defects by Quadrant',
-            'categories': ['Quarterly Summary', 2, 0, 5, 0],
-            'values':     ['Quarterly Summary', 2, 1, 5, 1],
+            'categories': ['Quarterly Summary', 1, 0, 4, 0],
+            'values':     ['Quarterly Summary', 1, 1, 4, 1],
         })
         chart.set_title({'name': 'Defect Count Comparison'})
         chart.set_legend({'position': 'none'})
@@ -71,36 +206,29 @@ def generate_excel_report(full_df, panel_rows, panel_cols):
 
         # --- Create a separate sheet for each quadrant's top offenders ---
         for quad in quadrants:
-            quad_df = full_df[full_df['QUADRANT'] == quad]
-            if not quad_df.empty:
-                sheet_name = f'{quad} Top Defects'
-                worksheet = workbook.add_worksheet(sheet_name)
-                writer.sheets[sheet_name] = worksheet
-                
-                top_offenders = quad_df['DEFECT_TYPE'].value_counts().reset_index()
-                top_offenders.columns = ['Defect Type', 'Count']
-                top_offenders['Percentage'] = (top_offenders['Count'] / len(quad_df))
-                
-                top_offenders.to_excel(writer, sheet_name=sheet_name, startrow=1, header=False, index=False)
-                
-                for col_num, value in enumerate(top_offenders.columns.values):
-                    worksheet.write(0, col_num, value, header_format)
-
-                worksheet.set_column('C:C', 12, percent_format)
-                worksheet.autofit()
+            quad_total = cube.quadrant_total(quad)
+            if quad_total > 0:
+                worksheet = workbook.add_worksheet(f'{quad} Top Defects')
 
-        # --- Final Sheet: Full Defect List (Cleaned) ---
-        # --- BUG FIX: Select only the relevant columns for the final report ---
-        report_columns = ['UNIT_INDEX_X', 'UNIT_INDEX_Y', 'DEFECT_TYPE', 'QUADRANT']
-        # Ensure columns exist before trying to select them
-        final_df = full_df[[col for col in report_columns if col in full_df.columns]]
+                top_offenders = cube.defect_counts(quad)
+                offender_header = ['Defect Type', 'Count', 'Percentage']
+                offender_rows = [(str(defect), int(count), count / quad_total) for defect, count in top_offenders.items()]
+
+                _set_column_widths(worksheet, [offender_header] + offender_rows)
+                worksheet.set_column('C:C', 12)
+                worksheet.write_row(0, 0, offender_header, header_format)
+                for row_num, (defect, count, share) in enumerate(offender_rows, start=1):
+                    worksheet.write(row_num, 0, defect)
+                    worksheet.write(row_num, 1, count)
+                    worksheet.write(row_num, 2, share, percent_format)
 
-        final_df.to_excel(writer, sheet_name='Full Defect List', startrow=1, header=False, index=False)
-        worksheet = writer.sheets['Full Defect List']
-        for col_num, value in enumerate(final_df.columns.values):
-            worksheet.write(0, col_num, value, header_format)
-        worksheet.autofit()
+        # --- Clusters Sheet ---
+        if clusters is not None:
+            _write_cluster_list(workbook, clusters, header_format)
 
-    excel_bytes = output_buffer.getvalue()
-    return excel_bytes
+        # --- Defect Maps Sheet ---
+        if map_images:
+            _write_map_images(workbook, map_images, header_format)
 
+        # --- Final Sheet: Full Defect List (Cleaned) ---
+        _write_defect_list(workbook, full_df, header_format)
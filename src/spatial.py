@@ -0,0 +1,80 @@
+# src/spatial.py
+# This module contains the unit-cell spatial index used to resolve map selections
+# (clicks, boxes and lassos) back to defect rows without scanning the frame.
+
+import numpy as np
+
+
+class CellIndex:
+    """
+    CSR-style index from global grid cell to defect row positions.
+
+    Every defect of a projected lot sits at the centre of a unit cell on the 'All' map,
+    so cells are the natural unit of selection. Rows are sorted by cell id with a single
+    argsort; ``offsets[c]:offsets[c + 1]`` then slices the rows of cell ``c``.
+    """
+
+    def __init__(self, df, panel_rows, panel_cols, gap_size):
+        self.width = 2 * panel_cols + gap_size
+        self.height = 2 * panel_rows + gap_size
+
+        grid_x = np.floor(df['PLOT_X'].to_numpy(dtype=np.float64))
+        grid_y = np.floor(df['PLOT_Y'].to_numpy(dtype=np.float64))
+        valid = (grid_x >= 0) & (grid_x < self.width) & (grid_y >= 0) & (grid_y < self.height)
+        cells = np.where(valid, grid_y * self.width + grid_x, -1).astype(np.int64)
+
+        order = np.argsort(cells, kind='stable')
+        n_invalid = int((~valid).sum())
+        self.rows = order[n_invalid:]          # invalid rows (-1) sort first and are dropped
+        counts = np.bincount(cells[valid], minlength=self.width * self.height)
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+        self._occupied = np.flatnonzero(counts)
+
+    def rows_in_cells(self, cell_ids):
+        """Row positions of all defects in the given cells, in cell order."""
+        cell_ids = np.asarray(cell_ids, dtype=np.int64)
+        if cell_ids.size == 0:
+            return np.empty(0, dtype=np.int64)
+        starts, ends = self.offsets[cell_ids], self.offsets[cell_ids + 1]
+        return np.concatenate([self.rows[s:e] for s, e in zip(starts, ends) if e > s] or [np.empty(0, dtype=np.int64)])
+
+    def cell_at(self, x, y):
+        """Cell id containing a plot coordinate, or None outside the grid."""
+        grid_x, grid_y = int(np.floor(x)), int(np.floor(y))
+        if 0 <= grid_x < self.width and 0 <= grid_y < self.height:
+            return grid_y * self.width + grid_x
+        return None
+
+    def _occupied_centres(self):
+        cells = self._occupied
+        return cells, (cells % self.width) + 0.5, (cells // self.width) + 0.5
+
+    def cells_in_box(self, x_range, y_range):
+        """Occupied cells whose centre lies inside an axis-aligned box."""
+        cells, centre_x, centre_y = self._occupied_centres()
+        x0, x1 = sorted(x_range)
+        y0, y1 = sorted(y_range)
+        return cells[(centre_x >= x0) & (centre_x <= x1) & (centre_y >= y0) & (centre_y <= y1)]
+
+    def cells_in_lasso(self, xs, ys):
+        """Occupied cells whose centre lies inside a lasso polygon."""
+        from matplotlib.path import Path  # Only needed for lasso selections.
+        cells, centre_x, centre_y = self._occupied_centres()
+        polygon = Path(np.column_stack([xs, ys]))
+        return cells[polygon.contains_points(np.column_stack([centre_x, centre_y]))]
+
+    def rows_for_selection(self, selection):
+        """
+        Resolves a Streamlit Plotly selection state (points, box and lasso entries) to
+        the sorted row positions it covers. Every row belongs to exactly one cell, so
+        de-duplicating the cells is enough to de-duplicate the rows.
+        """
+        cells = []
+        for box in selection.get('box', []):
+            cells.append(self.cells_in_box(box['x'], box['y']))
+        for lasso in selection.get('lasso', []):
+            cells.append(self.cells_in_lasso(lasso['x'], lasso['y']))
+        if not cells:
+            point_cells = [self.cell_at(point['x'], point['y']) for point in selection.get('points', [])]
+            cells.append(np.array([c for c in point_cells if c is not None], dtype=np.int64))
+        return np.sort(self.rows_in_cells(np.unique(np.concatenate(cells))))
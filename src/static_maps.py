@@ -0,0 +1,258 @@
+# src/static_maps.py
+# This module contains the static defect map renderer: matplotlib images of the panel
+# layout drawn by create_grid_shapes, for shift-review packs (PNG files or a multi-page
+# PDF, rendered across a process pool) and for embedding in the Excel report.
+
+import argparse
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.figure import Figure
+from matplotlib.image import imread
+
+from src.batch import find_lots, output_stems
+from src.config import (
+    PANEL_COLOR, GRID_COLOR, BACKGROUND_COLOR, PLOT_AREA_COLOR, TEXT_COLOR, QUADRANT_ORDER,
+    MAP_QUADRANTS, MAP_FIGURE_SIZE, MAP_DPI, defect_style_map
+)
+from src.instrumentation import timed
+from src.pipeline import parse_defect_source, quadrant_codes_from_labels
+
+# Colour for defect types missing from defect_style_map.
+_FALLBACK_COLOR = '#AAAAAA'
+
+# --- Rendering ---
+
+def _panel_origins(panel_rows, panel_cols, gap_size, quadrant):
+    """Same panel placement as create_grid_shapes: four panels for 'All', one at the origin otherwise."""
+    if quadrant != 'All':
+        return [(0, 0)]
+    return [(0, 0), (panel_cols + gap_size, 0), (0, panel_rows + gap_size), (panel_cols + gap_size, panel_rows + gap_size)]
+
+def _grid_collections(panel_rows, panel_cols, gap_size, quadrant):
+    """The panels as one PolyCollection and all inner grid lines as one LineCollection."""
+    origins = _panel_origins(panel_rows, panel_cols, gap_size, quadrant)
+    panels = [[(x, y), (x + panel_cols, y), (x + panel_cols, y + panel_rows), (x, y + panel_rows)] for x, y in origins]
+    lines = []
+    for x, y in origins:
+        lines += [[(x + i, y), (x + i, y + panel_rows)] for i in range(1, panel_cols)]
+        lines += [[(x, y + i), (x + panel_cols, y + i)] for i in range(1, panel_rows)]
+    return (PolyCollection(panels, facecolors=PANEL_COLOR, edgecolors=GRID_COLOR, linewidths=2, zorder=1),
+            LineCollection(lines, colors=GRID_COLOR, linewidths=0.4, zorder=2))
+
+def _map_positions(df, panel_rows, panel_cols, gap_size, quadrant):
+    """Cell-centre positions of the defects shown for ``quadrant``, in the layout of _panel_origins."""
+    codes = quadrant_codes_from_labels(df['QUADRANT'])
+    unit_x = df['UNIT_INDEX_X'].to_numpy(dtype=np.float64) + 0.5
+    unit_y = df['UNIT_INDEX_Y'].to_numpy(dtype=np.float64) + 0.5
+    if quadrant == 'All':
+        shown = codes >= 0
+        return (unit_x[shown] + (codes[shown] % 2) * (panel_cols + gap_size),
+                unit_y[shown] + (codes[shown] // 2) * (panel_rows + gap_size), shown)
+    shown = codes == QUADRANT_ORDER.index(quadrant)
+    return unit_x[shown], unit_y[shown], shown
+
+@timed('static_maps.render_defect_map')
+def render_defect_map(df, panel_rows, panel_cols, gap_size=1, quadrant='All', title=None,
+                      size_inches=MAP_FIGURE_SIZE):
+    """
+    Draws a defect map as a matplotlib Figure (no pyplot state, so it is safe in threads
+    and worker processes).
+
+    Defects are counted per unit cell and defect type and drawn with one scatter call per
+    type, each type on its own slot of a small ring inside the cell and sized by count, so
+    the drawing cost is bounded by the grid size rather than the number of defects.
+
+    Args:
+        df (pd.DataFrame): Parsed defect table (QUADRANT, UNIT_INDEX_X/Y, DEFECT_TYPE).
+        panel_rows (int): The number of rows in a single panel.
+        panel_cols (int): The number of columns in a single panel.
+        gap_size (int): Gap between panels, in unit cells.
+        quadrant (str): 'All' for the full panel or one of Q1-Q4.
+        title (str, optional): Figure title; defaults to the quadrant and defect count.
+        size_inches (tuple): Figure size.
+
+    Returns:
+        matplotlib.figure.Figure: The rendered map.
+    """
+    x, y, shown = _map_positions(df, panel_rows, panel_cols, gap_size, quadrant)
+    defect_types = df['DEFECT_TYPE'].to_numpy()[shown]
+
+    fig = Figure(figsize=size_inches, facecolor=BACKGROUND_COLOR)
+    ax = fig.add_axes((0.03, 0.04, 0.7, 0.88))
+    ax.set_facecolor(PLOT_AREA_COLOR)
+    for collection in _grid_collections(panel_rows, panel_cols, gap_size, quadrant):
+        ax.add_collection(collection)
+
+    counts = (pd.DataFrame({'DEFECT_TYPE': defect_types, 'X': x, 'Y': y})
+              .groupby(['DEFECT_TYPE', 'X', 'Y'], observed=True, sort=False).size())
+    present = counts.groupby(level='DEFECT_TYPE', observed=True, sort=False).sum().sort_values(ascending=False, kind='stable')
+    max_count = counts.max() if len(counts) else 1
+    ring = 0.25 if len(present) > 1 else 0.0
+    for k, defect in enumerate(present.index):
+        cell_counts = counts.xs(defect, level='DEFECT_TYPE')
+        angle = 2 * np.pi * k / len(present)
+        ax.scatter(cell_counts.index.get_level_values('X') + ring * np.cos(angle),
+                   cell_counts.index.get_level_values('Y') + ring * np.sin(angle),
+                   s=6 + 60 * np.sqrt(cell_counts.to_numpy() / max_count),
+                   color=defect_style_map.get(str(defect), _FALLBACK_COLOR), edgecolors='black', linewidths=0.3,
+                   label=f"{defect} ({present[defect]:,})", zorder=3)
+
+    width = 2 * panel_cols + gap_size if quadrant == 'All' else panel_cols
+    height = 2 * panel_rows + gap_size if quadrant == 'All' else panel_rows
+    margin = gap_size if quadrant == 'All' else 0
+    ax.set_xlim(-margin, width + margin)
+    ax.set_ylim(-margin, height + margin)
+    ax.set_aspect('equal')
+    ax.set_xticks([])
+    ax.set_yticks([])
+    for spine in ax.spines.values():
+        spine.set_color(GRID_COLOR)
+    ax.set_title(title or f"Panel Defect Map - Quadrant: {quadrant} ({int(shown.sum()):,} Defects)",
+                 color=TEXT_COLOR, fontsize=11)
+    if len(present):
+        legend = ax.legend(loc='upper left', bbox_to_anchor=(1.02, 1), fontsize=8, frameon=False, markerscale=0.8)
+        for text in legend.get_texts():
+            text.set_color(TEXT_COLOR)
+    return fig
+
+def figure_to_png(fig, dpi=MAP_DPI):
+    """Rasterizes a Figure to PNG bytes with the Agg backend."""
+    buffer = io.BytesIO()
+    FigureCanvasAgg(fig)
+    fig.savefig(buffer, format='png', dpi=dpi, facecolor=fig.get_facecolor())
+    return buffer.getvalue()
+
+def render_map_images(df, panel_rows, panel_cols, quadrants=MAP_QUADRANTS, gap_size=1, dpi=MAP_DPI, title_prefix=''):
+    """
+    Renders one PNG per quadrant.
+
+    Returns:
+        list: (quadrant, PNG bytes) pairs, in the order of ``quadrants``.
+    """
+    images = []
+    for quadrant in quadrants:
+        title = f"{title_prefix}Quadrant {quadrant}" if title_prefix else None
+        images.append((quadrant, figure_to_png(render_defect_map(df, panel_rows, panel_cols, gap_size, quadrant, title), dpi)))
+    return images
+
+# --- Map Packs ---
+
+def render_lot_maps(lot_path, panel_rows, panel_cols, quadrants=MAP_QUADRANTS, dpi=MAP_DPI):
+    """
+    Loads one lot and renders its maps. Runs inside a worker process.
+
+    Returns:
+        tuple: (lot_path, list of (quadrant, PNG bytes), error message or None).
+    """
+    try:
+        df, _ = parse_defect_source(lot_path)
+        name = os.path.basename(lot_path)
+        return lot_path, render_map_images(df, panel_rows, panel_cols, quadrants, dpi=dpi, title_prefix=f"{name} - "), None
+    except Exception as e:
+        return lot_path, [], str(e)
+
+def _png_page(pdf, png):
+    """Adds a rasterized map to a PDF as one page of the image's own size."""
+    image = imread(io.BytesIO(png), format='png')
+    height, width = image.shape[:2]
+    page = Figure(figsize=(width / MAP_DPI, height / MAP_DPI))
+    page.figimage(image, resize=False)
+    pdf.savefig(page, dpi=MAP_DPI)
+
+def render_map_pack(lots, output, panel_rows=7, panel_cols=7, quadrants=MAP_QUADRANTS, fmt='png',
+                    workers=None, dpi=MAP_DPI, log=print):
+    """
+    Renders the maps of many lots across a process pool.
+
+    Args:
+        lots (list): Lot file paths.
+        output (str): Directory for PNG files (<lot>_<quadrant>.png, with <lot> named as the
+            batch reports are, see batch.output_stems), or the PDF path.
+        quadrants (list): Quadrants to render per lot ('All' and/or Q1-Q4).
+        fmt (str): 'png' or 'pdf'. PDF pages follow the order of ``lots``.
+        workers (int, optional): Worker processes (default: CPU count); 1 renders in-process.
+
+    Returns:
+        dict: Failed lots mapped to their error messages.
+    """
+    if fmt not in ('png', 'pdf'):
+        raise ValueError(f"Unknown map format '{fmt}'; expected 'png' or 'pdf'")
+    stems = output_stems(lots)
+    if fmt == 'png':
+        os.makedirs(output, exist_ok=True)
+    else:
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+
+    failures = {}
+    args = [(lot, panel_rows, panel_cols, list(quadrants), dpi) for lot in lots]
+    pool = ProcessPoolExecutor(max_workers=workers) if workers != 1 and len(lots) > 1 else None
+    try:
+        # map() yields in submission order, so PDF pages come out in lot order while
+        # later lots are still rendering.
+        results = pool.map(render_lot_maps, *zip(*args), chunksize=4) if pool else (render_lot_maps(*a) for a in args)
+        pdf = PdfPages(output) if fmt == 'pdf' else None
+        try:
+            for lot_path, images, error in results:
+                if error:
+                    failures[lot_path] = error
+                    log(f"FAILED {os.path.basename(lot_path)}: {error}")
+                    continue
+                stem = stems[os.path.abspath(lot_path)]
+                for quadrant, png in images:
+                    if pdf is not None:
+                        _png_page(pdf, png)
+                    else:
+                        with open(os.path.join(output, f"{stem}_{quadrant}.png"), 'wb') as f:
+                            f.write(png)
+                log(f"rendered {os.path.basename(lot_path)} ({len(images)} maps)")
+        finally:
+            if pdf is not None:
+                pdf.close()
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render static defect maps for a batch of AOI lot files.")
+    parser.add_argument('inputs', nargs='+', help="Lot files, directories or glob patterns.")
+    parser.add_argument('-o', '--output', default='maps',
+                        help="Output directory for PNGs, or the .pdf file for --format pdf (default: maps).")
+    parser.add_argument('--format', choices=['png', 'pdf'], default='png', help="PNG files or one multi-page PDF.")
+    parser.add_argument('--quadrants', nargs='+', choices=MAP_QUADRANTS, default=MAP_QUADRANTS,
+                        help="Maps to render per lot (default: All Q1 Q2 Q3 Q4).")
+    parser.add_argument('--panel-rows', type=int, default=7, help="Rows in a single panel (default: 7).")
+    parser.add_argument('--panel-cols', type=int, default=7, help="Columns in a single panel (default: 7).")
+    parser.add_argument('--dpi', type=int, default=MAP_DPI, help=f"Image resolution (default: {MAP_DPI}).")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="Worker processes (default: CPU count).")
+    args = parser.parse_args(argv)
+
+    lots = find_lots(args.inputs)
+    if not lots:
+        print("No lot files found.", file=sys.stderr)
+        return 1
+    output = args.output
+    if args.format == 'pdf' and not output.lower().endswith('.pdf'):
+        output += '.pdf'
+
+    start = time.perf_counter()
+    try:
+        failures = render_map_pack(lots, output, args.panel_rows, args.panel_cols, args.quadrants, args.format,
+                                   workers=args.workers, dpi=args.dpi, log=lambda line: print(line, flush=True))
+    except ValueError as e:   # Lots whose maps would overwrite each other (see batch.output_stems).
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    maps = (len(lots) - len(failures)) * len(args.quadrants)
+    elapsed = time.perf_counter() - start
+    print(f"Rendered {maps} map(s) in {elapsed:.1f}s ({maps / max(elapsed, 1e-9) * 60:,.0f} per minute) into '{output}'; "
+          f"{len(failures)} lot(s) failed.")
+    return 1 if failures else 0
@@ -0,0 +1,95 @@
+# src/synthetic.py
+# This module contains the seeded synthetic AOI lot generator used by the benchmarks
+# and for load-testing. Generated lots use the exact schema load_data expects.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.config import QUADRANT_ORDER, defect_style_map
+
+# Physical size of one unit cell in coordinate units (the exports use micrometres).
+UNIT_PITCH = 1000.0
+
+
+def defect_type_weights(skew=1.0):
+    """
+    Zipf-like weights over defect_style_map: the k-th type has weight 1 / k**skew.
+    skew=0 gives a uniform mix; larger values concentrate defects in the first types.
+    """
+    ranks = np.arange(1, len(defect_style_map) + 1, dtype=np.float64)
+    weights = 1.0 / ranks ** skew
+    return weights / weights.sum()
+
+
+def generate_lot(n_defects, panel_rows=7, panel_cols=7, gap_size=1, skew=1.0, seed=0, include_quadrant=False):
+    """
+    Generates a synthetic defect table.
+
+    Coordinates are laid out like a real panel (four quadrants separated by a gap),
+    so deriving quadrants from X/Y_COORDINATES reproduces the generated quadrants.
+
+    Args:
+        n_defects (int): Number of defect rows.
+        panel_rows (int): The number of rows in a single panel.
+        panel_cols (int): The number of columns in a single panel.
+        gap_size (int): Gap between panels, in unit cells.
+        skew (float): Defect-type skew, see defect_type_weights.
+        seed (int): Random seed; the same arguments always produce the same lot.
+        include_quadrant (bool): Also write the QUADRANT column instead of leaving it to be derived.
+
+    Returns:
+        pd.DataFrame: The defect table.
+    """
+    rng = np.random.default_rng(seed)
+    quadrant = rng.integers(0, 4, n_defects, dtype=np.int8)
+    unit_x = rng.integers(0, panel_cols, n_defects, dtype=np.int16)
+    unit_y = rng.integers(0, panel_rows, n_defects, dtype=np.int16)
+
+    grid_x = unit_x + (quadrant % 2) * (panel_cols + gap_size) + rng.random(n_defects)
+    grid_y = unit_y + (quadrant // 2) * (panel_rows + gap_size) + rng.random(n_defects)
+    defect_types = np.array(list(defect_style_map), dtype=object)
+
+    df = pd.DataFrame({
+        'UNIT_INDEX_X': unit_x,
+        'UNIT_INDEX_Y': unit_y,
+        'DEFECT_TYPE': defect_types[rng.choice(len(defect_types), n_defects, p=defect_type_weights(skew))],
+        'X_COORDINATES': np.round(grid_x * UNIT_PITCH, 1),
+        'Y_COORDINATES': np.round(grid_y * UNIT_PITCH, 1),
+    })
+    if include_quadrant:
+        df['QUADRANT'] = np.array(QUADRANT_ORDER, dtype=object)[quadrant]
+    return df
+
+
+# File extensions write_lot can produce. Legacy .xls is readable (see src/ingest.py) but
+# cannot be written.
+WRITABLE_EXTENSIONS = ('.csv', '.xlsx', '.parquet', '.feather')
+
+
+def check_writable(path):
+    """Raises ValueError unless write_lot can write ``path``; lets callers fail before any expensive work."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in WRITABLE_EXTENSIONS:
+        raise ValueError(f"Cannot write a defect file with extension '{extension or path}'; "
+                         f"use one of {', '.join(WRITABLE_EXTENSIONS)}.")
+
+
+def write_lot(df, path):
+    """
+    Writes a lot in the format implied by the file extension (.csv, .xlsx, .parquet or .feather).
+
+    Raises:
+        ValueError: If the extension is not one of WRITABLE_EXTENSIONS.
+    """
+    check_writable(path)
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.xlsx':
+        df.to_excel(path, index=False)
+    elif extension == '.parquet':
+        df.to_parquet(path, index=False)
+    elif extension == '.feather':
+        df.to_feather(path)
+    else:
+        df.to_csv(path, index=False)
@@ -0,0 +1,101 @@
+# src/warmup.py
+# This module contains the background precompute scheduler: once a lot is loaded, the
+# artifacts its views need (aggregates and figures) are queued on a shared
+# thread pool, so the first visit to a view usually finds its artifact already built.
+
+import threading
+from concurrent.futures import CancelledError
+
+
+class WarmupJob:
+    """
+    The precompute tasks queued for one lot and one set of view settings in a session.
+
+    Tasks are named by the key their result is looked up under (e.g. a figure memo
+    key), so a view that needs an artifact which is being built waits for that one
+    task only; one still queued is taken over by the caller instead (see wait). Tasks
+    run in submission order; a task may wait for an earlier one, never for a later one,
+    so a full pool cannot deadlock.
+    """
+
+    def __init__(self, key, executor):
+        self.key = key
+        self._executor = executor
+        self._tasks = {}   # name -> (group, future), in submission order
+        self._cancelled = threading.Event()
+        self._taken = set()   # tasks cancelled by wait() because the caller built them itself
+
+    def __contains__(self, name):
+        return name in self._tasks
+
+    def submit(self, name, group, fn, *args, **kwargs):
+        """
+        Queues ``fn(*args, **kwargs)`` under ``name`` unless a task of that name exists.
+
+        Args:
+            name (hashable): Key the task's result is waited for under.
+            group (str): Label the task is counted under in status().
+        """
+        if name not in self._tasks:
+            self._tasks[name] = (group, self._executor.submit(self._run, fn, args, kwargs))
+
+    def _run(self, fn, args, kwargs):
+        # A task a worker picks up after cancel() is dropped without running.
+        if self._cancelled.is_set():
+            raise CancelledError()
+        return fn(*args, **kwargs)
+
+    def wait(self, name):
+        """
+        Returns the result of the task ``name``, waiting for it only if a worker has
+        already started it. A task that has not started is cancelled, as it may be
+        queued behind other sessions' work in the shared pool. Returns None in that
+        case, and for unknown, cancelled or failed tasks, so the caller builds the
+        artifact itself.
+        """
+        item = self._tasks.get(name)
+        if item is None:
+            return None
+        future = item[1]
+        if future.cancel():
+            self._taken.add(name)
+            return None
+        try:
+            return future.result()
+        except Exception:
+            return None
+
+    def ready(self, name):
+        """True if the task ``name`` has finished successfully or was taken over by wait()."""
+        if name in self._taken:
+            return True
+        item = self._tasks.get(name)
+        return item is not None and item[1].done() and not item[1].cancelled() and item[1].exception() is None
+
+    def cancel(self):
+        """Drops every task that has not started; running tasks finish, their results unused."""
+        self._cancelled.set()
+        for _, future in self._tasks.values():
+            future.cancel()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def done(self):
+        return all(future.done() for _, future in self._tasks.values())
+
+    def status(self):
+        """
+        Returns:
+            dict: group -> {'ready', 'failed', 'total'} task counts, in submission order.
+        """
+        groups = {}
+        for name, (group, future) in self._tasks.items():
+            counts = groups.setdefault(group, {'ready': 0, 'failed': 0, 'total': 0})
+            counts['total'] += 1
+            if self.ready(name):
+                counts['ready'] += 1
+            elif future.done() and not future.cancelled():
+                counts['failed'] += 1
+        return groups
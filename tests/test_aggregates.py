@@ -0,0 +1,68 @@
+# tests/test_aggregates.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.aggregates import build_defect_cube, build_unit_counts, merge_defect_cubes
+from src.config import QUADRANT_ORDER
+from src.pipeline import process_defect_table
+from src.synthetic import generate_lot
+
+PANEL_ROWS, PANEL_COLS = 5, 4
+
+
+@pytest.fixture(scope='module')
+def lot():
+    df, _ = process_defect_table(generate_lot(3000, PANEL_ROWS, PANEL_COLS, seed=11, include_quadrant=True))
+    return df
+
+
+def test_cube_counts_match_value_counts_of_the_rows(lot):
+    cube = build_defect_cube(lot)
+    assert cube.total == len(lot)
+    for quad in QUADRANT_ORDER:
+        rows = lot[lot['QUADRANT'] == quad]
+        assert cube.quadrant_total(quad) == len(rows)
+        assert cube.defective_cell_count(quad) == len(rows[['UNIT_INDEX_X', 'UNIT_INDEX_Y']].drop_duplicates())
+        expected = rows['DEFECT_TYPE'].astype(str).value_counts()
+        assert cube.defect_counts(quad).to_dict() == expected.to_dict()
+    counts = cube.defect_counts('All')
+    assert counts.is_monotonic_decreasing
+    assert counts.to_dict() == lot['DEFECT_TYPE'].astype(str).value_counts().to_dict()
+
+
+def test_merged_cubes_equal_the_cube_of_the_combined_rows(lot):
+    head, tail = lot.iloc[:1234], lot.iloc[1234:]
+    merged = merge_defect_cubes(build_defect_cube(head), build_defect_cube(tail))
+    whole = build_defect_cube(lot)
+    pd.testing.assert_frame_equal(merged.type_counts, whole.type_counts, check_like=True)
+    assert merged.defective_cells.sort_index().tolist() == whole.defective_cells.sort_index().tolist()
+
+
+def test_unit_counts_match_a_per_row_tally(lot):
+    unit_counts = build_unit_counts(lot, PANEL_ROWS, PANEL_COLS)
+    expected = np.zeros((len(QUADRANT_ORDER), PANEL_ROWS, PANEL_COLS), dtype=np.int64)
+    for quad, x, y in zip(lot['QUADRANT'].astype(str), lot['UNIT_INDEX_X'], lot['UNIT_INDEX_Y']):
+        expected[QUADRANT_ORDER.index(quad), y, x] += 1
+    np.testing.assert_array_equal(unit_counts.counts, expected)
+    assert unit_counts.out_of_range == 0
+
+    cut = lot[lot['DEFECT_TYPE'] == 'Cut']
+    q3_cut = cut[cut['QUADRANT'] == 'Q3']
+    assert unit_counts.matrix('Q3', 'Cut').sum() == len(q3_cut)
+
+
+def test_unit_yield_follows_the_summary_view_formula():
+    df = pd.DataFrame({
+        'UNIT_INDEX_X': [0, 0, 1, 9, 1], 'UNIT_INDEX_Y': [0, 0, 1, 0, 1],
+        'DEFECT_TYPE': ['Cut', 'Nick', 'Cut', 'Cut', 'Short'],
+        'QUADRANT': ['Q1', 'Q1', 'Q1', 'Q2', 'Q4'],
+    })
+    unit_counts = build_unit_counts(df, 2, 2)
+    # Q1 has two defective cells out of four; the unit at x=9 is off the panel.
+    assert unit_counts.defective_units('Q1') == 2
+    assert unit_counts.unit_yield('Q1') == 0.5
+    assert unit_counts.unit_yield('Q2') == 1.0
+    assert unit_counts.unit_yield('All') == (16 - 3) / 16
+    assert unit_counts.out_of_range == 1
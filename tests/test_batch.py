@@ -0,0 +1,101 @@
+# tests/test_batch.py
+
+import os
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+
+from src import reporting
+from src.batch import find_lots, output_stems, run_batch
+from src.synthetic import generate_lot, write_lot
+
+
+@pytest.fixture
+def lot_dir(tmp_path):
+    # Parquet lots are read directly, so the tests never touch the columnar cache.
+    lots = tmp_path / 'lots'
+    lots.mkdir()
+    for seed in (1, 2):
+        write_lot(generate_lot(200, seed=seed), str(lots / f"lot{seed}.parquet"))
+    return lots
+
+
+def test_a_failed_report_leaves_no_temporary_file(lot_dir, tmp_path, monkeypatch):
+    def fail_midway(target, *args):
+        with open(target, 'wb') as f:
+            f.write(b'partial')
+        raise RuntimeError('disk full')
+
+    monkeypatch.setattr(reporting, '_write_workbook', fail_midway)
+    out = tmp_path / 'out'
+    summary = run_batch(sorted(str(p) for p in lot_dir.iterdir()), str(out), workers=1, log=lambda line: None)
+
+    assert summary['status'].tolist() == ['failed', 'failed']
+    assert summary['error'].tolist() == ['disk full', 'disk full']
+    assert sorted(os.listdir(out)) == ['batch_summary.csv']
+
+
+def test_reports_summaries_and_resume(lot_dir, tmp_path):
+    lots = find_lots([str(lot_dir), str(lot_dir / '*.parquet')])
+    assert [os.path.basename(p) for p in lots] == ['lot1.parquet', 'lot2.parquet']
+    out = tmp_path / 'out'
+
+    summary = run_batch(lots, str(out), workers=1, log=lambda line: None)
+    assert summary['status'].tolist() == ['ok', 'ok']
+    assert summary['total_defects'].tolist() == [200, 200]
+    assert (summary[['Q1', 'Q2', 'Q3', 'Q4']].sum(axis=1) == 200).all()
+    assert sorted(os.listdir(out)) == ['batch_summary.csv', 'lot1_report.xlsx', 'lot1_summary.json',
+                                       'lot2_report.xlsx', 'lot2_summary.json']
+    assert pd.read_csv(out / 'batch_summary.csv')['lot'].tolist() == ['lot1.parquet', 'lot2.parquet']
+
+    # Touching one input makes only that lot stale.
+    os.utime(lot_dir / 'lot2.parquet', (os.path.getmtime(out / 'lot2_report.xlsx') + 10,) * 2)
+    resumed = run_batch(lots, str(out), workers=1, log=lambda line: None)
+    assert resumed['status'].tolist() == ['skipped', 'ok']
+    assert resumed['total_defects'].tolist() == [200, 200]
+
+
+def test_an_unreadable_lot_becomes_a_failed_row(lot_dir, tmp_path):
+    pd.DataFrame({'UNIT_INDEX_X': [1], 'DEFECT_TYPE': ['Cut']}).to_parquet(lot_dir / 'broken.parquet')
+    lots = find_lots([str(lot_dir)])
+    summary = run_batch(lots, str(tmp_path / 'out'), workers=1, log=lambda line: None)
+
+    broken = summary[summary['lot'] == 'broken.parquet'].iloc[0]
+    assert broken['status'] == 'failed'
+    assert 'UNIT_INDEX_Y' in broken['error']
+    assert summary[summary['lot'] != 'broken.parquet']['status'].tolist() == ['ok', 'ok']
+    assert str(summary['total_defects'].dtype) == 'Int64'
+
+
+def test_same_named_lots_in_different_folders_get_their_own_outputs(tmp_path):
+    lots = tmp_path / 'lots'
+    for folder, name, seed in (('l1', 'lot.feather', 1), ('l1', 'lot.parquet', 2), ('l2', 'lot.parquet', 3)):
+        (lots / folder).mkdir(parents=True, exist_ok=True)
+        write_lot(generate_lot(100 * seed, seed=seed), str(lots / folder / name))
+    paths = sorted(str(p) for p in lots.rglob('lot.*'))
+    assert sorted(output_stems(paths).values()) == ['l1__lot_feather', 'l1__lot_parquet', 'l2__lot']
+
+    out = tmp_path / 'out'
+    summary = run_batch(paths, str(out), workers=2, log=lambda line: None)
+    assert summary['status'].tolist() == ['ok', 'ok', 'ok']
+    assert sorted(zip(summary['report'], summary['total_defects'])) == [
+        ('l1__lot_feather_report.xlsx', 100), ('l1__lot_parquet_report.xlsx', 200), ('l2__lot_report.xlsx', 300),
+    ]
+    assert len([name for name in os.listdir(out) if name.endswith('_summary.json')]) == 3
+
+
+def test_a_single_folder_keeps_plain_report_names_and_clashes_fail(tmp_path):
+    assert output_stems([str(tmp_path / 'a.csv'), str(tmp_path / 'b.csv')]) == {
+        str(tmp_path / 'a.csv'): 'a', str(tmp_path / 'b.csv'): 'b'}
+    # 'x__y.csv' at the root and 'x/y.csv' below it would both be named 'x__y'.
+    with pytest.raises(ValueError, match='x__y'):
+        output_stems([str(tmp_path / 'x__y.csv'), str(tmp_path / 'x' / 'y.csv')])
+
+
+def test_batches_without_maps_do_not_load_matplotlib():
+    # A fresh interpreter, as other tests in this process import matplotlib.
+    code = "import sys, src.batch; sys.exit('matplotlib' in sys.modules)"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    assert subprocess.run([sys.executable, '-c', code], cwd=root).returncode == 0
@@ -0,0 +1,66 @@
+# tests/test_cache.py
+
+from src.cache import LRUCache
+
+
+def test_least_recently_used_entries_are_evicted_first():
+    evicted = []
+    cache = LRUCache(max_entries=2, on_evict=lambda key, value: evicted.append(key))
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1          # 'b' is now the least recently used
+    cache.put('c', 3)
+    assert evicted == ['b']
+    assert 'a' in cache and 'c' in cache
+    assert cache.stats() == {'entries': 2, 'bytes': 0, 'hits': 1, 'misses': 0, 'evictions': 1}
+
+
+def test_peek_does_not_refresh_an_entry():
+    cache = LRUCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.peek('a') == 1
+    cache.put('c', 3)
+    assert 'a' not in cache
+    assert cache.stats()['hits'] == 0
+    assert cache.keys() == ['b', 'c']   # least recently used first
+
+
+def test_byte_budget_counts_replaced_and_resized_entries():
+    cache = LRUCache(max_entries=10, max_bytes=10, sizeof=len)
+    cache.put('a', [0] * 4)
+    cache.put('a', [0] * 6)             # replacing an entry releases its old size
+    assert cache.nbytes == 6
+    cache.put('b', [0] * 3)
+    assert cache.nbytes == 9
+
+    cache.peek('b').extend([0] * 3)     # grown in place: over budget once re-measured
+    cache.resize('b')
+    assert 'a' not in cache
+    assert cache.nbytes == 6
+
+
+def test_an_entry_over_the_byte_budget_is_kept_until_the_next_put():
+    evicted = []
+    cache = LRUCache(max_entries=10, max_bytes=5, sizeof=len, on_evict=lambda key, value: evicted.append(key))
+    cache.put('small', [0] * 2)
+    cache.put('big', [0] * 8)
+    assert evicted == ['small']
+    assert cache.get('big') == [0] * 8
+
+    cache.put('next', [0] * 1)
+    assert evicted == ['small', 'big']
+    assert 'big' not in cache and 'next' in cache
+
+
+def test_pop_and_clear_do_not_report_evictions():
+    evicted = []
+    cache = LRUCache(max_entries=4, sizeof=lambda value: value, max_bytes=100,
+                     on_evict=lambda key, value: evicted.append(key))
+    cache.put('a', 5)
+    cache.put('b', 7)
+    assert cache.pop('a') == 5
+    assert cache.pop('missing', 'default') == 'default'
+    cache.clear()
+    assert len(cache) == 0 and cache.nbytes == 0
+    assert evicted == []
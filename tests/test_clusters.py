@@ -0,0 +1,92 @@
+# tests/test_clusters.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.clusters import find_defect_clusters
+
+
+def _defects(cells, quadrant='Q1', defect_type='Cut'):
+    """One defect per (unit x, unit y) pair in ``cells``."""
+    return pd.DataFrame({
+        'UNIT_INDEX_X': [x for x, _ in cells], 'UNIT_INDEX_Y': [y for _, y in cells],
+        'DEFECT_TYPE': defect_type, 'QUADRANT': quadrant,
+    })
+
+
+def test_touching_cells_join_and_clusters_are_numbered_largest_first():
+    df = pd.concat([
+        _defects([(0, 0), (1, 1), (2, 2)]),                  # diagonal chain: one cluster
+        _defects([(5, 5), (5, 6), (6, 5), (6, 6), (6, 6)], defect_type='Nick'),
+        _defects([(0, 6)]),                                   # isolated defect
+    ], ignore_index=True)
+    clusters = find_defect_clusters(df, 7, 7, min_defects=3)
+
+    assert clusters.count == 2
+    assert clusters.labels.tolist() == [2, 2, 2, 1, 1, 1, 1, 1, 0]
+    first = clusters.table.iloc[0]
+    assert (first['DEFECTS'], first['CELLS'], first['DOMINANT_TYPE']) == (5, 4, 'Nick')
+    assert (first['X_MIN'], first['X_MAX'], first['Y_MIN'], first['Y_MAX']) == (5, 6, 5, 6)
+    assert clusters.clustered_defects == 8
+
+
+def test_clusters_do_not_cross_the_gap_between_quadrants():
+    # Q1's right edge and Q2's left edge touch on the panel-wide unit grid, but not on the panel.
+    df = pd.concat([_defects([(5, 0), (6, 0)], 'Q1'), _defects([(0, 0), (1, 0)], 'Q2')], ignore_index=True)
+    clusters = find_defect_clusters(df, 7, 7, min_defects=2)
+    assert clusters.count == 2
+    assert sorted(clusters.table['QUADRANTS']) == ['Q1', 'Q2']
+    # Unit boxes are reported in panel-wide unit indices.
+    q2 = clusters.table[clusters.table['QUADRANTS'] == 'Q2'].iloc[0]
+    assert (q2['X_MIN'], q2['X_MAX']) == (7, 8)
+
+
+def test_sparse_cells_can_be_ignored_so_they_do_not_bridge_clusters():
+    df = _defects([(0, 0), (0, 0), (1, 0), (2, 0), (2, 0)])
+    assert find_defect_clusters(df, 7, 7, min_defects=2).count == 1
+    bridged = find_defect_clusters(df, 7, 7, min_defects=2, min_cell_defects=2)
+    assert bridged.count == 2
+    assert bridged.labels.tolist() == [1, 1, 0, 2, 2]
+
+
+def test_coordinate_mode_hashes_points_into_square_cells():
+    df = _defects([(0, 0)] * 5)
+    df['X_COORDINATES'] = [10.0, 60.0, 110.0, 900.0, np.nan]
+    df['Y_COORDINATES'] = [10.0, 10.0, 10.0, 900.0, 10.0]
+    clusters = find_defect_clusters(df, 7, 7, mode='coordinates', cell_size=100.0, min_defects=2)
+    assert clusters.labels.tolist() == [1, 1, 1, 0, 0]
+    assert clusters.table[['X_MIN', 'X_MAX']].iloc[0].tolist() == [10.0, 110.0]
+
+
+def test_labels_match_a_flood_fill_on_random_lots():
+    rng = np.random.default_rng(5)
+    cells = [tuple(c) for c in rng.integers(0, 20, size=(150, 2))]
+    clusters = find_defect_clusters(_defects(cells), 20, 20, min_defects=1)
+
+    occupied = set(cells)
+    component, next_id = {}, 0
+    for start in occupied:
+        if start in component:
+            continue
+        stack, component[start] = [start], next_id
+        while stack:
+            x, y = stack.pop()
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    neighbour = (x + dx, y + dy)
+                    if neighbour in occupied and neighbour not in component:
+                        component[neighbour] = next_id
+                        stack.append(neighbour)
+        next_id += 1
+
+    assert clusters.count == next_id
+    # Two defects share a label exactly when the flood fill put their cells together.
+    pairs = pd.DataFrame({'label': clusters.labels, 'component': [component[c] for c in cells]})
+    assert (pairs.groupby('label')['component'].nunique() == 1).all()
+    assert (pairs.groupby('component')['label'].nunique() == 1).all()
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        find_defect_clusters(_defects([(0, 0)]), 7, 7, mode='dbscan')
@@ -0,0 +1,53 @@
+# tests/test_history.py
+
+import pandas as pd
+import pytest
+
+from src.aggregates import build_defect_cube
+from src.history import HistoryStore
+
+
+def _cube(rows):
+    """Cube of a lot given as (quadrant, defect type, unit x, unit y) tuples."""
+    return build_defect_cube(pd.DataFrame(rows, columns=['QUADRANT', 'DEFECT_TYPE', 'UNIT_INDEX_X', 'UNIT_INDEX_Y']))
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(str(tmp_path / 'history.sqlite'))
+    store.add_lot('b', 'lot-b.xlsx', _cube([('Q1', 'Cut', 0, 0), ('Q2', 'Nick', 1, 1), ('Q2', 'Nick', 1, 1)]),
+                  lot_time=200.0)
+    store.add_lot('a', 'lot-a.xlsx', _cube([('Q1', 'Cut', 0, 0), ('Q1', 'Cut', 2, 0), ('Q3', 'Short', 0, 0)]),
+                  lot_time=100.0)
+    return store
+
+
+def test_lots_are_stored_once_and_listed_in_lot_time_order(store):
+    assert store.lots()['name'].tolist() == ['lot-a.xlsx', 'lot-b.xlsx']
+    assert store.lots()['total_defects'].tolist() == [3, 3]
+    assert not store.add_lot('a', 'again.xlsx', _cube([('Q1', 'Cut', 0, 0)]), lot_time=300.0)
+    assert store.lots(start=150.0)['lot_id'].tolist() == ['b']
+
+    assert store.add_lot('a', 'again.xlsx', _cube([('Q1', 'Cut', 0, 0)]), lot_time=300.0, replace=True)
+    assert store.lots()['name'].tolist() == ['lot-b.xlsx', 'again.xlsx']
+
+
+def test_trend_reads_whole_lot_and_per_quadrant_counts(store):
+    trend = store.trend()
+    # Lots come in lot_time order; types within a lot in no particular order.
+    assert trend['lot_id'].tolist() == ['a', 'a', 'b', 'b']
+    assert sorted(zip(trend['lot_id'], trend['defect_type'], trend['count'])) == [
+        ('a', 'Cut', 2), ('a', 'Short', 1), ('b', 'Cut', 1), ('b', 'Nick', 2),
+    ]
+    q2 = store.trend(quadrant='Q2')
+    assert q2[['lot_id', 'total_defects', 'defect_type', 'count']].values.tolist() == [['b', 2, 'Nick', 2]]
+    assert store.trend(defect_types=['Short'])['lot_id'].tolist() == ['a']
+    assert store.trend(defect_types=[]).empty
+    assert store.defect_types().to_dict() == {'Cut': 3, 'Nick': 2, 'Short': 1}
+
+
+def test_removing_a_lot_drops_its_counts(store):
+    assert store.remove_lot('a')
+    assert not store.remove_lot('a')
+    assert not store.has_lot('a')
+    assert set(store.trend()['lot_id']) == {'b'}
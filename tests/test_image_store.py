@@ -0,0 +1,96 @@
+# tests/test_image_store.py
+
+import os
+
+from PIL import Image
+
+from src.image_store import DefectImageIndex, load_thumbnail
+
+
+def _touch(directory, *names):
+    for name in names:
+        (directory / name).write_bytes(b'')
+
+
+def _bump_mtime(directory):
+    # The index refreshes on a directory mtime change; make sure one is visible.
+    stat = os.stat(directory)
+    os.utime(directory, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_pairs_are_keyed_by_quadrant_and_unit(tmp_path):
+    images = tmp_path / 'images'
+    images.mkdir()
+    _touch(images, 'defect_Q1_3_5_m1.jpg', 'defect_Q1_3_5_m2.jpg', 'defect_Q2_3_5_m1.PNG',
+           'defect_Q1_3_5_m3.jpg', 'notes.txt')
+    index = DefectImageIndex(str(images), cache_dir=None)
+
+    assert len(index) == 2
+    assert index.lookup('Q1', 3, 5) == (str(images / 'defect_Q1_3_5_m1.jpg'), str(images / 'defect_Q1_3_5_m2.jpg'))
+    assert index.lookup('q2', 3.0, 5) == (str(images / 'defect_Q2_3_5_m1.PNG'), None)
+    assert index.lookup('Q3', 3, 5) == (None, None)
+    assert index.unmatched == {'defect_Q1_3_5_m3.jpg'}
+
+
+def test_images_named_without_a_quadrant_are_the_fallback(tmp_path, caplog):
+    images = tmp_path / 'images'
+    images.mkdir()
+    _touch(images, 'defect_3_5_m1.jpg', 'defect_3_5_m2.jpg', 'defect_Q2_3_5_m1.jpg', 'defect_x_m1.jpg')
+    index = DefectImageIndex(str(images), cache_dir=str(tmp_path / 'cache'))
+
+    assert index.lookup('Q1', 3, 5) == (str(images / 'defect_3_5_m1.jpg'), str(images / 'defect_3_5_m2.jpg'))
+    assert index.lookup('Q2', 3, 5) == (str(images / 'defect_Q2_3_5_m1.jpg'), None)
+    assert index.lookup('Q1', 5, 3) == (None, None)
+    assert 'defect_x_m1.jpg' in caplog.text
+
+    reloaded = DefectImageIndex(str(images), cache_dir=str(tmp_path / 'cache'))
+    assert reloaded.lookup('Q4', 3, 5)[0] == str(images / 'defect_3_5_m1.jpg')
+    assert reloaded.unmatched == {'defect_x_m1.jpg'}
+
+
+def test_the_bundled_sample_images_are_indexed():
+    index = DefectImageIndex(os.path.join(os.path.dirname(__file__), '..', 'images'), cache_dir=None)
+    assert len(index) == 500
+    assert not index.unmatched
+
+
+def test_refresh_picks_up_added_and_removed_files(tmp_path):
+    images = tmp_path / 'images'
+    images.mkdir()
+    _touch(images, 'defect_Q4_0_0_m1.jpg')
+    index = DefectImageIndex(str(images), cache_dir=None)
+    assert not index.refresh()
+
+    _touch(images, 'defect_Q4_0_0_m2.jpg')
+    (images / 'defect_Q4_0_0_m1.jpg').unlink()
+    _bump_mtime(images)
+    assert index.refresh()
+    assert index.lookup('Q4', 0, 0) == (None, str(images / 'defect_Q4_0_0_m2.jpg'))
+
+
+def test_the_index_is_reloaded_from_the_cache_directory(tmp_path):
+    images = tmp_path / 'images'
+    images.mkdir()
+    _touch(images, 'defect_Q1_1_2_m1.jpg')
+    DefectImageIndex(str(images), cache_dir=str(tmp_path / 'cache'))
+
+    # A file added without changing the directory mtime is only seen by a fresh scan,
+    # so finding just the first one proves the persisted index was used.
+    stat = os.stat(images)
+    _touch(images, 'defect_Q1_1_3_m1.jpg')
+    os.utime(images, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    reloaded = DefectImageIndex(str(images), cache_dir=str(tmp_path / 'cache'))
+    assert len(reloaded) == 1
+    assert reloaded.lookup('Q1', 1, 2)[0] == str(images / 'defect_Q1_1_2_m1.jpg')
+
+
+def test_thumbnails_are_downscaled_and_svg_passes_through(tmp_path):
+    photo = tmp_path / 'defect_Q1_0_0_m1.png'
+    Image.new('RGB', (640, 480), 'red').save(photo)
+    thumbnail = load_thumbnail(str(photo), size=(64, 64))
+    assert max(thumbnail.size) == 64
+    assert load_thumbnail(str(photo), size=(64, 64)) is thumbnail
+
+    svg = tmp_path / 'defect_Q1_0_0_m2.svg'
+    svg.write_text('<svg xmlns="http://www.w3.org/2000/svg"></svg>')
+    assert load_thumbnail(str(svg)).startswith('<svg')
@@ -0,0 +1,49 @@
+# tests/test_ingest.py
+
+import os
+
+from src import config
+from src.ingest import file_digest, read_defect_table
+
+
+def _csv(rows, defect='Nick'):
+    lines = ['UNIT_INDEX_X,UNIT_INDEX_Y,DEFECT_TYPE']
+    lines += [f'{i},{i},{defect}' for i in range(rows)]
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def _set_mtime(path, seconds):
+    os.utime(path, (seconds, seconds))
+
+
+def test_workbooks_are_cached_under_the_configured_cache_dir_not_the_cwd():
+    assert os.path.isabs(config.COLUMNAR_CACHE_DIR)
+    assert os.path.dirname(config.COLUMNAR_CACHE_DIR) == config.CACHE_DIR
+    assert os.path.dirname(config.DATASET_SPILL_DIR) == config.CACHE_DIR
+
+
+def test_a_cache_hit_returns_the_same_table(tmp_path):
+    data = _csv(20)
+    first = read_defect_table(data, filename='lot.csv', cache_dir=str(tmp_path))
+    assert os.path.exists(tmp_path / f'{file_digest(data)}.feather')
+    second = read_defect_table(data, filename='lot.csv', cache_dir=str(tmp_path))
+    assert second.equals(first)
+
+
+def test_the_least_recently_read_copies_are_pruned_past_the_cap(tmp_path):
+    lots = [_csv(200, defect) for defect in ('Nick', 'Short', 'Cut')]
+    paths = [tmp_path / f'{file_digest(data)}.feather' for data in lots]
+
+    read_defect_table(lots[0], filename='a.csv', cache_dir=str(tmp_path))
+    read_defect_table(lots[1], filename='b.csv', cache_dir=str(tmp_path))
+    _set_mtime(paths[0], 1_000)
+    _set_mtime(paths[1], 2_000)
+    # Re-reading the oldest copy marks it as recently used, so the other one goes first.
+    read_defect_table(lots[0], filename='a.csv', cache_dir=str(tmp_path))
+    assert os.path.getmtime(paths[0]) > 2_000
+
+    cap = os.path.getsize(paths[0]) * 2 + os.path.getsize(paths[0]) // 2
+    read_defect_table(lots[2], filename='c.csv', cache_dir=str(tmp_path), cache_max_bytes=cap)
+    assert paths[0].exists() and paths[2].exists()
+    assert not paths[1].exists()
+    assert sum(os.path.getsize(path) for path in tmp_path.glob('*.feather')) <= cap
@@ -0,0 +1,152 @@
+# tests/test_live.py
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.aggregates import build_defect_cube
+from src.live import FolderSource, LiveFeed, LiveLot, TailSource
+from src.pipeline import process_defect_table, project_layout
+from src.synthetic import generate_lot, write_lot
+
+HEADER = "UNIT_INDEX_X,UNIT_INDEX_Y,DEFECT_TYPE,QUADRANT\n"
+
+
+def _read_all(source):
+    batches, restarted = source.read_new()
+    return [load() for _, load in batches], restarted
+
+
+def _raw(x, y, defect_type='Cut'):
+    """Raw rows with quadrants left to be derived from the given coordinates."""
+    return pd.DataFrame({
+        'UNIT_INDEX_X': [1] * len(x), 'UNIT_INDEX_Y': [1] * len(x), 'DEFECT_TYPE': [defect_type] * len(x),
+        'X_COORDINATES': x, 'Y_COORDINATES': y,
+    })
+
+
+def test_all_nan_first_batch_does_not_freeze_the_midpoint():
+    lot = LiveLot()
+    lot.append(_raw([np.nan, np.nan], [np.nan, np.nan]))
+    assert lot.quadrant_midpoint is None
+
+    lot.append(_raw([0.0, 10.0, 0.0, 10.0], [0.0, 0.0, 10.0, 10.0]))
+    assert lot.quadrant_midpoint == (5.0, 5.0)
+    assert lot.frame['QUADRANT'].tolist() == ['Unknown', 'Unknown', 'Q1', 'Q2', 'Q3', 'Q4']
+
+
+def test_tail_source_reads_only_complete_new_lines(tmp_path):
+    path = tmp_path / 'aoi.csv'
+    path.write_text(HEADER + "1,2,Cut,Q1\n3,4,Ni")
+    source = TailSource(str(path))
+    (first,), _ = _read_all(source)
+    assert first.values.tolist() == [[1, 2, 'Cut', 'Q1']]
+
+    with open(path, 'a') as f:
+        f.write("ck,Q2\n")
+    (second,), restarted = _read_all(source)
+    assert second.values.tolist() == [[3, 4, 'Nick', 'Q2']]
+    assert not restarted
+    assert _read_all(source) == ([], False)
+
+
+def test_tail_source_restarts_when_the_file_is_truncated(tmp_path):
+    path = tmp_path / 'aoi.csv'
+    path.write_text(HEADER + "1,2,Cut,Q1\n5,6,Short,Q3\n")
+    source = TailSource(str(path))
+    _read_all(source)
+    path.write_text(HEADER + "7,7,Island,Q4\n")
+    (batch,), restarted = _read_all(source)
+    assert restarted
+    assert batch.values.tolist() == [[7, 7, 'Island', 'Q4']]
+
+
+def test_tail_batches_report_malformed_rows_by_file_row(tmp_path):
+    path = tmp_path / 'aoi.csv'
+    path.write_text(HEADER + "1,2,Cut,Q1\n\n3,4,Nick,Q2\n")
+    source = TailSource(str(path))
+    _read_all(source)
+    with open(path, 'a') as f:
+        f.write("5,6,Cut,Q1\nx,6,Cut,Q1\n")
+    (batch,), _ = _read_all(source)
+    _, diagnostics = process_defect_table(batch)
+    assert diagnostics['malformed_examples'] == [(6, "UNIT_INDEX_X is missing or not a number")]
+
+
+def test_folder_source_reads_each_settled_file_once_in_mtime_order(tmp_path):
+    for name, mtime in (('b.csv', 100), ('a.csv', 200), ('notes.md', 50)):
+        (tmp_path / name).write_text(HEADER + "1,1,Cut,Q1\n")
+        os.utime(tmp_path / name, (mtime, mtime))
+    (tmp_path / 'fresh.csv').write_text(HEADER + "1,1,Cut,Q1\n")   # still being written
+    source = FolderSource(str(tmp_path), settle_seconds=60)
+
+    batches, _ = source.read_new()
+    assert [label for label, _ in batches] == ['b.csv', 'a.csv']
+    assert source.read_new() == ([], False)
+
+
+def test_appended_batches_add_up_to_the_whole_lot():
+    lot_rows = generate_lot(3000, seed=4, include_quadrant=True)
+    lot = LiveLot()
+    for start in range(0, len(lot_rows), 700):
+        lot.append(lot_rows.iloc[start:start + 700].reset_index(drop=True))
+        lot.projected(7, 7, 1)   # projected between appends, so later calls extend it
+
+    whole, _ = process_defect_table(lot_rows.copy())
+    assert lot.rows == len(whole)
+    pd.testing.assert_frame_equal(lot.frame, whole, check_categorical=False)
+    pd.testing.assert_frame_equal(lot.cube.type_counts, build_defect_cube(whole).type_counts, check_like=True)
+    pd.testing.assert_frame_equal(lot.projected(7, 7, 1), project_layout(whole, 7, 7, 1), check_categorical=False)
+
+
+def test_appends_do_not_recopy_or_change_earlier_frames():
+    lot = LiveLot()
+    lot.append(_raw([0.0, 10.0], [0.0, 10.0], 'Cut'))
+    first = lot.frame
+    first_projected = lot.projected(7, 7, 1)
+    for _ in range(3):
+        lot.append(_raw([3.0], [4.0], 'Nick'))
+        assert lot.frame is lot.frame   # one view per version, not one concat per read
+    assert first['DEFECT_TYPE'].tolist() == ['Cut', 'Cut'] and len(first_projected) == 2
+    assert lot.frame['DEFECT_TYPE'].tolist() == ['Cut', 'Cut', 'Nick', 'Nick', 'Nick']
+    assert np.shares_memory(lot.frame['X_COORDINATES'].to_numpy(), lot.frame.iloc[:2]['X_COORDINATES'].to_numpy())
+    assert len(lot.projected(7, 7, 1)) == 5
+
+
+def test_columns_missing_from_a_batch_are_filled_like_concat():
+    lot = LiveLot()
+    lot.append(pd.DataFrame({'UNIT_INDEX_X': [1], 'UNIT_INDEX_Y': [2], 'DEFECT_TYPE': ['Cut'], 'QUADRANT': ['Q1']}))
+    lot.append(pd.DataFrame({'UNIT_INDEX_X': [300], 'UNIT_INDEX_Y': [2], 'DEFECT_TYPE': ['Nick'], 'QUADRANT': ['Q2'],
+                             'X_COORDINATES': [1.5], 'Y_COORDINATES': [2.5]}))
+    frame = lot.frame
+    assert frame['UNIT_INDEX_X'].tolist() == [1, 300]
+    assert np.isnan(frame['X_COORDINATES'].iloc[0]) and frame['X_COORDINATES'].iloc[1] == 1.5
+    assert frame['DEFECT_TYPE'].tolist() == ['Cut', 'Nick'] and frame['QUADRANT'].tolist() == ['Q1', 'Q2']
+
+
+def test_the_midpoint_is_frozen_until_recentred():
+    lot = LiveLot()
+    lot.append(_raw([0.0, 10.0], [0.0, 10.0]))
+    lot.append(_raw([30.0], [30.0]))
+    assert lot.quadrant_midpoint == (5.0, 5.0)
+    assert lot.frame['QUADRANT'].tolist() == ['Q1', 'Q4', 'Q4']
+
+    assert lot.recentre()
+    assert lot.quadrant_midpoint == (15.0, 15.0)
+    assert lot.frame['QUADRANT'].tolist() == ['Q1', 'Q1', 'Q4']
+
+
+def test_a_rejected_batch_is_reported_and_the_feed_keeps_going(tmp_path):
+    drop = tmp_path / 'drop'
+    drop.mkdir()
+    write_lot(generate_lot(50, seed=1, include_quadrant=True), str(drop / 'good.csv'))
+    (drop / 'bad.csv').write_text("UNIT_INDEX_X,DEFECT_TYPE\n1,Cut\n")
+    for name in ('good.csv', 'bad.csv'):
+        os.utime(drop / name, (1, 1))
+
+    feed = LiveFeed(str(drop))
+    assert feed.poll() == 50
+    assert 'bad.csv' in feed.error and 'UNIT_INDEX_Y' in feed.error
+    key, parsed, projected, cube, diagnostics = feed.snapshot(7, 7, 1)
+    assert len(parsed) == len(projected) == cube.total == diagnostics['rows'] == 50
@@ -0,0 +1,145 @@
+# tests/test_pipeline.py
+
+import pickle
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from src.config import QUADRANT_ORDER
+from src.ingest import read_defect_table
+from src.pipeline import (
+    MissingColumnsError, cloud_midpoint, find_malformed_rows, process_defect_table, project_layout, quadrant_codes
+)
+from src.synthetic import generate_lot
+
+
+def test_missing_columns_error_pickles_round_trip():
+    error = MissingColumnsError(['DEFECT_TYPE', 'UNIT_INDEX_Y'])
+    restored = pickle.loads(pickle.dumps(error))
+    assert type(restored) is MissingColumnsError
+    assert restored.missing == ['DEFECT_TYPE', 'UNIT_INDEX_Y']
+    assert str(restored) == str(error)
+
+
+def test_malformed_reasons_follow_the_coerced_unit_index():
+    df = pd.DataFrame({
+        'UNIT_INDEX_X': ['1', 'abc', '2.5', None, 'inf'],
+        'UNIT_INDEX_Y': ['1', '1', '1', '1', '1'],
+        'DEFECT_TYPE': ['Cut', 'Cut', 'Cut', 'Cut', 'Cut'],
+    })
+    bad, malformed = find_malformed_rows(df)
+    assert bad.tolist() == [False, True, True, True, True]
+    assert [reason for _, reason in malformed] == [
+        "UNIT_INDEX_X is missing or not a number",
+        "UNIT_INDEX_X is not a whole number (2.5)",
+        "UNIT_INDEX_X is missing or not a number",
+        "UNIT_INDEX_X is missing or not a number",
+    ]
+
+
+HEADER = b"UNIT_INDEX_X,UNIT_INDEX_Y,DEFECT_TYPE,X_COORDINATES,Y_COORDINATES\n"
+
+
+def test_header_only_table_without_quadrants_parses_to_an_empty_frame():
+    df, diagnostics = process_defect_table(read_defect_table('lot.csv', data=HEADER, cache_dir=None))
+    assert df.empty
+    assert list(df['QUADRANT'].cat.categories) == QUADRANT_ORDER
+    assert diagnostics['quadrants_derived']
+    assert diagnostics['quadrant_midpoint'] is None
+
+
+def test_all_nan_coordinates_leave_every_row_unknown_without_a_midpoint():
+    x, y = np.array([np.nan, np.nan]), np.array([1.0, np.nan])
+    assert cloud_midpoint(x, y) is None
+    assert quadrant_codes(x, y).tolist() == [-1, -1]
+    assert cloud_midpoint([], []) is None
+
+    df, diagnostics = process_defect_table(pd.DataFrame({
+        'UNIT_INDEX_X': [1, 2], 'UNIT_INDEX_Y': [1, 2], 'DEFECT_TYPE': ['Cut', 'Nick'],
+        'X_COORDINATES': [np.nan, np.nan], 'Y_COORDINATES': [np.nan, np.nan],
+    }))
+    assert df['QUADRANT'].tolist() == ['Unknown', 'Unknown']
+    assert diagnostics['unknown_quadrants'] == 2
+    assert diagnostics['quadrant_midpoint'] is None
+
+
+def test_quadrants_split_around_the_cloud_midpoint():
+    x = [0.0, 10.0, 0.0, 10.0, 5.0]
+    y = [0.0, 0.0, 10.0, 10.0, 5.0]
+    assert cloud_midpoint(x, y) == (5.0, 5.0)
+    # Points on the midpoint fall on the lower/left side.
+    assert quadrant_codes(x, y).tolist() == [0, 1, 2, 3, 0]
+    assert quadrant_codes(x, y, midpoint=(20.0, 20.0)).tolist() == [0, 0, 0, 0, 0]
+
+
+def test_a_file_of_only_malformed_rows_reports_them():
+    data = HEADER + b"abc,1,Cut,1.0,2.0\n1,,Nick,3.0,4.0\n2,2,,5.0,6.0\n"
+    df, diagnostics = process_defect_table(read_defect_table('lot.csv', data=data, cache_dir=None))
+    assert df.empty
+    assert diagnostics['rows'] == 0
+    assert diagnostics['malformed_rows'] == 3
+    assert diagnostics['malformed_examples'] == [
+        (2, "UNIT_INDEX_X is missing or not a number"),
+        (3, "UNIT_INDEX_Y is missing or not a number"),
+        (4, "DEFECT_TYPE is missing"),
+    ]
+
+
+def test_malformed_rows_are_numbered_by_file_row_across_blank_lines():
+    data = HEADER + b"1,1,Cut,1.0,2.0\n\n\n2,2,,5.0,6.0\n"
+    _, diagnostics = process_defect_table(read_defect_table('lot.csv', data=data, cache_dir=None))
+    assert diagnostics['rows'] == 1
+    assert diagnostics['malformed_examples'] == [(5, "DEFECT_TYPE is missing")]
+
+
+def test_memory_report_of_a_streamed_workbook_measures_the_cells_as_read(tmp_path):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(['UNIT_INDEX_X', 'UNIT_INDEX_Y', 'DEFECT_TYPE', 'QUADRANT'])
+    for i in range(500):
+        sheet.append([i % 10, 1, 'Cut' if i % 2 else 'Short', 'Q1'])
+    sheet.append(['x', 1, 'Cut', 'Q1'])
+    path = tmp_path / 'lot.xlsx'
+    workbook.save(path)
+    plain_bytes = int(pd.read_excel(path).memory_usage(deep=True).sum())
+
+    for _ in range(2):   # the second read comes from the columnar cache
+        _, diagnostics = process_defect_table(read_defect_table(str(path), cache_dir=str(tmp_path / 'cache')))
+        assert diagnostics['before_bytes'] == plain_bytes
+        assert diagnostics['after_bytes'] < diagnostics['before_bytes']
+        assert diagnostics['malformed_examples'] == [(502, "UNIT_INDEX_X is missing or not a number")]
+
+
+def test_memory_report_measures_the_table_before_quadrants_are_derived():
+    raw = pd.DataFrame({
+        'UNIT_INDEX_X': np.arange(1000, dtype=np.float64) % 10, 'UNIT_INDEX_Y': np.zeros(1000),
+        'DEFECT_TYPE': ['Cut', 'Nick'] * 500,
+        'X_COORDINATES': np.linspace(0, 100, 1000), 'Y_COORDINATES': np.linspace(0, 100, 1000),
+    })
+    raw_bytes = int(raw.memory_usage(deep=True).sum())
+    df, diagnostics = process_defect_table(raw)
+    assert 'QUADRANT' in df.columns
+    assert diagnostics['before_bytes'] == raw_bytes
+    assert diagnostics['after_bytes'] == int(df.memory_usage(deep=True).sum())
+
+
+def test_projection_matches_the_per_quadrant_offsets_and_leaves_the_parsed_frame_alone():
+    parsed, _ = process_defect_table(generate_lot(500, panel_rows=6, panel_cols=5, gap_size=2, seed=3))
+    columns = list(parsed.columns)
+    projected = project_layout(parsed, 6, 5, 2)
+    assert list(parsed.columns) == columns
+
+    # The original load_data shifted PLOT_X by panel_cols + gap for Q2/Q4 and PLOT_Y by
+    # panel_rows + gap for Q3/Q4, from unit index + 0.5.
+    quadrant = projected['QUADRANT'].astype(str)
+    expected_x = projected['UNIT_INDEX_X'] + 0.5 + np.where(quadrant.isin(['Q2', 'Q4']), 7, 0)
+    expected_y = projected['UNIT_INDEX_Y'] + 0.5 + np.where(quadrant.isin(['Q3', 'Q4']), 8, 0)
+    np.testing.assert_array_equal(projected['PLOT_X'].to_numpy(), expected_x.to_numpy(dtype=np.float64))
+    np.testing.assert_array_equal(projected['PLOT_Y'].to_numpy(), expected_y.to_numpy(dtype=np.float64))
+
+
+def test_derived_quadrants_reproduce_the_generated_ones():
+    lot = generate_lot(2000, seed=7, include_quadrant=True)
+    df, _ = process_defect_table(lot.drop(columns='QUADRANT'))
+    assert df['QUADRANT'].astype(str).tolist() == lot['QUADRANT'].tolist()
@@ -0,0 +1,50 @@
+# tests/test_plotting.py
+
+import numpy as np
+
+from src.pipeline import process_defect_table, project_layout
+from src.plotting import _grid_shapes, clear_render_caches, create_defect_traces, create_grid_shapes
+from src.synthetic import generate_lot
+
+
+def test_grid_is_one_rect_and_one_path_per_panel():
+    shapes = create_grid_shapes(3, 2, 1, quadrant='All')
+    assert [shape['type'] for shape in shapes] == ['rect', 'path'] * 4
+    # Q4 starts one panel plus the gap up and to the right.
+    assert (shapes[6]['x0'], shapes[6]['y0'], shapes[6]['x1'], shapes[6]['y1']) == (3, 4, 5, 7)
+    # One vertical line between the two columns, two horizontal lines between the three rows.
+    assert shapes[1]['path'] == "M1,0V3M0,1H2M0,2H2"
+    assert len(create_grid_shapes(3, 2, 1, quadrant='Q2')) == 2
+
+
+def test_editing_returned_shapes_leaves_the_memoized_ones_intact():
+    shapes = create_grid_shapes(4, 4, 1, quadrant='Q1')
+    shapes[0]['fillcolor'] = 'red'
+    shapes[0]['line']['width'] = 10
+    shapes.append({'type': 'line'})
+
+    fresh = create_grid_shapes(4, 4, 1, quadrant='Q1')
+    assert len(fresh) == 2
+    assert fresh[0]['fillcolor'] == '#8B4513'
+    assert fresh[0]['line']['width'] == 3
+
+
+def test_clear_render_caches_forces_a_fresh_build():
+    create_grid_shapes(5, 5, 1)
+    assert _grid_shapes.cache_info().currsize > 0
+    clear_render_caches()
+    assert _grid_shapes.cache_info().currsize == 0
+
+
+def test_large_selections_are_binned_per_cell_without_losing_defects():
+    parsed, _ = process_defect_table(generate_lot(3000, seed=2, include_quadrant=True))
+    projected = project_layout(parsed, 7, 7, 1)
+
+    points = create_defect_traces(projected, max_points=len(projected))
+    assert sum(len(trace.x) for trace in points) == len(projected)
+    assert {trace.name for trace in points} == set(projected['DEFECT_TYPE'].astype(str))
+
+    binned = create_defect_traces(projected, max_points=100)
+    assert sum(int(np.sum(trace.text)) for trace in binned) == len(projected)
+    cells = projected.groupby(['DEFECT_TYPE', 'PLOT_X', 'PLOT_Y'], observed=True).ngroups
+    assert sum(len(trace.x) for trace in binned) == cells
@@ -0,0 +1,69 @@
+# tests/test_registry.py
+
+import os
+
+import pandas as pd
+
+from src.registry import DatasetRegistry
+
+
+def _lot(rows):
+    df = pd.DataFrame({'UNIT_INDEX_X': range(rows), 'UNIT_INDEX_Y': range(rows)})
+    return {'df': df, 'diagnostics': {'rows': rows}}
+
+
+def _registry(spill_dir, max_bytes=1000, **kwargs):
+    # Entries are sized by row count, so budgets read as "rows in memory".
+    return DatasetRegistry(max_entries=8, max_bytes=max_bytes, sizeof=lambda entry: len(entry['df']),
+                           restore=lambda df, diagnostics: {'df': df, 'diagnostics': diagnostics},
+                           spill_dir=str(spill_dir), **kwargs)
+
+
+def test_a_lot_over_the_whole_budget_stays_in_memory_until_the_next_put(tmp_path, caplog):
+    registry = _registry(tmp_path, max_bytes=10)
+    huge = _lot(50)
+    registry.put('huge', huge)
+    assert registry.get('huge') is huge
+    assert registry.spills == 0 and registry.reloads == 0
+    assert 'memory budget' in caplog.text
+
+    registry.put('small', _lot(5))
+    assert 'huge' not in registry
+    assert registry.spills == 1
+
+
+def test_evicted_lots_are_spilled_and_reloaded_intact(tmp_path):
+    registry = _registry(tmp_path, max_bytes=100)
+    first = _lot(60)
+    registry.put('first', first)
+    registry.put('second', _lot(60))          # pushes 'first' out of memory
+    assert 'first' not in registry
+    assert registry.spill_usage()[0] == 1
+
+    reloaded = registry.get('first')
+    assert reloaded is not first
+    pd.testing.assert_frame_equal(reloaded['df'], first['df'])
+    assert reloaded['diagnostics'] == {'rows': 60}
+    assert registry.stats()['reloads'] == 1
+    assert registry.get('never-seen') is None
+
+
+def test_a_corrupt_spill_file_is_a_miss(tmp_path):
+    registry = _registry(tmp_path, max_bytes=100)
+    registry.put('first', _lot(60))
+    registry.put('second', _lot(60))
+    (tmp_path / 'first.feather').write_bytes(b'not feather')
+    assert registry.get('first') is None
+
+
+def test_the_spill_directory_is_pruned_oldest_first(tmp_path):
+    registry = _registry(tmp_path, max_bytes=10)
+    registry.put('a', _lot(20))
+    registry.put('b', _lot(20))               # spills 'a'
+    _, one_lot = registry.spill_usage()
+    registry.spill_max_bytes = one_lot * 3 // 2
+    os.utime(tmp_path / 'a.feather', (1, 1))
+
+    registry.put('c', _lot(20))               # spills 'b'; only one lot fits on disk
+    assert registry.spills == 2
+    assert sorted(os.listdir(tmp_path)) == ['b.feather', 'b.json']
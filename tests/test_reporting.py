@@ -0,0 +1,80 @@
+# tests/test_reporting.py
+
+import io
+import os
+
+import openpyxl
+import pytest
+
+from src import reporting
+from src.clusters import find_defect_clusters
+from src.pipeline import process_defect_table
+from src.reporting import generate_excel_report, write_report_file
+from src.synthetic import generate_lot
+
+PANEL_ROWS, PANEL_COLS = 7, 7
+
+
+@pytest.fixture(scope='module')
+def lot():
+    df, _ = process_defect_table(generate_lot(1000, PANEL_ROWS, PANEL_COLS, seed=9, include_quadrant=True))
+    return df
+
+
+def _sheet_rows(workbook, name):
+    return [row for row in workbook[name].iter_rows(values_only=True)]
+
+
+def test_summary_and_top_defect_sheets_match_the_rows(lot):
+    workbook = openpyxl.load_workbook(io.BytesIO(generate_excel_report(lot, PANEL_ROWS, PANEL_COLS)))
+    assert workbook.sheetnames == ['Quarterly Summary', 'Q1 Top Defects', 'Q2 Top Defects',
+                                   'Q3 Top Defects', 'Q4 Top Defects', 'Full Defect List']
+
+    summary = _sheet_rows(workbook, 'Quarterly Summary')
+    for quad, total, density in summary[1:5]:
+        assert total == int((lot['QUADRANT'] == quad).sum())
+        assert density == pytest.approx(total / (PANEL_ROWS * PANEL_COLS))
+    assert summary[5][:2] == ('Total', len(lot))
+
+    q2 = lot[lot['QUADRANT'] == 'Q2']['DEFECT_TYPE'].astype(str).value_counts()
+    offenders = _sheet_rows(workbook, 'Q2 Top Defects')[1:]
+    assert {defect: count for defect, count, _ in offenders} == q2.to_dict()
+    assert [count for _, count, _ in offenders] == sorted(q2.tolist(), reverse=True)
+
+
+def test_defect_list_is_streamed_across_chunk_and_sheet_boundaries(lot, monkeypatch):
+    monkeypatch.setattr(reporting, '_STREAM_CHUNK_ROWS', 7)
+    monkeypatch.setattr(reporting, '_MAX_DATA_ROWS_PER_SHEET', 400)
+    workbook = openpyxl.load_workbook(io.BytesIO(generate_excel_report(lot, PANEL_ROWS, PANEL_COLS)))
+    sheets = ['Full Defect List', 'Full Defect List (2)', 'Full Defect List (3)']
+    assert workbook.sheetnames[-3:] == sheets
+
+    rows = []
+    for name in sheets:
+        sheet_rows = _sheet_rows(workbook, name)
+        assert sheet_rows[0] == ('UNIT_INDEX_X', 'UNIT_INDEX_Y', 'DEFECT_TYPE', 'QUADRANT')
+        rows.extend(sheet_rows[1:])
+    expected = lot[['UNIT_INDEX_X', 'UNIT_INDEX_Y', 'DEFECT_TYPE', 'QUADRANT']].astype(object)
+    assert rows == [tuple(row) for row in expected.itertuples(index=False, name=None)]
+
+
+def test_spilled_and_file_reports_hold_the_same_data(lot, tmp_path, monkeypatch):
+    in_memory = generate_excel_report(lot, PANEL_ROWS, PANEL_COLS)
+    monkeypatch.setattr(reporting, 'REPORT_SPILL_ROWS', 10)
+    spilled = generate_excel_report(lot, PANEL_ROWS, PANEL_COLS)
+    path = tmp_path / 'report.xlsx'
+    write_report_file(str(path), lot, PANEL_ROWS, PANEL_COLS)
+    assert os.listdir(tmp_path) == ['report.xlsx']
+
+    books = [openpyxl.load_workbook(source) for source in (io.BytesIO(in_memory), io.BytesIO(spilled), str(path))]
+    for name in books[0].sheetnames:
+        assert _sheet_rows(books[1], name) == _sheet_rows(books[0], name)
+        assert _sheet_rows(books[2], name) == _sheet_rows(books[0], name)
+
+
+def test_clusters_sheet_lists_each_cluster(lot):
+    clusters = find_defect_clusters(lot, PANEL_ROWS, PANEL_COLS, min_defects=5)
+    workbook = openpyxl.load_workbook(io.BytesIO(generate_excel_report(lot, PANEL_ROWS, PANEL_COLS, clusters=clusters)))
+    rows = _sheet_rows(workbook, 'Clusters')
+    assert rows[0][:3] == ('Cluster', 'Defects', 'Cells')
+    assert [row[1] for row in rows[1:]] == clusters.table['DEFECTS'].tolist()
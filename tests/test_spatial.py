@@ -0,0 +1,60 @@
+# tests/test_spatial.py
+
+import numpy as np
+import pytest
+
+from src.pipeline import plot_to_unit, process_defect_table, project_layout
+from src.spatial import CellIndex
+from src.synthetic import generate_lot
+
+PANEL_ROWS, PANEL_COLS, GAP_SIZE = 6, 8, 1
+
+
+@pytest.fixture(scope='module')
+def projected():
+    parsed, _ = process_defect_table(generate_lot(4000, PANEL_ROWS, PANEL_COLS, GAP_SIZE, seed=21))
+    return project_layout(parsed, PANEL_ROWS, PANEL_COLS, GAP_SIZE)
+
+
+@pytest.fixture(scope='module')
+def index(projected):
+    return CellIndex(projected, PANEL_ROWS, PANEL_COLS, GAP_SIZE)
+
+
+def test_every_row_is_indexed_once(projected, index):
+    assert np.array_equal(np.sort(index.rows), np.arange(len(projected)))
+    assert index.offsets[-1] == len(projected)
+
+
+def test_box_selection_matches_a_scan_of_the_frame(projected, index):
+    box = {'x': [10.2, 3.1], 'y': [2.0, 9.7]}
+    rows = index.rows_for_selection({'box': [box]})
+    x, y = projected['PLOT_X'].to_numpy(), projected['PLOT_Y'].to_numpy()
+    expected = np.flatnonzero((x >= 3.1) & (x <= 10.2) & (y >= 2.0) & (y <= 9.7))
+    assert rows.tolist() == expected.tolist()
+
+
+def test_lasso_selection_matches_a_scan_of_the_frame(projected, index):
+    # A right triangle with its legs on x=0 and y=0 and its hypotenuse on x + y = 12.25,
+    # which no cell centre lies on.
+    rows = index.rows_for_selection({'lasso': [{'x': [0, 12.25, 0], 'y': [0, 0, 12.25]}]})
+    x, y = projected['PLOT_X'].to_numpy(), projected['PLOT_Y'].to_numpy()
+    expected = np.flatnonzero(x + y < 12.25)
+    assert rows.tolist() == expected.tolist()
+
+
+def test_clicked_points_select_every_defect_in_their_cell(projected, index):
+    first = projected.iloc[0]
+    rows = index.rows_for_selection({'points': [{'x': first['PLOT_X'], 'y': first['PLOT_Y']},
+                                                {'x': -5.0, 'y': -5.0}]})
+    same_cell = ((projected['PLOT_X'] == first['PLOT_X']) & (projected['PLOT_Y'] == first['PLOT_Y'])).to_numpy()
+    assert rows.tolist() == np.flatnonzero(same_cell).tolist()
+
+    quadrant, unit_x, unit_y = plot_to_unit(first['PLOT_X'], first['PLOT_Y'], PANEL_ROWS, PANEL_COLS, GAP_SIZE)
+    assert (quadrant, unit_x, unit_y) == (first['QUADRANT'], first['UNIT_INDEX_X'], first['UNIT_INDEX_Y'])
+    assert plot_to_unit(PANEL_COLS + 0.5, 0.5, PANEL_ROWS, PANEL_COLS, GAP_SIZE) is None   # in the gap
+
+
+def test_an_empty_selection_selects_nothing(index):
+    assert index.rows_for_selection({}).size == 0
+    assert index.rows_for_selection({'box': [{'x': [100, 200], 'y': [100, 200]}]}).size == 0